@@ -7,6 +7,7 @@ import inspect
 import time
 import pprint
 import copy
+import numpy
 
 class LEF:
 	def __init__(self, metal_stack_lef_fname, std_cell_lef_name):
@@ -274,6 +275,38 @@ class LEF:
 			layer.debug_print_attrs()
 		return
 
+# Dense lookup table of the logical layer numbers (see LEF.get_layer_num())
+# of all GDSII layer numbers and data types, built once from the layer map
+# and LEF, so layer adjacency tests are integer subtractions.
+# table = (max gds layer num + 1) x (max gds data type + 2) array of logical
+#         layer numbers (-1 for non-ROUTING or unmapped layers); the last
+#         column holds the layer of data types missing from the layer map
+class Layer_Num_Table:
+	def __init__(self, lef, layer_map):
+		max_gds_layer_num = max(layer_map.keys()) if layer_map else 0
+		max_gds_data_type = max([max(data_types.keys()) for data_types in layer_map.values()]) if layer_map else 0
+		self.table = numpy.full((max_gds_layer_num + 1, max_gds_data_type + 2), -1, dtype=numpy.int32)
+		for gds_layer_num in layer_map.keys():
+			for gds_data_type in range(max_gds_data_type + 2):
+				self.table[gds_layer_num, gds_data_type] = lef.get_layer_num(gds_layer_num, gds_data_type, layer_map)
+
+	# Returns the logical layer number of a GDSII
+	# layer number and data type (-1 if none).
+	def get_layer_num(self, gds_layer_num, gds_data_type):
+		if gds_layer_num < 0 or gds_layer_num >= self.table.shape[0]:
+			return -1
+		return int(self.table[gds_layer_num, min(gds_data_type, self.table.shape[1] - 1)])
+
+	# Returns the logical layer offset of a GDSII layer number and
+	# data type relative to a (reference) logical layer number, e.g.
+	# 1 if the layer is directly above, -1 if directly below, or None
+	# if the layer is not a ROUTING layer.
+	def get_layer_offset(self, ref_layer_num, gds_layer_num, gds_data_type):
+		layer_num = self.get_layer_num(gds_layer_num, gds_data_type)
+		if layer_num == -1:
+			return None
+		return layer_num - ref_layer_num
+
 class Routing_Layer:
 	def __init__(self, name, num, direction, pitch, offset, min_width, max_width, width, spacing, db_units, area):
 		self.name        = name
@@ -0,0 +1,129 @@
+# Import Custom Modules
+from transform import *
+
+# Other Imports
+import math
+import numpy
+
+# Lattice of the array positions of a GDSII ARef element. The instance
+# at array position (row, col) is the referenced structure transformed
+# by the ARef's transform (reflection, magnification and rotation), and
+# then translated by (col * col vector) + (row * row vector), where the
+# col/row vectors are the lattice vectors of the ARef (in the frame of
+# the structure containing the ARef, so they are neither magnified nor
+# reflected by the ARef's transform). The lattice is used to expand the
+# array (all positions at once, see PolygonArrays.tiled()), and to find
+# the array positions overlapping a region without expanding the array.
+class ARefLattice():
+	def __init__(self, aref, struct_bbox=None, transform=None):
+		self.rows         = aref.rows
+		self.cols         = aref.cols
+		self.col_vector   = (numpy.array(aref.xy[1], dtype=numpy.float64) - aref.xy[0]) / aref.cols
+		self.row_vector   = (numpy.array(aref.xy[2], dtype=numpy.float64) - aref.xy[0]) / aref.rows
+		self.transform    = compose_transforms(transform, compute_element_transform(aref)) # transform of the instance at (0, 0)
+		self.outer_linear = transform[:, :2] if transform is not None else IDENTITY_TRANSFORM[:, :2]
+		self.struct_bbox  = struct_bbox # (LL x, LL y, UR x, UR y) of the referenced structure (own frame), or None if empty
+
+	def get_num_positions(self):
+		return self.rows * self.cols
+
+	# Returns a (num positions x 2) array of the offsets (in the frame of
+	# the structure containing the ARef) of the array positions from the
+	# first one, for the provided (row, col) array positions (all array
+	# positions, in row-major order, if None).
+	def get_position_offsets(self, positions=None):
+		if positions is None:
+			col_indices, row_indices = numpy.meshgrid(numpy.arange(self.cols), numpy.arange(self.rows))
+			positions = numpy.column_stack((row_indices.ravel(), col_indices.ravel()))
+		positions = numpy.array(positions, dtype=numpy.float64).reshape((-1, 2))
+		return numpy.outer(positions[:, 1], self.col_vector) + numpy.outer(positions[:, 0], self.row_vector)
+
+	# Returns a (num positions x 2) array of the translations (after the
+	# transform of the instance at (0, 0)) of the provided array positions
+	# (all array positions, in row-major order, if None).
+	def get_position_shifts(self, positions=None):
+		return self.get_position_offsets(positions).dot(self.outer_linear.T)
+
+	# Returns the transform of the instance at an array position.
+	def get_position_transform(self, row, col):
+		position_transform        = self.transform.copy()
+		position_transform[:, 2] += self.get_position_shifts([(row, col)])[0]
+		return position_transform
+
+	# Returns a (num positions x 4) array of the LL x, LL y, UR x, UR y
+	# of the instances at the provided (row, col) array positions.
+	def compute_position_bboxes(self, positions):
+		first_bbox = transform_bboxes(self.transform, numpy.array([self.struct_bbox]))
+		return first_bbox + numpy.tile(self.get_position_shifts(positions), 2)
+
+	# Returns the (LL x, LL y, UR x, UR y) bounding box of all array
+	# positions, or None if the referenced structure is empty.
+	def compute_bbox(self):
+		if self.struct_bbox == None:
+			return None
+		# Array positions are translations, so the extremes of the
+		# lattice are at its corners
+		corners = [(0, 0), (0, self.cols - 1), (self.rows - 1, 0), (self.rows - 1, self.cols - 1)]
+		bboxes  = self.compute_position_bboxes(corners)
+		return (bboxes[:, 0].min(), bboxes[:, 1].min(), bboxes[:, 2].max(), bboxes[:, 3].max())
+
+	# Returns the (sorted) list of (row, col) array positions whose
+	# instance bounding box overlaps the provided bounding box.
+	def query(self, bbox):
+		if self.struct_bbox == None:
+			return []
+
+		# The instance at (row, col) is the instance at (0, 0) translated
+		# by col * col_vector + row * row_vector (the lattice vectors, in
+		# the transformed frame), so it overlaps the query if the
+		# translation lies within the window [shift_lo, shift_hi]
+		first_bbox = transform_bboxes(self.transform, numpy.array([self.struct_bbox]))[0]
+		shift_lo   = numpy.array([bbox.ll.x - first_bbox[2], bbox.ll.y - first_bbox[3]])
+		shift_hi   = numpy.array([bbox.ur.x - first_bbox[0], bbox.ur.y - first_bbox[1]])
+		col_vector = self.outer_linear.dot(self.col_vector)
+		row_vector = self.outer_linear.dot(self.row_vector)
+		lattice    = numpy.column_stack((col_vector, row_vector))
+		if numpy.linalg.det(lattice) != 0:
+			# (col, row) coordinates of the window corners
+			window  = numpy.array([[shift_lo[0], shift_lo[1]], [shift_hi[0], shift_lo[1]], [shift_hi[0], shift_hi[1]], [shift_lo[0], shift_hi[1]]])
+			corners = numpy.linalg.solve(lattice, window.T).T
+			col_range = self.get_index_range(corners[:, 0].min(), corners[:, 0].max(), self.cols)
+			row_range = self.get_index_range(corners[:, 1].min(), corners[:, 1].max(), self.rows)
+		elif not col_vector.any() or not row_vector.any():
+			# Array positions along (at most) one axis are distinct
+			col_range = self.get_index_range(*(self.get_factor_range(col_vector, shift_lo, shift_hi) + (self.cols,)))
+			row_range = self.get_index_range(*(self.get_factor_range(row_vector, shift_lo, shift_hi) + (self.rows,)))
+		else:
+			# Collinear lattice vectors: all array positions are candidates
+			col_range = range(self.cols)
+			row_range = range(self.rows)
+
+		# Check candidate positions for actual bounding box overlap
+		positions = [(row, col) for row in row_range for col in col_range]
+		if not positions:
+			return []
+		overlaps = bboxes_overlap(self.compute_position_bboxes(positions), (bbox.ll.x, bbox.ll.y, bbox.ur.x, bbox.ur.y))
+		return [position for position, overlap in zip(positions, overlaps.tolist()) if overlap]
+
+	# Returns the (lo, hi) range of factors t for which t * vector lies
+	# within the window [shift_lo, shift_hi]. A zero vector (all positions
+	# along the axis coincide) places no constraint on the factor.
+	def get_factor_range(self, vector, shift_lo, shift_hi):
+		lo = -float('inf')
+		hi = float('inf')
+		for axis in range(2):
+			if vector[axis] != 0:
+				bounds = sorted((shift_lo[axis] / vector[axis], shift_hi[axis] / vector[axis]))
+				lo     = max(lo, bounds[0])
+				hi     = min(hi, bounds[1])
+		return (lo, hi)
+
+	# Returns the range of array indices (along one lattice axis)
+	# within [lo, hi], with one extra index on either side for
+	# rounding errors (candidates are checked exactly).
+	def get_index_range(self, lo, hi, count):
+		if lo > hi:
+			return []
+		first = int(math.floor(max(lo, -1))) - 1
+		last  = int(math.ceil(min(hi, count))) + 1
+		return range(max(first, 0), min(last, count - 1) + 1)
@@ -0,0 +1,170 @@
+# Import GDSII Library
+from gdsii.elements import *
+
+# Import Custom Modules
+from polygon        import *
+from polygon_arrays import *
+from transform      import *
+from aref_lattice   import *
+from region_query   import *
+
+# Other Imports
+import math
+import numpy
+
+# Max. number of pixels of a (cell) occupancy tile. Instances of larger
+# structures are not stamped, but descended into.
+STAMP_MAX_TILE_PIXELS = 1 << 20
+
+# Returns the (a, b, c, d) coefficients of the linear part of a transform
+# if it is one of the 8 orientations of a GDSII reference without
+# magnification (reflection about the X axis, and rotations by multiples
+# of 90 degrees) with an integer offset, or None otherwise.
+def get_stamp_orientation(transform):
+	if not is_axis_aligned_transform(transform) or not is_integral_transform(transform):
+		return None
+	if abs((transform[0, 0] * transform[1, 1]) - (transform[0, 1] * transform[1, 0])) != 1:
+		return None
+	return (int(transform[0, 0]), int(transform[0, 1]), int(transform[1, 0]), int(transform[1, 1]))
+
+# Occupancy tile of a GDSII structure on a set of layers, in one
+# orientation: bit (row, col) is set if the pixel center
+# (origin x + col + 0.5, origin y + row + 0.5) is inside any (flattened)
+# polygon of the structure, in the frame of the orientation.
+class OccupancyTile():
+	def __init__(self, origin_x, origin_y, bitmap):
+		self.origin_x = origin_x
+		self.origin_y = origin_y
+		self.bitmap   = bitmap
+
+# Stamps the occupancy of GDSII structures (cells) into bitmaps. The
+# bitmap of a cell is rasterized once per set of layers and orientation
+# (see get_stamp_orientation()), and then OR-ed into the bitmap at every
+# instance of the cell, i.e. standard cells repeated all over the layout
+# are only rasterized once. The GDSII hierarchy is walked top-down (see
+# RegionQuery), only into instances overlapping the bitmap. Polygons of
+# structures that cannot be stamped (e.g. too large, or instanced with
+# magnification or other rotations) are rasterized directly. Pixels
+# are colored by the provided function, color_bitmap(bitmap, offset,
+# poly), that colors the bitmap pixels (with the LL pixel at offset)
+# whose center is inside the polygon.
+class CellStamper():
+	def __init__(self, region_query, color_bitmap):
+		self.region_query      = region_query
+		self.color_bitmap      = color_bitmap
+		self.tiles             = {} # Key<(structure name, layer keys, orientation)> --> Value<OccupancyTile object, or None if not stampable>
+		self.reset_stats()
+
+	# Tiles (and the GDSII hierarchy) are not pickled (e.g. when a
+	# stamper of a worker process is sent back), only the stats.
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['region_query'] = None
+		state['tiles']        = {}
+		return state
+
+	# Adds the stats of another stamper (e.g. of
+	# a worker process) to the stats of this stamper.
+	def merge_stats(self, other):
+		self.num_tiles             += other.num_tiles
+		self.num_tiles_unstampable += other.num_tiles_unstampable
+		self.num_stamps            += other.num_stamps
+		self.num_polys_colored     += other.num_polys_colored
+
+	def reset_stats(self):
+		self.num_tiles             = 0
+		self.num_tiles_unstampable = 0
+		self.num_stamps            = 0
+		self.num_polys_colored     = 0
+
+	# Colors all pixels of the bitmap (with the LL pixel at the integer
+	# offset) inside any polygon, on one of the (gds layer num, gds data
+	# type) layer keys, of the (flattened) structure.
+	def stamp_structure(self, bitmap, offset, struct_name, layer_keys, transform=None):
+		summary = self.region_query.get_structure_summary(struct_name)
+		if summary.bbox == None or summary.layer_keys.isdisjoint(layer_keys):
+			return
+		region = (offset.x, offset.y, offset.x + bitmap.shape[1], offset.y + bitmap.shape[0])
+
+		# Leaf polygons overlapping the bitmap are colored directly
+		poly_indices = [poly_index for poly_index in numpy.nonzero(bboxes_overlap(transform_bboxes(transform, summary.leaf_bboxes), region))[0].tolist() if (summary.leaf_polys.elements[poly_index].layer, summary.leaf_polys.elements[poly_index].data_type) in layer_keys]
+		if poly_indices:
+			for poly in summary.leaf_polys.select(poly_indices).transformed(transform).to_polygons():
+				self.color_polygon(bitmap, offset, poly)
+
+		# Instances overlapping the bitmap are stamped
+		bbox = BBox(Point(region[0], region[1]), Point(region[2], region[3]))
+		for ref_index in numpy.nonzero(bboxes_overlap(transform_bboxes(transform, summary.ref_bboxes), region))[0].tolist():
+			element = summary.refs[ref_index]
+			if isinstance(element, ARef):
+				lattice = ARefLattice(element, self.region_query.get_structure_summary(element.struct_name).bbox, transform)
+				for row, col in lattice.query(bbox):
+					self.stamp_instance(bitmap, offset, element.struct_name, layer_keys, lattice.get_position_transform(row, col))
+			else:
+				self.stamp_instance(bitmap, offset, element.struct_name, layer_keys, compose_transforms(transform, compute_element_transform(element)))
+
+	# Stamps the occupancy tile of a structure instance (with the provided
+	# transform) into the bitmap, or descends into the instance if it
+	# cannot be stamped.
+	def stamp_instance(self, bitmap, offset, struct_name, layer_keys, transform):
+		summary = self.region_query.get_structure_summary(struct_name)
+		if summary.bbox == None or summary.layer_keys.isdisjoint(layer_keys):
+			return
+		orientation = get_stamp_orientation(transform)
+		tile        = None
+		if orientation != None:
+			tile = self.get_tile(struct_name, layer_keys, orientation)
+		if tile == None:
+			self.stamp_structure(bitmap, offset, struct_name, layer_keys, transform)
+			return
+
+		# Tile rows/cols overlapping the bitmap
+		col_shift = int(tile.origin_x + transform[0, 2]) - offset.x
+		row_shift = int(tile.origin_y + transform[1, 2]) - offset.y
+		col_start = max(0, -col_shift)
+		col_end   = min(tile.bitmap.shape[1], bitmap.shape[1] - col_shift)
+		row_start = max(0, -row_shift)
+		row_end   = min(tile.bitmap.shape[0], bitmap.shape[0] - row_shift)
+		if col_start < col_end and row_start < row_end:
+			bitmap[row_start + row_shift:row_end + row_shift, col_start + col_shift:col_end + col_shift] |= tile.bitmap[row_start:row_end, col_start:col_end]
+			self.num_stamps += 1
+
+	# Returns the (cached) occupancy tile of a structure on the layer
+	# keys in an orientation, or None if the tile would be too large.
+	def get_tile(self, struct_name, layer_keys, orientation):
+		tile_key = (struct_name, layer_keys, orientation)
+		if tile_key not in self.tiles:
+			summary    = self.region_query.get_structure_summary(struct_name)
+			a, b, c, d = orientation
+			transform  = numpy.array([[a, b, 0], [c, d, 0]], dtype=numpy.float64)
+			ll_x, ll_y, ur_x, ur_y = transform_bboxes(transform, numpy.array([summary.bbox]))[0].tolist()
+			origin_x   = int(math.floor(ll_x))
+			origin_y   = int(math.floor(ll_y))
+			num_cols   = int(math.ceil(ur_x)) - origin_x
+			num_rows   = int(math.ceil(ur_y)) - origin_y
+			tile       = None
+			if num_rows * num_cols <= STAMP_MAX_TILE_PIXELS:
+				tile = OccupancyTile(origin_x, origin_y, numpy.zeros(shape=(num_rows, num_cols), dtype=bool))
+				self.stamp_structure(tile.bitmap, Point(origin_x, origin_y), struct_name, layer_keys, transform)
+				self.num_tiles += 1
+			else:
+				self.num_tiles_unstampable += 1
+			self.tiles[tile_key] = tile
+		return self.tiles[tile_key]
+
+	# Colors the pixels of the bitmap inside a polygon. Only the pixels
+	# within the polygon's bounding box are checked.
+	def color_polygon(self, bitmap, offset, poly):
+		col_start = max(0, int(math.floor(poly.bbox.ll.x)) - offset.x)
+		col_end   = min(bitmap.shape[1], int(math.ceil(poly.bbox.ur.x)) - offset.x)
+		row_start = max(0, int(math.floor(poly.bbox.ll.y)) - offset.y)
+		row_end   = min(bitmap.shape[0], int(math.ceil(poly.bbox.ur.y)) - offset.y)
+		if col_start < col_end and row_start < row_end:
+			self.color_bitmap(bitmap[row_start:row_end, col_start:col_end], Point(offset.x + col_start, offset.y + row_start), poly)
+			self.num_polys_colored += 1
+
+	def print_stats(self):
+		print "Cell Stamp Stats:"
+		print "	Occupancy Tiles:  %d (%d structures not stampable)" % (self.num_tiles, self.num_tiles_unstampable)
+		print "	Tiles Stamped:    %d" % (self.num_stamps)
+		print "	Polygons Colored: %d" % (self.num_polys_colored)
@@ -33,12 +33,10 @@ def is_path_type_supported(path):
 
 # Returns True if the SRef type is currently supported by 
 # this tool. Else, script exits with error code 3.
-# @TODO: Handle SRef magnitude and any angle transformations.
+# Any reflection, rotation angle, and (positive) magnification is
+# supported, but not absolute magnifications or rotation angles.
 def is_sref_type_supported(sref, structure):
-	supported_strans = [ None, 0, REFLECTION_ABOUT_X_AXIS ]
-	supported_angles = [ None, 0, 90, 180, 270 ]
-	supported_mags   = [ None ]
-	if sref.strans in supported_strans and sref.angle in supported_angles and sref.mag in supported_mags:
+	if is_strans_supported(sref.strans) and (sref.mag == None or sref.mag > 0):
 		return True
 	else:
 		dbg.debug_print_sref_obj(sref)
@@ -48,15 +46,21 @@ def is_sref_type_supported(sref, structure):
 
 # Returns True if the ARef type is currently supported by 
 # this tool. Else, script exits with error code 3.
-# @TODO: Handle ARef magnitude and any angle transformations.
+# Any reflection, rotation angle, and (positive) magnification is
+# supported, but not absolute magnifications or rotation angles. The
+# transformation applies to each array instance only; the lattice
+# vectors (XY) are in the frame of the containing structure, so they
+# are neither magnified nor reflected (see aref_lattice.py).
 def is_aref_type_supported(aref, structure):
-	supported_strans = [ None, 0, REFLECTION_ABOUT_X_AXIS ]
-	supported_angles = [ None, 0, 90, 180, 270 ]
-	supported_mags   = [ None ]
-	if aref.strans in supported_strans and aref.angle in supported_angles and aref.mag in supported_mags:
+	if is_strans_supported(aref.strans) and (aref.mag == None or aref.mag > 0) and aref.cols > 0 and aref.rows > 0:
 		return True
 	else:
 		dbg.debug_print_aref_obj(aref)
 		# dbg.debug_print_gdsii_structure_and_elements(structure)
-		print "UNSUPPORTED %s: transformations of SRef object not supported." % (inspect.stack()[1][3])
+		print "UNSUPPORTED %s: transformations (or array size) of ARef object not supported." % (inspect.stack()[1][3])
 		sys.exit(3)
+
+# Returns True if the STRANS flags of a reference are supported,
+# i.e. only the reflection flag (if any) is set.
+def is_strans_supported(strans):
+	return strans == None or (strans & ~REFLECTION_ABOUT_X_AXIS) == 0
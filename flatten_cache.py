@@ -0,0 +1,95 @@
+# Other Imports
+import collections
+
+# Default maximum number of polygon vertices held by the cache
+DEFAULT_FLATTEN_CACHE_SIZE = 1000000
+
+# LRU cache of flattened GDSII structures. Each entry holds the polygons
+# (packed polygon arrays, see polygon_arrays.py) of a single structure in
+# the structure's own coordinate frame, i.e. with all sub-references of
+# the structure flattened, but without the transform of any instance
+# referencing the structure applied. The memory used by the cache is
+# bounded by the total number of polygon vertices it holds.
+class FlattenCache():
+	def __init__(self, max_vertices=DEFAULT_FLATTEN_CACHE_SIZE):
+		self.max_vertices = max_vertices
+		self.num_vertices = 0
+		self.hits         = 0
+		self.misses       = 0
+		self.evictions    = 0
+		self.entries      = collections.OrderedDict() # Key<structure name> --> Value<(polygons, num. vertices)>
+
+	def __contains__(self, struct_name):
+		return struct_name in self.entries
+
+	def __len__(self):
+		return len(self.entries)
+
+	# Returns the polygon arrays of the structure (in the
+	# structure's coordinate frame), or None if not cached.
+	# Cached polygons must NOT be modified by the caller.
+	def get(self, struct_name):
+		if struct_name in self.entries:
+			# Move entry to the most recently used position
+			entry = self.entries.pop(struct_name)
+			self.entries[struct_name] = entry
+			self.hits += 1
+			return entry[0]
+		self.misses += 1
+		return None
+
+	# Adds the polygons of a structure to the cache, evicting the
+	# least recently used structures until the new entry fits.
+	# Structures larger than the whole cache are not cached.
+	def put(self, struct_name, polys):
+		num_vertices = polys.get_num_vertices()
+		if num_vertices > self.max_vertices or struct_name in self.entries:
+			return
+
+		# Evict least recently used entries
+		while self.entries and (self.num_vertices + num_vertices) > self.max_vertices:
+			evicted_name, evicted_entry = self.entries.popitem(last=False)
+			self.num_vertices -= evicted_entry[1]
+			self.evictions    += 1
+
+		self.entries[struct_name] = (polys, num_vertices)
+		self.num_vertices        += num_vertices
+
+	# Cached polygons are not pickled (e.g. when the layout is sent
+	# to worker processes), only the cache configuration and stats.
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['entries']      = collections.OrderedDict()
+		state['num_vertices'] = 0
+		return state
+
+	# Adds the hit/miss/eviction counts of another cache (e.g.
+	# of a worker process) to the stats of this cache.
+	def merge_stats(self, other):
+		self.hits      += other.hits
+		self.misses    += other.misses
+		self.evictions += other.evictions
+
+	def reset_stats(self):
+		self.hits      = 0
+		self.misses    = 0
+		self.evictions = 0
+
+	def is_enabled(self):
+		return self.max_vertices > 0
+
+	def clear(self):
+		self.entries.clear()
+		self.num_vertices = 0
+
+	def get_hit_rate(self):
+		if (self.hits + self.misses) == 0:
+			return 0.0
+		return (float(self.hits) / float(self.hits + self.misses)) * 100.0
+
+	def print_stats(self):
+		print "Flatten Cache Stats:"
+		print "	Structures Cached:  %d"    % (len(self.entries))
+		print "	Vertices Cached:    %d / %d" % (self.num_vertices, self.max_vertices)
+		print "	Hits / Misses:      %d / %d (%.2f%% hit rate)" % (self.hits, self.misses, self.get_hit_rate())
+		print "	Evictions:          %d"    % (self.evictions)
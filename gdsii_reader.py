@@ -0,0 +1,512 @@
+# Import GDSII Library
+from gdsii.library   import Library
+from gdsii.structure import Structure
+from gdsii.elements  import *
+
+# Other Imports
+import sys
+import inspect
+import struct
+import mmap
+import math
+import datetime
+import os
+
+# Possible ERROR Codes:
+# 1 = Error loading input load_files
+# 2 = Unknown GDSII object attributes/attribute types
+# 3 = Unhandled feature
+# 4 = Usage Error
+
+# GDSII Record Types
+HEADER       = 0x00
+BGNLIB       = 0x01
+LIBNAME      = 0x02
+UNITS        = 0x03
+ENDLIB       = 0x04
+BGNSTR       = 0x05
+STRNAME      = 0x06
+ENDSTR       = 0x07
+BOUNDARY     = 0x08
+PATH         = 0x09
+SREF         = 0x0A
+AREF         = 0x0B
+TEXT         = 0x0C
+LAYER        = 0x0D
+DATATYPE     = 0x0E
+WIDTH        = 0x0F
+XY           = 0x10
+ENDEL        = 0x11
+SNAME        = 0x12
+COLROW       = 0x13
+NODE         = 0x15
+STRANS       = 0x1A
+MAG          = 0x1B
+ANGLE        = 0x1C
+PATHTYPE     = 0x21
+ELFLAGS      = 0x26
+PLEX         = 0x2F
+PROPATTR     = 0x2B
+PROPVALUE    = 0x2C
+BOX          = 0x2D
+BOXTYPE      = 0x2E
+BGNEXTN      = 0x30
+ENDEXTN      = 0x31
+STRCLASS     = 0x34
+
+# GDSII Record Data Types
+NODATA       = 0x00
+BITARRAY     = 0x01
+INT2         = 0x02
+INT4         = 0x03
+REAL4        = 0x04
+REAL8        = 0x05
+ASCII        = 0x06
+
+# Maps GDSII element record types to python-gdsii element classes.
+ELEMENT_TYPES = {
+	BOUNDARY: Boundary,
+	PATH:     Path,
+	SREF:     SRef,
+	AREF:     ARef,
+	BOX:      Box,
+}
+
+# Element records that are never needed by any metric, and are skipped
+# entirely (including their XY payloads).
+SKIPPED_ELEMENT_TYPES = [ TEXT, NODE ]
+
+# Maps (simple) GDSII element attribute record types to attribute names.
+ELEMENT_ATTRIBUTES = {
+	LAYER:    'layer',
+	DATATYPE: 'data_type',
+	BOXTYPE:  'box_type',
+	WIDTH:    'width',
+	PATHTYPE: 'path_type',
+	BGNEXTN:  'bgn_extn',
+	ENDEXTN:  'end_extn',
+	ELFLAGS:  'elflags',
+	PLEX:     'plex',
+	STRANS:   'strans',
+	MAG:      'mag',
+	ANGLE:    'angle',
+	SNAME:    'struct_name',
+}
+
+# Decodes a GDSII 8-byte real (excess-64, base-16 exponent) number.
+def decode_real8(data, offset=0):
+	word     = struct.unpack_from('>Q', data, offset)[0]
+	mantissa = word & 0x00ffffffffffffff
+	if mantissa == 0:
+		return 0.0
+	exponent = ((word >> 56) & 0x7f) - 64
+	value    = math.ldexp(mantissa, (4 * exponent) - 56)
+	if word >> 63:
+		return -value
+	return value
+
+# Decodes the 12 INT2 values of a BGNLIB/BGNSTR record
+# into (modification time, access time) datetime objects.
+def decode_timestamps(values):
+	try:
+		return (datetime.datetime(values[0] + 1900, *values[1:6]), datetime.datetime(values[6] + 1900, *values[7:12]))
+	except (ValueError, TypeError):
+		return (datetime.datetime.today(), datetime.datetime.today())
+
+# Header line of structure index files, followed by
+# the size and modification time of the GDSII file.
+STRUCTURE_INDEX_HEADER = 'GDS2-Score Structure Index v1'
+
+# Returns the filename of the structure index of a GDSII file.
+def get_structure_index_fname(gdsii_fname):
+	return gdsii_fname + '.sidx'
+
+# Loads the structure index persisted next to a GDSII file. Returns
+# None if there is no index, or if it is out of date. Returns a 
+# dictionary of the form: Key<structure name> --> Value<byte offset>
+def load_structure_offsets(gdsii_fname):
+	index_fname = get_structure_index_fname(gdsii_fname)
+	if not os.path.isfile(index_fname):
+		return None
+	gdsii_stats = os.stat(gdsii_fname)
+	offsets     = {}
+	with open(index_fname, 'rb') as stream:
+		header = stream.readline().rstrip('\n').split('\t')
+		if header != [STRUCTURE_INDEX_HEADER, str(gdsii_stats.st_size), repr(gdsii_stats.st_mtime)]:
+			return None
+		for line in stream:
+			struct_name, offset = line.rstrip('\n').rsplit('\t', 1)
+			offsets[struct_name] = int(offset)
+	stream.close()
+	return offsets
+
+# Persists a structure index next to a GDSII file.
+def save_structure_offsets(gdsii_fname, offsets):
+	index_fname = get_structure_index_fname(gdsii_fname)
+	gdsii_stats = os.stat(gdsii_fname)
+	try:
+		with open(index_fname, 'wb') as stream:
+			stream.write('%s\t%d\t%r\n' % (STRUCTURE_INDEX_HEADER, gdsii_stats.st_size, gdsii_stats.st_mtime))
+			for struct_name, offset in sorted(offsets.iteritems(), key=lambda item: item[1]):
+				stream.write('%s\t%d\n' % (struct_name, offset))
+		stream.close()
+	except IOError as e:
+		# e.g. input directory is read-only
+		print "WARNING %s: could not save structure index %s (%s)." % (inspect.stack()[0][3], index_fname, e.strerror)
+
+# Streaming, record-level GDSII reader. Reads records straight out of a
+# memory-mapped file (or sequentially from a non-mappable stream) and only
+# decodes the records needed to build the python-gdsii structures used by
+# the rest of GDS2-Score. Text and node elements, as well as elements on
+# layers rejected by an (optional) layer filter, are skipped without
+# decoding their XY payloads.
+class GDSIIReader():
+	def __init__(self, stream):
+		self.stream   = stream
+		self.buffer   = None
+		self.position = 0
+		self.size     = None
+		self.num_elements_skipped = 0
+		self.num_bytes_skipped    = 0
+
+		# Memory map input file (if possible)
+		try:
+			self.buffer = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+			self.size   = len(self.buffer)
+		except (AttributeError, ValueError, EnvironmentError):
+			self.buffer = None
+
+	def close(self):
+		if self.buffer != None:
+			self.buffer.close()
+			self.buffer = None
+
+	# Returns True if records can be read at random offsets.
+	def is_memory_mapped(self):
+		return self.buffer != None
+
+	# Moves the reader to a byte offset in the GDSII stream. Sequential
+	# streams (e.g. pipes) can only be "moved" to the current offset.
+	def seek(self, offset):
+		if self.buffer == None and offset != self.position:
+			self.stream.seek(offset)
+		self.position = offset
+
+	# Moves the reader back to the start of the GDSII stream.
+	def rewind(self):
+		self.seek(0)
+
+	# Returns the (record type, data type, payload length) of the next
+	# record. The payload must then be read, or skipped, by the caller.
+	def read_record_header(self):
+		if self.buffer != None:
+			if self.position + 4 > self.size:
+				print "ERROR %s: unexpected end of GDSII stream." % (inspect.stack()[0][3])
+				sys.exit(1)
+			length, record_type, data_type = struct.unpack_from('>HBB', self.buffer, self.position)
+			self.position += 4
+		else:
+			header = self.stream.read(4)
+			if len(header) < 4:
+				print "ERROR %s: unexpected end of GDSII stream." % (inspect.stack()[0][3])
+				sys.exit(1)
+			length, record_type, data_type = struct.unpack('>HBB', header)
+			self.position += 4
+		if length < 4:
+			print "ERROR %s: invalid GDSII record length (%d)." % (inspect.stack()[0][3], length)
+			sys.exit(1)
+		return record_type, data_type, length - 4
+
+	def read_payload(self, length):
+		if self.buffer != None:
+			payload = self.buffer[self.position : self.position + length]
+			self.position += length
+		else:
+			payload = self.stream.read(length)
+			self.position += len(payload)
+		if len(payload) != length:
+			print "ERROR %s: unexpected end of GDSII stream." % (inspect.stack()[0][3])
+			sys.exit(1)
+		return payload
+
+	def skip_payload(self, length):
+		self.num_bytes_skipped += length
+		self.position          += length
+		if self.buffer == None:
+			try:
+				self.stream.seek(length, 1)
+			except (AttributeError, IOError, ValueError):
+				# Stream is not seekable, e.g. a pipe
+				while length > 0:
+					length -= len(self.stream.read(min(length, 1 << 16)))
+
+	# Reads and decodes the payload of a record according to its data type.
+	def read_data(self, data_type, length):
+		payload = self.read_payload(length)
+		if data_type == INT2:
+			return list(struct.unpack('>%dh' % (length / 2), payload))
+		elif data_type == INT4:
+			return list(struct.unpack('>%di' % (length / 4), payload))
+		elif data_type == REAL8:
+			return [decode_real8(payload, offset) for offset in range(0, length, 8)]
+		elif data_type == ASCII:
+			return payload.rstrip('\0')
+		elif data_type == BITARRAY:
+			return struct.unpack('>H', payload)[0]
+		elif data_type == NODATA:
+			return None
+		else:
+			print "UNSUPPORTED %s: GDSII record data type (%d) not supported." % (inspect.stack()[0][3], data_type)
+			sys.exit(2)
+
+	# Reads the entire GDSII library. The layer filter is an (optional)
+	# function, taking a GDSII layer number and data type, that returns
+	# False for layers whose elements should be skipped.
+	def read_library(self, layer_filter=None):
+		layer_decisions = {} # Key<(gds layer num, gds data type)> --> Value<True/False>
+		lib             = self.read_library_header()
+
+		while True:
+			record_type, data_type, length = self.read_record_header()
+			if record_type == BGNSTR:
+				struct_times = decode_timestamps(self.read_data(data_type, length))
+				lib.append(self.read_structure(struct_times, layer_filter, layer_decisions))
+			elif record_type == ENDLIB:
+				self.skip_payload(length)
+				break
+			else:
+				# Ignore remaining library header records
+				self.skip_payload(length)
+		return lib
+
+	# Reads the GDSII library header records (up to, and including, 
+	# the UNITS record). Returns a GDSII library object without any
+	# structures.
+	def read_library_header(self):
+		version   = None
+		lib_name  = None
+		lib_times = (None, None)
+
+		self.rewind()
+		while True:
+			record_type, data_type, length = self.read_record_header()
+			if record_type == HEADER:
+				version = self.read_data(data_type, length)[0]
+			elif record_type == BGNLIB:
+				lib_times = decode_timestamps(self.read_data(data_type, length))
+			elif record_type == LIBNAME:
+				lib_name = self.read_data(data_type, length)
+			elif record_type == UNITS:
+				logical_unit, physical_unit = self.read_data(data_type, length)
+				return Library(version, lib_name, physical_unit, logical_unit, lib_times[0], lib_times[1])
+			elif record_type == BGNSTR or record_type == ENDLIB:
+				print "ERROR %s: GDSII library UNITS record not found." % (inspect.stack()[0][3])
+				sys.exit(1)
+			else:
+				# Ignore remaining library header records
+				self.skip_payload(length)
+
+	# Walks all records of the GDSII stream (without decoding any element
+	# records) to find the byte offset of each structure. Reader must be
+	# memory mapped. Returns a dictionary of the form:
+	# Key<structure name> --> Value<byte offset of BGNSTR record>
+	def index_structures(self):
+		offsets       = {}
+		struct_offset = None
+
+		self.rewind()
+		while True:
+			record_offset = self.position
+			record_type, data_type, length = self.read_record_header()
+			if record_type == BGNSTR:
+				struct_offset = record_offset
+				self.skip_payload(length)
+			elif record_type == STRNAME:
+				struct_name = self.read_data(data_type, length)
+				if struct_name in offsets:
+					print "ERROR %s: encountered multiple GDSII structures with the same name (%s)." % (inspect.stack()[0][3], struct_name)
+					sys.exit(2)
+				offsets[struct_name] = struct_offset
+			elif record_type == ENDLIB:
+				self.skip_payload(length)
+				break
+			else:
+				self.skip_payload(length)
+		return offsets
+
+	# Reads the GDSII structure whose BGNSTR record is at the byte offset.
+	def read_structure_at(self, offset, layer_filter=None, layer_decisions=None):
+		if layer_decisions == None:
+			layer_decisions = {}
+		self.seek(offset)
+		record_type, data_type, length = self.read_record_header()
+		if record_type != BGNSTR:
+			print "ERROR %s: no GDSII structure at byte offset %d (stale structure index?)." % (inspect.stack()[0][3], offset)
+			sys.exit(1)
+		struct_times = decode_timestamps(self.read_data(data_type, length))
+		return self.read_structure(struct_times, layer_filter, layer_decisions)
+
+	# Reads a GDSII structure (after the BGNSTR record).
+	def read_structure(self, struct_times, layer_filter, layer_decisions):
+		structure = None
+		while True:
+			record_type, data_type, length = self.read_record_header()
+			if record_type == STRNAME:
+				structure = Structure(self.read_data(data_type, length), struct_times[0], struct_times[1])
+			elif record_type == ENDSTR:
+				self.skip_payload(length)
+				return structure
+			elif record_type in ELEMENT_TYPES:
+				self.skip_payload(length)
+				element = self.read_element(record_type, layer_filter, layer_decisions)
+				if element != None:
+					structure.append(element)
+			elif record_type in SKIPPED_ELEMENT_TYPES:
+				self.skip_payload(length)
+				self.skip_element()
+			else:
+				# Ignore remaining structure records (e.g. STRCLASS)
+				self.skip_payload(length)
+
+	# Skips all records up to, and including, the next ENDEL record.
+	def skip_element(self):
+		self.num_elements_skipped += 1
+		record_type = None
+		while record_type != ENDEL:
+			record_type, data_type, length = self.read_record_header()
+			self.skip_payload(length)
+
+	# Reads a GDSII element (after the element type record). Returns
+	# None if the element is on a layer rejected by the layer filter.
+	def read_element(self, element_type, layer_filter, layer_decisions):
+		element_class = ELEMENT_TYPES[element_type]
+		attributes = {}
+		properties = []
+		keep       = True
+
+		while True:
+			record_type, data_type, length = self.read_record_header()
+			if record_type == ENDEL:
+				self.skip_payload(length)
+				break
+			elif not keep:
+				self.skip_payload(length)
+			elif record_type == XY:
+				# Check if element's layer is needed before decoding coordinates
+				if layer_filter != None and 'layer' in attributes:
+					layer_key = (attributes['layer'], attributes.get('data_type', attributes.get('box_type')))
+					if layer_key not in layer_decisions:
+						layer_decisions[layer_key] = layer_filter(layer_key[0], layer_key[1])
+					keep = layer_decisions[layer_key]
+				if keep:
+					coords = self.read_data(data_type, length)
+					attributes['xy'] = zip(coords[0::2], coords[1::2])
+				else:
+					self.skip_payload(length)
+			elif record_type == COLROW:
+				attributes['cols'], attributes['rows'] = self.read_data(data_type, length)
+			elif record_type == PROPATTR:
+				properties.append([self.read_data(data_type, length)[0], None])
+			elif record_type == PROPVALUE:
+				properties[-1][1] = self.read_data(data_type, length)
+			elif record_type in ELEMENT_ATTRIBUTES:
+				value = self.read_data(data_type, length)
+				if isinstance(value, list):
+					value = value[0]
+				attributes[ELEMENT_ATTRIBUTES[record_type]] = value
+			else:
+				print "UNSUPPORTED %s: GDSII record type (0x%02x) in element not supported." % (inspect.stack()[0][3], record_type)
+				sys.exit(2)
+
+		if not keep:
+			self.num_elements_skipped += 1
+			return None
+
+		# Construct python-gdsii element object (the same way python-gdsii
+		# does when loading from a file, i.e. without calling __init__)
+		attributes['properties'] = [tuple(prop) for prop in properties]
+		element = element_class.__new__(element_class)
+		element._init_optional()
+		for attribute_name, value in attributes.iteritems():
+			if attribute_name in element_class.__slots__:
+				setattr(element, attribute_name, value)
+		return element
+
+	# Scans a single GDSII structure for Path elements that carry properties,
+	# without decoding any XY payloads. Scanning starts at the (optional)
+	# byte offset of the structure. Returns a dictionary of the form:
+	# Key<property value (net name)> --> Value<set of (gds layer num, gds data type)>
+	def scan_path_properties(self, struct_name, offset=0):
+		path_properties = {}
+		in_structure    = False
+		element_type    = None
+		element_layer   = None
+
+		self.seek(offset)
+		while True:
+			record_type, data_type, length = self.read_record_header()
+			if record_type == ENDLIB:
+				self.skip_payload(length)
+				break
+			elif record_type == STRNAME:
+				in_structure = (self.read_data(data_type, length) == struct_name)
+			elif record_type == ENDSTR:
+				self.skip_payload(length)
+				if in_structure:
+					break
+			elif not in_structure:
+				self.skip_payload(length)
+			elif record_type in ELEMENT_TYPES or record_type in SKIPPED_ELEMENT_TYPES:
+				self.skip_payload(length)
+				element_type  = record_type
+				element_layer = [None, None]
+			elif element_type == PATH and record_type == LAYER:
+				element_layer[0] = self.read_data(data_type, length)[0]
+			elif element_type == PATH and record_type == DATATYPE:
+				element_layer[1] = self.read_data(data_type, length)[0]
+			elif element_type == PATH and record_type == PROPVALUE:
+				net_name = self.read_data(data_type, length)
+				if net_name not in path_properties:
+					path_properties[net_name] = set()
+				path_properties[net_name].add(tuple(element_layer))
+			else:
+				self.skip_payload(length)
+		self.rewind()
+		return path_properties
+
+	def print_stats(self):
+		print "GDSII Reader Stats:"
+		print "	Memory Mapped:    %s" % (self.buffer != None)
+		print "	Elements Skipped: %d" % (self.num_elements_skipped)
+		print "	Bytes Skipped:    %d" % (self.num_bytes_skipped)
+
+# Dictionary-like index of the structures of a GDSII library, keyed
+# by structure name, that decodes a structure (with a memory-mapped 
+# reader) only when it is first accessed. Structures that are never
+# referenced are never decoded.
+class GDSIIStructureIndex():
+	def __init__(self, reader, offsets, layer_filter=None):
+		self.reader          = reader
+		self.offsets         = offsets # Key<structure name> --> Value<byte offset>
+		self.layer_filter    = layer_filter
+		self.layer_decisions = {}
+		self.structures      = {}      # Key<structure name> --> Value<GDSII structure object>
+
+	def __contains__(self, struct_name):
+		return struct_name in self.offsets
+
+	def __getitem__(self, struct_name):
+		if struct_name not in self.structures:
+			self.structures[struct_name] = self.reader.read_structure_at(self.offsets[struct_name], self.layer_filter, self.layer_decisions)
+		return self.structures[struct_name]
+
+	def __len__(self):
+		return len(self.offsets)
+
+	def keys(self):
+		return self.offsets.keys()
+
+	def print_stats(self):
+		print "GDSII Structure Index Stats:"
+		print "	Structures Indexed: %d" % (len(self.offsets))
+		print "	Structures Decoded: %d" % (len(self.structures))
@@ -0,0 +1,156 @@
+# Other Imports
+import sys
+import inspect
+import os
+import zlib
+import threading
+import Queue
+
+# Magic numbers of compressed GDSII streams
+GZIP_MAGIC = '\x1f\x8b'
+XZ_MAGIC   = '\xfd7zXZ\x00'
+
+# Size of the (compressed) chunks read by the decompression thread,
+# and the max. number of decompressed chunks it buffers ahead of the
+# GDSII parser.
+DECOMPRESS_CHUNK_SIZE   = 1 << 20
+DECOMPRESS_QUEUE_CHUNKS = 16
+
+# Opens a GDSII input for reading. The input is either a filename, or
+# "-" for stdin. Inputs compressed with gzip (.gds.gz) or xz (.gds.xz)
+# are detected by their magic number and decompressed on the fly (see
+# DecompressingStream), so they never have to be decompressed to disk.
+# Plain GDSII files are opened as is, so they can be memory-mapped.
+def open_gdsii_stream(gdsii_fname):
+	if gdsii_fname == '-':
+		source = os.fdopen(os.dup(sys.stdin.fileno()), 'rb')
+		prefix = source.read(len(XZ_MAGIC))
+	else:
+		source = open(gdsii_fname, 'rb')
+		prefix = source.read(len(XZ_MAGIC))
+		if not prefix.startswith(GZIP_MAGIC) and not prefix.startswith(XZ_MAGIC):
+			source.seek(0)
+			return source
+	return DecompressingStream(source, get_decompressor_factory(prefix), prefix)
+
+# Returns True if the GDSII input is read from a (seekable) file.
+def is_gdsii_stream_seekable(stream):
+	return not isinstance(stream, DecompressingStream)
+
+# Returns the first size bytes of a GDSII (or other layout) input
+# stream without consuming them, e.g. to detect the file format.
+def peek_stream(stream, size):
+	if isinstance(stream, DecompressingStream):
+		return stream.peek(size)
+	data = stream.read(size)
+	stream.seek(-len(data), os.SEEK_CUR)
+	return data
+
+# Returns a function creating a decompressor (an object with
+# decompress() and flush() methods) for a stream starting with the
+# provided bytes, or None if the stream is not compressed.
+def get_decompressor_factory(prefix):
+	if prefix.startswith(GZIP_MAGIC):
+		return lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)
+	elif prefix.startswith(XZ_MAGIC):
+		# Import LZMA Library (Python 3, or backports.lzma for Python 2)
+		try:
+			import lzma
+		except ImportError:
+			try:
+				from backports import lzma
+			except ImportError:
+				print "ERROR %s: reading xz-compressed GDSII requires the backports.lzma module." % (inspect.stack()[0][3])
+				sys.exit(1)
+		return lzma.LZMADecompressor
+	return None
+
+# Read-only, sequential (non-seekable) file-like stream of a (compressed)
+# GDSII input. A background thread reads and decompresses the source
+# stream, and hands the decompressed chunks to the GDSII parser through
+# a bounded queue, so decompression and parsing overlap, and at most
+# DECOMPRESS_QUEUE_CHUNKS chunks are held in memory.
+class DecompressingStream():
+	def __init__(self, source, decompressor_factory=None, prefix=''):
+		self.source               = source
+		self.decompressor_factory = decompressor_factory
+		self.prefix               = prefix
+		self.chunks               = Queue.Queue(DECOMPRESS_QUEUE_CHUNKS)
+		self.chunk                = ''
+		self.chunk_offset         = 0
+		self.is_done              = False
+		self.is_closed            = threading.Event()
+		self.thread               = threading.Thread(target=self.decompress_source)
+		self.thread.daemon        = True
+		self.thread.start()
+
+	# Decompression thread: queues decompressed chunks, followed by None
+	# at the end of the stream (or the error if decompression fails).
+	def decompress_source(self):
+		try:
+			decompressor = self.decompressor_factory() if self.decompressor_factory != None else None
+			data         = self.prefix
+			while data:
+				while data and decompressor != None:
+					self.put_chunk(decompressor.decompress(data))
+					# Concatenated (multi-member) gzip streams
+					data = getattr(decompressor, 'unused_data', '')
+					if data:
+						decompressor = self.decompressor_factory()
+				if decompressor == None:
+					self.put_chunk(data)
+				data = self.source.read(DECOMPRESS_CHUNK_SIZE)
+			if decompressor != None and hasattr(decompressor, 'flush'):
+				self.put_chunk(decompressor.flush())
+			self.put_chunk(None)
+		except Exception as e:
+			# Unreadable source, or corrupt compressed data
+			self.put_chunk(e)
+
+	def put_chunk(self, chunk):
+		if chunk == '':
+			return
+		while not self.is_closed.is_set():
+			try:
+				self.chunks.put(chunk, timeout=0.1)
+				return
+			except Queue.Full:
+				pass
+
+	# Reads up to size bytes (fewer only at the end of the stream).
+	def read(self, size):
+		if self.chunk_offset + size <= len(self.chunk):
+			data = self.chunk[self.chunk_offset : self.chunk_offset + size]
+			self.chunk_offset += size
+			return data
+		pieces = [self.chunk[self.chunk_offset:]]
+		size  -= len(pieces[0])
+		self.chunk        = ''
+		self.chunk_offset = 0
+		while size > 0 and not self.is_done:
+			chunk = self.chunks.get()
+			if chunk == None:
+				self.is_done = True
+			elif isinstance(chunk, Exception):
+				print "ERROR %s: could not decompress GDSII stream (%s)." % (inspect.stack()[0][3], chunk)
+				sys.exit(1)
+			elif len(chunk) <= size:
+				pieces.append(chunk)
+				size -= len(chunk)
+			else:
+				pieces.append(chunk[:size])
+				self.chunk        = chunk
+				self.chunk_offset = size
+				size              = 0
+		return ''.join(pieces)
+
+	# Returns the next size bytes without consuming them.
+	def peek(self, size):
+		data              = self.read(size)
+		self.chunk        = data + self.chunk[self.chunk_offset:]
+		self.chunk_offset = 0
+		return data
+
+	def close(self):
+		self.is_closed.set()
+		self.source.close()
@@ -0,0 +1,58 @@
+# Import Custom Modules
+from geometry_store import *
+
+# Other Imports
+import inspect
+import os
+import shutil
+import hashlib
+
+# Version of the on-disk geometry format. Must be
+# incremented whenever the format (or flattening) changes.
+GEOMETRY_CACHE_VERSION = 5
+
+# Computes the key of a geometry cache entry, i.e. a content
+# hash of the input files (GDSII, layer map, ...) and any other
+# parameters (top module name, ...) the flattened geometry
+# depends on.
+def compute_geometry_cache_key(fnames, params):
+	key_hash = hashlib.sha1()
+	key_hash.update('v%d\n' % (GEOMETRY_CACHE_VERSION))
+	for param in params:
+		key_hash.update('%s\n' % (param))
+	for fname in fnames:
+		with open(fname, 'rb') as stream:
+			chunk = stream.read(1 << 20)
+			while chunk:
+				key_hash.update(chunk)
+				chunk = stream.read(1 << 20)
+		stream.close()
+	return key_hash.hexdigest()
+
+# Returns the (memory-mapped) geometry store cached
+# under the key, or None if it is not in the cache.
+def load_cached_geometry(cache_dir, cache_key):
+	entry_path = os.path.join(cache_dir, cache_key)
+	if not os.path.isdir(entry_path):
+		return None
+	return GeometryStore.from_directory(entry_path)
+
+# Saves a geometry store in the cache under the key. The entry
+# is written to a temporary directory first, and then renamed,
+# so concurrent runs never see a partially written entry.
+def save_cached_geometry(cache_dir, cache_key, geometry):
+	entry_path = os.path.join(cache_dir, cache_key)
+	temp_path  = '%s.tmp%d' % (entry_path, os.getpid())
+	try:
+		if not os.path.isdir(cache_dir):
+			os.makedirs(cache_dir)
+		if os.path.isdir(temp_path):
+			shutil.rmtree(temp_path)
+		os.mkdir(temp_path)
+		geometry.save_to_directory(temp_path)
+		os.rename(temp_path, entry_path)
+	except OSError as e:
+		# Entry written by a concurrent run, or cache not writable
+		print "WARNING %s: could not save geometry cache entry %s (%s)." % (inspect.stack()[0][3], entry_path, e.strerror)
+		if os.path.isdir(temp_path):
+			shutil.rmtree(temp_path)
@@ -0,0 +1,97 @@
+# Other Imports
+import time
+import sys
+import inspect
+import os
+import numpy
+
+# Max. number of polygons written per (per-layer) chunk file
+EXPORT_CHUNK_POLYGONS = 1 << 18
+
+# Arrays written per chunk file (layer_<gds layer>_<gds data type>_<chunk>.npz):
+# bboxes        = (num polygons x 4) LL x, LL y, UR x, UR y of each polygon
+# offsets       = (num polygons + 1) offsets of each polygon in the vertex arrays of the chunk
+# coords        = (num vertices x 2) vertex coordinates of all polygons
+# coord_flags   = (num vertices) flags marking float (vs. int) coordinates
+# element_types = (num polygons) element type code of each polygon (0 = Boundary, 1 = Path)
+# element_ids   = (num polygons) index of the top-level element of each polygon
+# cell_ids      = (num polygons) line number (in cells.txt) of the cell of each polygon
+# net_ids       = (num polygons) line number (in nets.txt) of the net of each polygon, or -1
+EXPORT_ARRAY_NAMES = ['bboxes', 'offsets', 'coords', 'coord_flags', 'element_types', 'element_ids', 'cell_ids', 'net_ids']
+
+# Exports the flattened layout geometry (see geometry_store.py) as
+# columnar numpy (.npz) files, so other tools can load the flattened
+# polygons instead of flattening the GDSII layout again. Each layer is
+# written in chunks of at most chunk_polygons polygons, sliced from the
+# stored layer arrays, so only one chunk at a time is copied (or, for
+# memory-mapped cached geometry, read from disk). The export directory
+# also holds:
+# cells.txt  = names of the source cells (line 0 is the top-level structure)
+# nets.txt   = names of the nets of top-level Paths
+# chunks.npy = (num chunks x 5) gds layer num, gds data type, chunk num,
+#              num polygons, num vertices of each chunk file
+def export_geometry(layout, export_dir, chunk_polygons=EXPORT_CHUNK_POLYGONS):
+	print "Exporting flattened geometry ..."
+	start_time = time.time()
+
+	geometry = layout.geometry
+	try:
+		if not os.path.isdir(export_dir):
+			os.makedirs(export_dir)
+	except OSError as e:
+		print "ERROR %s: could not create export directory %s (%s)." % (inspect.stack()[0][3], export_dir, e.strerror)
+		sys.exit(1)
+
+	# Source cell of every top-level element (polygons of top-level
+	# Boundaries/Paths belong to the top-level structure)
+	cell_names        = [layout.top_level_name] + geometry.get_cell_names()
+	cell_nums         = dict((cell_name, cell_num) for cell_num, cell_name in enumerate(cell_names))
+	element_cell_nums = numpy.zeros(geometry.num_elements, dtype=numpy.int64)
+	for element_id, cell_name in geometry.element_cells.iteritems():
+		element_cell_nums[element_id] = cell_nums[cell_name]
+	write_names(os.path.join(export_dir, 'cells.txt'), cell_names)
+
+	# Net of every (net) polygon, grouped by layer
+	net_names      = sorted(geometry.get_net_names())
+	net_poly_refs  = {} # Key<(gds layer num, gds data type)> --> Value<list of (polygon index, net num) tuples>
+	for net_num, net_name in enumerate(net_names):
+		for layer_key, poly_index in geometry.net_polygons[net_name]:
+			net_poly_refs.setdefault(layer_key, []).append((poly_index, net_num))
+	write_names(os.path.join(export_dir, 'nets.txt'), net_names)
+
+	# Write layers chunk by chunk
+	chunks = []
+	for layer_key in geometry.get_layer_keys():
+		arrays    = geometry.get_layer_arrays(layer_key)
+		num_polys = geometry.get_num_polygons(layer_key)
+		net_refs  = numpy.array(net_poly_refs.get(layer_key, []), dtype=numpy.int64).reshape((-1, 2))
+		for chunk_num, start in enumerate(range(0, num_polys, chunk_polygons)):
+			end           = min(start + chunk_polygons, num_polys)
+			vertex_start  = int(arrays['offsets'][start])
+			vertex_end    = int(arrays['offsets'][end])
+			element_ids   = numpy.asarray(arrays['element_ids'][start:end])
+			net_ids       = numpy.full(end - start, -1, dtype=numpy.int64)
+			chunk_refs    = net_refs[(net_refs[:, 0] >= start) & (net_refs[:, 0] < end)]
+			net_ids[chunk_refs[:, 0] - start] = chunk_refs[:, 1]
+			chunk_fname   = os.path.join(export_dir, 'layer_%d_%d_%d.npz' % (layer_key[0], layer_key[1], chunk_num))
+			numpy.savez(chunk_fname, \
+				bboxes=arrays['bboxes'][start:end], \
+				offsets=arrays['offsets'][start:end + 1] - vertex_start, \
+				coords=arrays['coords'][vertex_start:vertex_end], \
+				coord_flags=arrays['coord_flags'][vertex_start:vertex_end], \
+				element_types=arrays['element_types'][start:end], \
+				element_ids=element_ids, \
+				cell_ids=element_cell_nums[element_ids], \
+				net_ids=net_ids)
+			chunks.append((layer_key[0], layer_key[1], chunk_num, end - start, vertex_end - vertex_start))
+	numpy.save(os.path.join(export_dir, 'chunks.npy'), numpy.array(chunks, dtype=numpy.int64).reshape((len(chunks), 5)))
+
+	print "Exported %d polygons (%d chunk files) to %s." % (geometry.num_polygons, len(chunks), export_dir)
+	print "Done - Time Elapsed:", (time.time() - start_time), "seconds."
+	print "----------------------------------------------"
+
+# Writes a list of names to a text file, one name per line.
+def write_names(fname, names):
+	with open(fname, 'wb') as stream:
+		for name in names:
+			stream.write(name + '\n')
@@ -0,0 +1,362 @@
+# Import GDSII Library
+from gdsii.elements import *
+
+# Import Custom Modules
+from polygon        import *
+from polygon_arrays import *
+from spatial_index  import *
+
+# Other Imports
+import sys
+import inspect
+import os
+import array
+import itertools
+import numpy
+
+# Element type codes of stored polygons
+BOUNDARY_POLYGON = 0
+PATH_POLYGON     = 1
+
+# Returns the basename of a (hierarchical) net name, i.e. its last
+# hierarchy level without bus bit index (e.g. "a/b/data[3]" --> "data").
+def get_net_basename(net_name):
+	return net_name.split('/')[-1].split('[')[0]
+
+# Arrays stored per layer:
+# coords        = (num vertices x 2) vertex coordinates of all polygons
+# coord_flags   = (num vertices) flags marking float (vs. int) coordinates
+# offsets       = (num polygons + 1) offsets of each polygon in the vertex arrays
+# bboxes        = (num polygons x 4) LL x, LL y, UR x, UR y of each polygon
+# element_ids   = (num polygons) index of the top-level element of each polygon
+# element_types = (num polygons) element type code of each polygon
+LAYER_ARRAY_NAMES = ['coords', 'coord_flags', 'offsets', 'bboxes', 'element_ids', 'element_types']
+
+# (numpy data type, array.array type code) of each stored array
+LAYER_ARRAY_TYPES = {
+	'coords':        (numpy.float64, 'd'),
+	'coord_flags':   (numpy.int8,    'b'),
+	'offsets':       (numpy.int64,   'l'),
+	'bboxes':        (numpy.float64, 'd'),
+	'element_ids':   (numpy.int64,   'l'),
+	'element_types': (numpy.int8,    'b'),
+}
+
+# Flattened layout geometry, partitioned by GDSII layer. The store is
+# filled once, by a single flattening pass over the top-level GDSII
+# structure, and is then queried by every analysis stage (and custom
+# module) instead of re-flattening the GDSII library.
+#
+# Polygons are not kept as objects: each layer is a set of flat numpy
+# arrays (see LAYER_ARRAY_NAMES), which are filled through compact
+# array.array buffers while flattening. Polygon objects are thin views
+# created, on demand, from these arrays, and are not kept by the store
+# (callers keep the views they need), so only polygons actually visited
+# by an analysis are ever turned into objects, and only while they are
+# in use. A store can also be saved to, and loaded from, a directory of
+# (memory-mapped) numpy arrays.
+class GeometryStore():
+	def __init__(self):
+		self.layers        = {} # Key<(gds layer num, gds data type)> --> Value<dictionary of numpy arrays>
+		self.builders      = {} # Key<(gds layer num, gds data type)> --> Value<dictionary of array.array buffers>
+		self.elements      = {} # Key<(gds layer num, gds data type)> --> Value<Key<element type> --> Value<GDSII element>>
+		self.net_polygons  = {} # Key<net name> --> Value<list of (layer key, polygon index) tuples of top-level Paths>
+		self.net_basenames = {} # Key<net basename> --> Value<list of net names>
+		self.indices       = {} # Key<(gds layer num, gds data type)> --> Value<SpatialIndex object>
+		self.element_cells = {} # Key<element ID> --> Value<name of the GDSII structure referenced by the top-level SRef/ARef>
+		self.num_polygons  = 0
+		self.num_elements  = 0
+
+	# Loads a geometry store saved with save_to_directory().
+	# Arrays are memory-mapped, not read, from disk.
+	@classmethod
+	def from_directory(cls, path):
+		geometry = cls()
+		geometry.num_polygons, geometry.num_elements = numpy.load(os.path.join(path, 'counts.npy')).tolist()
+		for layer_num, data_type in numpy.load(os.path.join(path, 'layers.npy')).tolist():
+			layer_key = (layer_num, data_type)
+			geometry.layers[layer_key] = {}
+			for array_name in LAYER_ARRAY_NAMES:
+				array_fname = os.path.join(path, 'layer_%d_%d_%s.npy' % (layer_num, data_type, array_name))
+				geometry.layers[layer_key][array_name] = numpy.load(array_fname, mmap_mode='r')
+
+		# Load net polygon references (in original order)
+		with open(os.path.join(path, 'net_names.txt'), 'rb') as stream:
+			net_names = stream.read().split('\n')[:-1]
+		stream.close()
+		for net_num, layer_num, data_type, poly_index in numpy.load(os.path.join(path, 'nets.npy')).tolist():
+			geometry.add_net_polygons(net_names[net_num], [((layer_num, data_type), poly_index)])
+
+		# Load structures referenced by top-level elements
+		with open(os.path.join(path, 'cell_names.txt'), 'rb') as stream:
+			cell_names = stream.read().split('\n')[:-1]
+		stream.close()
+		for element_id, cell_num in numpy.load(os.path.join(path, 'element_cells.npy')).tolist():
+			geometry.element_cells[element_id] = cell_names[cell_num]
+		return geometry
+
+	# Concatenates several stores (in order) into one store, e.g. the
+	# stores of the chunks of top-level elements flattened by worker
+	# processes. Polygon indices (and net polygon references) of each
+	# store are shifted past the polygons of the preceding stores.
+	@classmethod
+	def concatenate(cls, geometries):
+		geometry      = cls()
+		index_offsets = [{} for i in range(len(geometries))] # Key<(gds layer num, gds data type)> --> Value<polygon index offset> (per store)
+		for layer_key in sorted(set(itertools.chain(*[other.get_layer_keys() for other in geometries]))):
+			layer_arrays = {}
+			for array_name in LAYER_ARRAY_NAMES:
+				layer_arrays[array_name] = []
+			num_polys  = 0
+			num_coords = 0
+			for geometry_index, other in enumerate(geometries):
+				if other.get_num_polygons(layer_key) == 0:
+					continue
+				arrays = other.get_layer_arrays(layer_key)
+				for array_name in LAYER_ARRAY_NAMES:
+					if array_name == 'offsets':
+						layer_arrays['offsets'].append(arrays['offsets'][1:] + num_coords)
+					else:
+						layer_arrays[array_name].append(arrays[array_name])
+				index_offsets[geometry_index][layer_key] = num_polys
+				num_polys  += len(arrays['element_ids'])
+				num_coords += len(arrays['coord_flags'])
+			layer_arrays['offsets'].insert(0, numpy.zeros(1, dtype=LAYER_ARRAY_TYPES['offsets'][0]))
+			geometry.layers[layer_key] = {}
+			for array_name in LAYER_ARRAY_NAMES:
+				geometry.layers[layer_key][array_name] = numpy.concatenate(layer_arrays[array_name])
+
+		# Merge net polygon references
+		for geometry_index, other in enumerate(geometries):
+			for net_name in other.get_net_names():
+				geometry.add_net_polygons(net_name, [(layer_key, poly_index + index_offsets[geometry_index][layer_key]) for layer_key, poly_index in other.net_polygons[net_name]])
+			geometry.element_cells.update(other.element_cells)
+			geometry.num_polygons += other.num_polygons
+			geometry.num_elements  = max(geometry.num_elements, other.num_elements)
+		return geometry
+
+	# Saves the store as a directory of numpy arrays.
+	def save_to_directory(self, path):
+		layer_keys = self.get_layer_keys()
+		numpy.save(os.path.join(path, 'counts.npy'), numpy.array([self.num_polygons, self.num_elements], dtype=numpy.int64))
+		numpy.save(os.path.join(path, 'layers.npy'), numpy.array(layer_keys, dtype=numpy.int64).reshape((len(layer_keys), 2)))
+		for layer_key in layer_keys:
+			arrays = self.get_layer_arrays(layer_key)
+			for array_name in LAYER_ARRAY_NAMES:
+				numpy.save(os.path.join(path, 'layer_%d_%d_%s.npy' % (layer_key[0], layer_key[1], array_name)), arrays[array_name])
+
+		# Save net polygon references (in original order)
+		net_names = self.get_net_names()
+		net_refs  = []
+		for net_num, net_name in enumerate(net_names):
+			for layer_key, poly_index in self.net_polygons[net_name]:
+				net_refs.append((net_num, layer_key[0], layer_key[1], poly_index))
+		numpy.save(os.path.join(path, 'nets.npy'), numpy.array(net_refs, dtype=numpy.int64).reshape((len(net_refs), 4)))
+		with open(os.path.join(path, 'net_names.txt'), 'wb') as stream:
+			for net_name in net_names:
+				stream.write(net_name + '\n')
+		stream.close()
+
+		# Save structures referenced by top-level elements
+		cell_names    = self.get_cell_names()
+		cell_nums     = dict((cell_name, cell_num) for cell_num, cell_name in enumerate(cell_names))
+		element_cells = [(element_id, cell_nums[cell_name]) for element_id, cell_name in sorted(self.element_cells.iteritems())]
+		numpy.save(os.path.join(path, 'element_cells.npy'), numpy.array(element_cells, dtype=numpy.int64).reshape((len(element_cells), 2)))
+		with open(os.path.join(path, 'cell_names.txt'), 'wb') as stream:
+			for cell_name in cell_names:
+				stream.write(cell_name + '\n')
+		stream.close()
+
+	# Adds a flattened polygon to the store. The element ID is the
+	# index of the top-level GDSII element the polygon originated from.
+	# Only the polygon's vertices/bbox are kept, not the object itself.
+	# Returns a (layer key, polygon index) reference to the polygon.
+	def add_polygon(self, poly, element_id):
+		return self.add_polygon_arrays(PolygonArrays.from_polygons([poly]), element_id)[0]
+
+	# Adds a batch of flattened polygons (see polygon_arrays.py) to
+	# the store. Returns a list of (layer key, polygon index) references
+	# to the polygons.
+	def add_polygon_arrays(self, polys, element_id):
+		poly_refs   = []
+		coords      = polys.coords.ravel().tolist()
+		coord_flags = polys.coord_flags.tolist()
+		offsets     = polys.offsets.tolist()
+		bboxes      = polys.compute_bboxes().tolist()
+		for poly_index, element in enumerate(polys.elements):
+			layer_key = (element.layer, element.data_type)
+			if layer_key not in self.builders:
+				self.thaw_layer(layer_key)
+			builder = self.builders[layer_key]
+			start   = offsets[poly_index]
+			end     = offsets[poly_index + 1]
+			builder['coords'].extend(coords[2 * start:2 * end])
+			builder['coord_flags'].extend(coord_flags[start:end])
+			builder['offsets'].append(len(builder['coord_flags']))
+			builder['bboxes'].extend(bboxes[poly_index])
+			builder['element_ids'].append(element_id)
+			builder['element_types'].append(PATH_POLYGON if isinstance(element, Path) else BOUNDARY_POLYGON)
+			self.indices.pop(layer_key, None)
+			poly_refs.append((layer_key, len(builder['element_ids']) - 1))
+		self.num_polygons += polys.get_num_polygons()
+		self.num_elements  = max(self.num_elements, element_id + 1)
+		return poly_refs
+
+	# Moves a layer (back) into array.array buffers so
+	# polygons can be appended to it.
+	def thaw_layer(self, layer_key):
+		self.builders[layer_key] = {}
+		for array_name in LAYER_ARRAY_NAMES:
+			self.builders[layer_key][array_name] = array.array(LAYER_ARRAY_TYPES[array_name][1])
+		if layer_key in self.layers:
+			for array_name, layer_array in self.layers.pop(layer_key).iteritems():
+				self.builders[layer_key][array_name].extend(layer_array.ravel().tolist())
+		else:
+			self.builders[layer_key]['offsets'].append(0)
+
+	# Converts the array.array buffers of a layer into numpy arrays.
+	def freeze_layer(self, layer_key):
+		builder = self.builders.pop(layer_key)
+		self.layers[layer_key] = {}
+		for array_name in LAYER_ARRAY_NAMES:
+			self.layers[layer_key][array_name] = numpy.array(builder[array_name], dtype=LAYER_ARRAY_TYPES[array_name][0])
+		self.layers[layer_key]['coords'] = self.layers[layer_key]['coords'].reshape((-1, 2))
+		self.layers[layer_key]['bboxes'] = self.layers[layer_key]['bboxes'].reshape((-1, 4))
+
+	# Returns the dictionary of numpy arrays (see LAYER_ARRAY_NAMES)
+	# of a given GDSII layer and data type.
+	def get_layer_arrays(self, layer_key):
+		if layer_key in self.builders:
+			self.freeze_layer(layer_key)
+		return self.layers[layer_key]
+
+	# Returns the number of polygons on a given GDSII layer and data type.
+	def get_num_polygons(self, layer_key):
+		if layer_key in self.builders:
+			return len(self.builders[layer_key]['element_ids'])
+		elif layer_key in self.layers:
+			return len(self.layers[layer_key]['element_ids'])
+		return 0
+
+	# Returns a (new view) polygon object of a stored polygon.
+	def get_polygon(self, layer_key, poly_index):
+		arrays  = self.get_layer_arrays(layer_key)
+		start   = int(arrays['offsets'][poly_index])
+		end     = int(arrays['offsets'][poly_index + 1])
+		points  = to_points(arrays['coords'][start:end].tolist(), arrays['coord_flags'][start:end].tolist())
+		element = self.get_layer_element(layer_key, int(arrays['element_types'][poly_index]))
+		return Polygon(points, element)
+
+	# Returns a GDSII element (of the given element type) on a given
+	# GDSII layer and data type. Elements are shared by all polygon
+	# views, and only carry the layer number and data type.
+	def get_layer_element(self, layer_key, element_type=BOUNDARY_POLYGON):
+		if layer_key not in self.elements:
+			self.elements[layer_key] = {
+				BOUNDARY_POLYGON: Boundary(layer_key[0], layer_key[1], None),
+				PATH_POLYGON:     Path(layer_key[0], layer_key[1], None)
+			}
+		return self.elements[layer_key][element_type]
+
+	# Records the polygons of a top-level GDSII Path that carries a
+	# net name property, as (layer key, polygon index) references
+	# returned by add_polygon().
+	def add_net_polygons(self, net_name, poly_refs):
+		if net_name not in self.net_polygons:
+			self.net_polygons[net_name] = []
+			self.net_basenames.setdefault(get_net_basename(net_name), []).append(net_name)
+		self.net_polygons[net_name].extend(poly_refs)
+
+	# Records the name of the GDSII structure referenced by a top-level
+	# SRef/ARef element, i.e. the cell its polygons originated from.
+	def set_element_cell(self, element_id, struct_name):
+		self.element_cells[element_id] = struct_name
+
+	# Returns the (sorted) names of all GDSII structures
+	# referenced by top-level elements.
+	def get_cell_names(self):
+		return sorted(set(self.element_cells.values()))
+
+	# Returns the names of all nets with polygons in the store.
+	def get_net_names(self):
+		return self.net_polygons.keys()
+
+	# Returns the names of all nets (with polygons in the store)
+	# whose basename (see get_net_basename()) is one of the provided
+	# basenames. Nets are looked up by basename, so the cost only
+	# depends on the number of basenames (and matching nets).
+	def get_net_names_by_basename(self, basenames):
+		net_names = []
+		for basename in basenames:
+			net_names.extend(self.net_basenames.get(basename, []))
+		return net_names
+
+	# Returns the list of polygons of a net.
+	def get_net_polygons(self, net_name):
+		return [self.get_polygon(layer_key, poly_index) for layer_key, poly_index in self.net_polygons[net_name]]
+
+	# Returns a list of (gds layer num, gds data type) tuples
+	# for all layers with at least one polygon.
+	def get_layer_keys(self):
+		return sorted(self.layers.keys() + self.builders.keys())
+
+	# Returns the list of polygons on a given GDSII layer and data type
+	# (creates views of all polygons on the layer).
+	def get_polygons(self, layer_key):
+		return [self.get_polygon(layer_key, poly_index) for poly_index in range(self.get_num_polygons(layer_key))]
+
+	# Returns the spatial index of the polygons on a given GDSII
+	# layer and data type. Indices are built on first use.
+	def get_spatial_index(self, layer_key):
+		if layer_key not in self.indices:
+			if self.get_num_polygons(layer_key) > 0:
+				self.indices[layer_key] = SpatialIndex(self.get_layer_arrays(layer_key)['bboxes'])
+			else:
+				self.indices[layer_key] = SpatialIndex(numpy.zeros((0, 4)))
+		return self.indices[layer_key]
+
+	# Returns a list of polygons on a given GDSII layer and data
+	# type whose bounding boxes overlap the provided bounding box.
+	def query_polygons(self, layer_key, bbox):
+		return [self.get_polygon(layer_key, poly_index) for poly_index in self.get_spatial_index(layer_key).query(bbox)]
+
+	# Returns the polygons on a GDSII layer number (any data type).
+	def get_polygons_on_gds_layer(self, gds_layer_num):
+		polys = []
+		for layer_key in self.get_layer_keys():
+			if layer_key[0] == gds_layer_num:
+				polys.extend(self.get_polygons(layer_key))
+		return polys
+
+	# Generator that yields all polygons in the store.
+	def iter_polygons(self):
+		for layer_key in self.get_layer_keys():
+			for poly_index in range(self.get_num_polygons(layer_key)):
+				yield self.get_polygon(layer_key, poly_index)
+
+	# Generator that yields (polygon, element ID) tuples for all
+	# polygons in the store.
+	def iter_polygons_with_element_ids(self):
+		for layer_key in self.get_layer_keys():
+			element_ids = self.get_layer_arrays(layer_key)['element_ids'].tolist()
+			for poly_index, element_id in enumerate(element_ids):
+				yield self.get_polygon(layer_key, poly_index), element_id
+
+	# Computes the bounding box of all polygons in the store
+	# (directly from the bounding box arrays).
+	def compute_bbox(self):
+		if self.num_polygons == 0:
+			print "ERROR %s: geometry store is empty." % (inspect.stack()[0][3])
+			sys.exit(1)
+		bboxes = numpy.concatenate([self.get_layer_arrays(layer_key)['bboxes'] for layer_key in self.get_layer_keys()])
+		ll     = Point(to_coord(bboxes[:, 0].min()), to_coord(bboxes[:, 1].min()))
+		ur     = Point(to_coord(bboxes[:, 2].max()), to_coord(bboxes[:, 3].max()))
+		return BBox(ll, ur)
+
+	def print_stats(self):
+		print "Geometry Store Stats:"
+		print "	Top-Level Elements: %d" % (self.num_elements)
+		print "	Polygons:           %d" % (self.num_polygons)
+		print "	Nets:               %d" % (len(self.net_polygons))
+		for layer_key in self.get_layer_keys():
+			print "	Layer %d/%d: %d polygons" % (layer_key[0], layer_key[1], self.get_num_polygons(layer_key))
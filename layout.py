@@ -1,6 +1,9 @@
 # Import GDSII Library
 from gdsii.library import Library
 from gdsii.elements import *
+from gdsii_reader import *
+from gdsii_stream import *
+from oasis_reader import *
 
 # Import Custom Modules
 import debug_prints as dbg
@@ -9,9 +12,17 @@ from LEF     import *
 from DEF     import *
 from net     import *
 from error   import *
+from flatten_cache import *
+from geometry_store import *
+from geometry_cache import *
+from polygon_arrays import *
+from transform      import *
+from aref_lattice   import *
+from region_query   import *
 
 # Other Imports
 import copy
+import math
 import time
 import sys
 import inspect
@@ -20,29 +31,99 @@ import os
 import itertools
 import multiprocessing as mp
 import functools as ft
+import fnmatch
+import numpy
+
+# Number of chunks (of top-level elements, or critical nets) per worker process
+FLATTEN_CHUNKS_PER_PROCESS = 4
+
+# Default raster resolution of the net blockage bitmaps (see
+# net_blockage.get_raster_resolution()): 1 database unit per pixel
+DEFAULT_NB_RESOLUTION = '1'
+
+# Layout of a worker process (see Layout.flatten_layout() and
+# Layout.extract_nearby_polygons_parallel()), inherited when forked
+worker_layout = None
+
+def init_layout_worker(layout):
+	global worker_layout
+	worker_layout = layout
+
+# Flattens a chunk of top-level elements in a worker process. Returns
+# the geometry store of the chunk (with all layers converted to numpy
+# arrays, so it is sent back compactly) and the worker's flatten cache
+# (only its stats for the chunk are sent back, not the cached polygons).
+def flatten_elements_in_worker(element_range):
+	worker_layout.flatten_cache.reset_stats()
+	geometry = worker_layout.flatten_top_level_elements(element_range[0], element_range[1])
+	for layer_key in geometry.get_layer_keys():
+		geometry.get_layer_arrays(layer_key)
+	return geometry, worker_layout.flatten_cache
+
+# Finds the nearby polygons of a range of critical nets in a worker
+# process. Returns, per net, per net segment, the nearby polygon
+# indices (see Layout.find_nearby_polygon_indices()).
+def extract_nearby_polygons_in_worker(net_range, adjacent_layers=True):
+	net_indices = []
+	for net in worker_layout.critical_nets[net_range[0]:net_range[1]]:
+		net_indices.append([worker_layout.find_nearby_polygon_indices(net_segment, adjacent_layers) for net_segment in net.segments])
+	return net_indices
 
 class Layout():
-	def __init__(self, top_name, metal_stack_lef_fname, std_cell_lef_name, def_fname, layer_map_fname, gdsii_fname, dot_fname, wire_rpt_fname, pg_filename, nb_step, nb_type, num_processes):
+	def __init__(self, top_name, metal_stack_lef_fname, std_cell_lef_name, def_fname, layer_map_fname, gdsii_fname, dot_fname, wire_rpt_fname, pg_filename, nb_step, nb_type, num_processes, flatten_cache_size=DEFAULT_FLATTEN_CACHE_SIZE, filter_layers=False, geometry_cache_dir=None, skip_fill_cells=False, skip_cell_patterns=None, stamp_cells=False, nb_resolution=DEFAULT_NB_RESOLUTION):
 		self.top_level_name      = top_name 
 		self.device_layer_nums   = {}
+		self.flatten_cache       = FlattenCache(flatten_cache_size)
 		self.lef                 = LEF(metal_stack_lef_fname, std_cell_lef_name)
 		self.layer_map           = self.load_layer_map(layer_map_fname)
+		self.layer_nums          = Layer_Num_Table(self.lef, self.layer_map)
 		self.wire_stats          = self.load_wire_statistics(wire_rpt_fname)
-		self.gdsii_lib           = self.load_gdsii_library(gdsii_fname)
-		self.gdsii_structures    = self.index_gdsii_structures_by_name()
-		self.top_gdsii_structure = self.gdsii_structures[top_name]
-		self.critical_nets       = self.extract_critical_nets_from_gdsii(self.load_dot_file(dot_fname))
+		self.critical_net_names  = self.load_dot_file(dot_fname)
+		self.gdsii_lib           = None
+		self.gdsii_struct_index  = None
+		self.gdsii_structures    = None
+		self.top_gdsii_structure = None
+		self.region_query        = None
+		self.num_processes       = num_processes
+		self.skip_cell_names     = set(self.lef.fill_cells.keys()) if skip_fill_cells else set() # <-- LEF SPACER cells
+		self.skip_cell_patterns  = skip_cell_patterns if skip_cell_patterns != None else []
+		self.srefs_to_ignore     = set()
+		self.stamp_cells         = stamp_cells # stamp cell occupancy tiles for net blockage (see cell_stamps.py)
+		self.geometry            = self.load_geometry(gdsii_fname, layer_map_fname, dot_fname, metal_stack_lef_fname, filter_layers, geometry_cache_dir)
+		self.critical_nets       = self.extract_critical_nets_from_gdsii(self.critical_net_names)
 		self.def_info            = DEF(def_fname, self.lef, pg_filename, self.critical_nets, self.lef)
 		self.net_blockage_step   = nb_step # in database units
 		self.net_blockage_type   = nb_type # 0 for un-constrained; 1 for LEF constrained
-		self.num_processes       = num_processes
+		self.net_blockage_resolution = nb_resolution # raster resolution of adjacent layer bitmaps (see net_blockage.py)
 		self.net_blockage_done   = False
 		self.trigger_space_done  = False
 		self.route_distance_done = False
 		self.trigger_spaces      = None
 
-	def generate_polys_from_element(self, element, srefs_to_ignore={}):
-		polys = []
+	# Worker processes (see net_blockage.py) only need the technology
+	# information and the critical nets, so the GDSII library and the
+	# flattened geometry are not pickled along with the layout.
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['gdsii_lib']           = None
+		state['gdsii_structures']    = None
+		state['gdsii_struct_index']  = None
+		state['top_gdsii_structure'] = None
+		state['region_query']        = None
+		state['geometry']            = None
+		return state
+
+	def generate_polys_from_element(self, element, srefs_to_ignore=None):
+		return self.generate_polygon_arrays_from_element(element, None, srefs_to_ignore).to_polygons()
+
+	# Flattens a GDSII element into (packed) polygon arrays. The provided
+	# transform (None for the identity) is composed with the transform of 
+	# every reference below the element, so each flattened vertex is only
+	# transformed once, by a single matrix, instead of once per hierarchy
+	# level (see flatten_structure() for cached structures).
+	def generate_polygon_arrays_from_element(self, element, transform=None, srefs_to_ignore=None):
+		if srefs_to_ignore == None:
+			srefs_to_ignore = self.srefs_to_ignore
 		if isinstance(element, SRef):
 			# Check if SRef is to be ignored (i.e. fill cells)
 			if element.struct_name not in srefs_to_ignore:
@@ -54,57 +135,33 @@ class Layout():
 					print "ERROR %s: SRef points to unkown structure %s." % (inspect.stack()[1][3], element.struct_name)
 					sys.exit(1)
 
-				# Iterate over elements of referenced structure
-				for sub_element in self.gdsii_structures[element.struct_name]:
-					sub_polys = self.generate_polys_from_element(sub_element)
-					
-					# Compute translations of sub elements
-					for poly in sub_polys:
-						poly.compute_translations(element.xy[0][0], element.xy[0][1], element.strans, element.angle)
-						polys.append(copy.copy(poly))
+				# Compute translations of (flattened) referenced structure polygons
+				return self.flatten_structure(element.struct_name, compose_transforms(transform, compute_element_transform(element)))
 		elif isinstance(element, ARef):
-			# Check if ARef properties are supported by this tool
-			# and that the structure pointed to exists.
-			if element.struct_name in self.gdsii_structures:
-				is_aref_type_supported(element, self.gdsii_structures[element.struct_name])
-			else:
-				print "ERROR %s: ARef points to unkown structure %s." % (inspect.stack()[1][3], element.struct_name)
-				sys.exit(1)
-
-			# Retrieve row and column spacing
-			row_spacing_vector_length = Point.from_tuple(element.xy[0]).distance_from(Point.from_tuple(element.xy[2]))
-			col_spacing_vector_length = Point.from_tuple(element.xy[0]).distance_from(Point.from_tuple(element.xy[1]))
-			curr_x_offset = 0.0
-			col_spacing   = col_spacing_vector_length / element.cols
-			curr_y_offset = 0.0
-			row_spacing   = row_spacing_vector_length / element.rows
-
-			# Iterate over elements of referenced structures
-			for row_index in range(element.rows):
-				for col_index in range(element.cols):
-					for sub_element in self.gdsii_structures[element.struct_name]:
-						# Generate polygons from all sub elements
-						sub_polys = self.generate_polys_from_element(sub_element)
-
-						# Compute translations of newly generated polygons
-						for poly in sub_polys:
-							poly.compute_translations(curr_x_offset, curr_y_offset, None, None)
-							polys.append(copy.copy(poly))
-					curr_x_offset += col_spacing
-				curr_x_offset = 0.0
-				curr_y_offset += row_spacing
-			# Compute overall translation of ARef element polygons
-			for poly in polys:				
-				poly.compute_translations(element.xy[0][0], element.xy[0][1], element.strans, element.angle)
+			# Check if ARef is to be ignored (i.e. fill cells)
+			if element.struct_name not in srefs_to_ignore:
+				# Check if ARef properties are supported by this tool
+				# and that the structure pointed to exists.
+				if element.struct_name in self.gdsii_structures:
+					is_aref_type_supported(element, self.gdsii_structures[element.struct_name])
+				else:
+					print "ERROR %s: ARef points to unkown structure %s." % (inspect.stack()[1][3], element.struct_name)
+					sys.exit(1)
+
+				# Flatten referenced structure (once), and broadcast
+				# it over all array positions of the ARef lattice
+				struct_polys = self.flatten_structure(element.struct_name)
+				lattice      = ARefLattice(element, struct_polys.compute_bbox(), transform)
+				return struct_polys.tiled(lattice.transform, lattice.get_position_shifts())
 		elif isinstance(element, Path) or isinstance(element, Boundary):
 			# BASE CASE
 			# Compute polygon from element
 			if isinstance(element, Path):
 				# Element is a Path object
-				polys.append(Polygon.from_gdsii_path(element))
+				return PolygonArrays.from_polygons([Polygon.from_gdsii_path(element)]).transformed(transform)
 			else:
 				# Element is a Boundary object
-				polys.append(Polygon.from_gdsii_boundary(element))
+				return PolygonArrays.from_polygons([Polygon.from_gdsii_boundary(element)]).transformed(transform)
 		# Ignore GDSII Text elements
 		# elif isinstance(element, Text):
 		elif isinstance(element, Box):
@@ -113,19 +170,182 @@ class Layout():
 		elif isinstance(element, Node):
 			print "UNSUPPORTED %s: GDSII Node elements are not supported." % (inspect.stack()[1][3])
 			sys.exit(3)
-		return polys
+		return PolygonArrays()
+
+	# Returns the lattice of array positions of an ARef (with the provided
+	# transform of the ARef's parent structure, None for the identity),
+	# e.g. to find the array positions overlapping a region with
+	# ARefLattice.query(), without expanding the array.
+	def get_aref_lattice(self, aref, transform=None):
+		return ARefLattice(aref, self.flatten_structure(aref.struct_name).compute_bbox(), transform)
+
+	# Returns the (packed) polygons of a GDSII structure, with all of its
+	# elements flattened, and the provided transform (None for the
+	# identity) applied. Polygons in the structure's own coordinate frame
+	# are memoized in the flatten cache, so a structure is only flattened
+	# once no matter how many times it is instanced, and each instance is
+	# a single (batched) transform of the cached polygons. If the cache
+	# is disabled, the transform is composed down the hierarchy instead.
+	def flatten_structure(self, struct_name, transform=None):
+		struct_polys = self.flatten_cache.get(struct_name)
+		if struct_polys == None:
+			if not self.flatten_cache.is_enabled():
+				return self.flatten_structure_elements(struct_name, transform)
+			struct_polys = self.flatten_structure_elements(struct_name)
+			self.flatten_cache.put(struct_name, struct_polys)
+		return struct_polys.transformed(transform)
+
+	# Flattens all elements of a GDSII structure (uncached).
+	def flatten_structure_elements(self, struct_name, transform=None):
+		leaf_polys   = []
+		struct_polys = []
+		for sub_element in self.gdsii_structures[struct_name]:
+			# Boundary/Path polygons are transformed in batches
+			if isinstance(sub_element, Path):
+				leaf_polys.append(Polygon.from_gdsii_path(sub_element))
+			elif isinstance(sub_element, Boundary):
+				leaf_polys.append(Polygon.from_gdsii_boundary(sub_element))
+			else:
+				struct_polys.append(PolygonArrays.from_polygons(leaf_polys).transformed(transform))
+				struct_polys.append(self.generate_polygon_arrays_from_element(sub_element, transform))
+				leaf_polys = []
+		struct_polys.append(PolygonArrays.from_polygons(leaf_polys).transformed(transform))
+		return PolygonArrays.concatenate(struct_polys)
+
+	# Loads the flattened layout geometry from the geometry cache 
+	# directory (if provided), or otherwise loads and flattens the 
+	# GDSII library, and saves the result in the cache directory.
+	# Returns a GeometryStore object.
+	def load_geometry(self, gdsii_fname, layer_map_fname, dot_fname, metal_stack_lef_fname, filter_layers=False, cache_dir=None):
+		if cache_dir != None and gdsii_fname == '-':
+			print "WARNING %s: geometry cache not supported for GDSII input from stdin." % (inspect.stack()[0][3])
+			cache_dir = None
+		if cache_dir != None:
+			print "Checking geometry cache ..."
+			start_time = time.time()
+
+			# Flattened geometry depends on the layer filter 
+			# inputs only when the layer filter is enabled
+			cache_key_fnames = [gdsii_fname, layer_map_fname]
+			if filter_layers:
+				cache_key_fnames.extend([dot_fname, metal_stack_lef_fname])
+			cache_key_params = [self.top_level_name, filter_layers]
+			if self.skip_cell_names or self.skip_cell_patterns:
+				cache_key_params.append(','.join(sorted(self.skip_cell_names) + self.skip_cell_patterns))
+			cache_key = compute_geometry_cache_key(cache_key_fnames, cache_key_params)
+			geometry  = load_cached_geometry(cache_dir, cache_key)
+			if geometry != None:
+				print "Loaded cached geometry (%s)." % (cache_key)
+				print
+				geometry.print_stats()
+				print
+			else:
+				print "Cached geometry not found (%s)." % (cache_key)
+			print "Done - Time Elapsed:", (time.time() - start_time), "seconds."
+			print "----------------------------------------------"
+			if geometry != None:
+				return geometry
+
+		self.gdsii_lib           = self.load_gdsii_library(gdsii_fname, filter_layers)
+		self.gdsii_structures    = self.index_gdsii_structures_by_name()
+		self.top_gdsii_structure = self.gdsii_structures[self.top_level_name]
+		self.srefs_to_ignore     = self.find_structures_to_ignore()
+		self.region_query        = RegionQuery(self.gdsii_structures, self.srefs_to_ignore)
+		geometry                 = self.flatten_layout()
+		if cache_dir != None:
+			save_cached_geometry(cache_dir, cache_key, geometry)
+		return geometry
+
+	# Returns the set of names of the GDSII structures whose instances
+	# (SRefs/ARefs) are never flattened, i.e. the fill (SPACER) cells
+	# of the standard cell LEF (if skipped), and all structures whose
+	# name matches one of the skipped cell (shell-style) patterns, e.g.
+	# "*DECAP*" or "TAP*".
+	def find_structures_to_ignore(self):
+		structures_to_ignore = set()
+		if self.skip_cell_names or self.skip_cell_patterns:
+			for struct_name in self.gdsii_structures.keys():
+				if struct_name == self.top_level_name:
+					continue
+				if struct_name in self.skip_cell_names or any(fnmatch.fnmatchcase(struct_name, pattern) for pattern in self.skip_cell_patterns):
+					structures_to_ignore.add(struct_name)
+			print "Skipping instances of %d GDSII structures (fill/tap/spacer cells)." % (len(structures_to_ignore))
+		return structures_to_ignore
+
+	# Flattens every element of the top-level GDSII structure (once)
+	# into a layer-partitioned geometry store that is shared by all
+	# analysis stages. Polygons of top-level Paths carrying a net name
+	# property are also indexed by net name. With multiple processes,
+	# the top-level elements are split into chunks that are flattened
+	# by a pool of worker processes, each returning a (compact) geometry
+	# store of its chunk.
+	def flatten_layout(self):
+		print "Flattening GDSII layout ..."
+		start_time = time.time()
+
+		num_elements = len(self.top_gdsii_structure)
+		if self.num_processes > 1 and num_elements > 1:
+			# Split top-level elements into (contiguous) chunks, several
+			# per process, so the load is balanced across the pool
+			chunk_size     = max(1, int(math.ceil(float(num_elements) / float(self.num_processes * FLATTEN_CHUNKS_PER_PROCESS))))
+			element_ranges = [(start, min(start + chunk_size, num_elements)) for start in range(0, num_elements, chunk_size)]
+
+			# Workers inherit the layout (and GDSII library) when forked
+			worker_pool = mp.Pool(processes=self.num_processes, initializer=init_layout_worker, initargs=(self,))
+			results     = worker_pool.map(flatten_elements_in_worker, element_ranges)
+			worker_pool.close()
+			worker_pool.join()
+			for chunk_geometry, chunk_flatten_cache in results:
+				self.flatten_cache.merge_stats(chunk_flatten_cache)
+			geometry = GeometryStore.concatenate([chunk_geometry for chunk_geometry, chunk_flatten_cache in results])
+		else:
+			geometry = self.flatten_top_level_elements(0, num_elements)
+		geometry.num_elements = num_elements
+
+		# Show flattening stats
+		print
+		geometry.print_stats()
+		self.flatten_cache.print_stats()
+		print
 
-	# Generates a list of polygons on the device layer(s).
-	# The fill cells are ignored. Device layers must be defined
-	# per process technology.
+		print "Done - Time Elapsed:", (time.time() - start_time), "seconds."
+		print "----------------------------------------------"
+		return geometry
+
+	# Flattens the top-level GDSII elements with indices in the range
+	# [start, end) into a new geometry store.
+	def flatten_top_level_elements(self, start, end):
+		geometry = GeometryStore()
+		for element_id in range(start, end):
+			element   = self.top_gdsii_structure[element_id]
+			poly_refs = geometry.add_polygon_arrays(self.generate_polygon_arrays_from_element(element), element_id)
+			if element.properties and isinstance(element, Path):
+				geometry.add_net_polygons(element.properties[0][1], poly_refs) # property 1 of Path element is the net name
+			elif (isinstance(element, SRef) or isinstance(element, ARef)) and poly_refs:
+				geometry.set_element_cell(element_id, element.struct_name)
+		return geometry
+
+	# Generates a list of polygons on the device layer(s),
+	# per top-level GDSII element. The fill cells are ignored.
+	# Device layers must be defined per process technology.
+	# Polygons are grouped by the element IDs of the device layers only,
+	# and polygon views are created one element at a time.
 	def generate_device_layer_polys(self):
-		for element in self.top_gdsii_structure:
-			device_layer_polys = []
-			polys = self.generate_polys_from_element(element)
-			for poly in polys:
-				if poly.gdsii_element.layer < self.first_metal_layer:
-					device_layer_polys.append(copy.copy(poly))
-			yield device_layer_polys
+		layer_keys  = [layer_key for layer_key in self.geometry.get_layer_keys() if layer_key[0] < self.first_metal_layer]
+		element_ids = [self.geometry.get_layer_arrays(layer_key)['element_ids'] for layer_key in layer_keys]
+
+		# (element ID, layer, polygon index) of all device layer polygons, sorted by element ID
+		layer_indices = numpy.repeat(numpy.arange(len(layer_keys), dtype=numpy.int64), [len(layer_element_ids) for layer_element_ids in element_ids])
+		poly_indices  = numpy.concatenate([numpy.arange(len(layer_element_ids), dtype=numpy.int64) for layer_element_ids in element_ids] + [numpy.zeros(0, dtype=numpy.int64)])
+		element_ids   = numpy.concatenate(element_ids + [numpy.zeros(0, dtype=numpy.int64)])
+		order         = numpy.argsort(element_ids, kind='mergesort')
+		layer_indices = layer_indices[order]
+		poly_indices  = poly_indices[order]
+		element_ends  = numpy.searchsorted(element_ids[order], numpy.arange(1, self.geometry.num_elements + 1))
+		start         = 0
+		for end in element_ends.tolist():
+			yield [self.geometry.get_polygon(layer_keys[layer_index], poly_index) for layer_index, poly_index in zip(layer_indices[start:end].tolist(), poly_indices[start:end].tolist())]
+			start = end
 
 	def update_layout_bbox(self, poly):
 		# Update UR x-coord
@@ -153,12 +373,18 @@ class Layout():
 	def compute_layout_bbox(self):
 		start_time = time.time()
 		print "Computing layout grid bounding box ..."
-		print "Number of Top-Level GDSII Elements:", len(self.top_gdsii_structure)
-
-		for element in self.top_gdsii_structure:
-			polys = self.generate_polys_from_element(element)
-			for poly in polys:
-				self.update_layout_bbox(poly)
+		print "Number of Top-Level GDSII Elements:", self.geometry.num_elements
+
+		# Answered from the (cached) bounding boxes of the GDSII
+		# structures if the GDSII library is loaded, or otherwise
+		# from the bounding boxes of the flattened polygons
+		self.bbox = BBox(Point(0, 0), Point(0, 0))
+		if self.region_query != None:
+			layout_bbox = self.region_query.compute_bbox(self.top_level_name)
+			if layout_bbox != None:
+				self.update_layout_bbox(Polygon.from_bbox(BBox(Point(to_coord(layout_bbox[0]), to_coord(layout_bbox[1])), Point(to_coord(layout_bbox[2]), to_coord(layout_bbox[3])))))
+		elif self.geometry.num_polygons > 0:
+			self.update_layout_bbox(Polygon.from_bbox(self.geometry.compute_bbox()))
 
 		print "Bounding Box of Layout (man. units):"
 		print self.bbox.get_bbox_as_list()
@@ -167,6 +393,21 @@ class Layout():
 		print "Done - Time Elapsed:", (time.time() - start_time), "seconds."
 		print "----------------------------------------------"
 
+	# Returns the (flattened) polygons overlapping a bounding box, on
+	# the provided (gds layer num, gds data type) layer keys (or on all
+	# layers if None). If the GDSII library is loaded, the query descends
+	# the GDSII hierarchy only into instances overlapping the bounding
+	# box (see region_query.py). Otherwise, the flattened geometry store
+	# is queried.
+	def query_region(self, bbox, layer_keys=None):
+		if self.region_query != None:
+			return self.region_query.query(self.top_level_name, bbox, layer_keys).to_polygons()
+		polys = []
+		for layer_key in self.geometry.get_layer_keys():
+			if layer_keys == None or layer_key in layer_keys:
+				polys.extend(self.geometry.query_polygons(layer_key, bbox))
+		return polys
+
 	# Checks if a polygon is nearby a net_segment,
 	# i.e. the polygon intersects the net_segments 
 	# "nearby" bounding box.
@@ -176,8 +417,10 @@ class Layout():
 			# Element on the same layer as net_segment
 			if poly.overlaps_bbox(net_segment.nearby_sl_bbox):
 				net_segment.nearby_sl_polygons.append(poly)
+			return
 
-		elif self.lef.is_gdsii_layer_above(net_segment.polygon.gdsii_element, poly.gdsii_element, self.layer_map):
+		layer_offset = self.layer_nums.get_layer_offset(net_segment.layer_num, poly.gdsii_element.layer, poly.gdsii_element.data_type)
+		if layer_offset == 1:
 			
 			# Element is one layer above the net_segment.
 			# Element is only considered "nearby" if it insects with the
@@ -185,7 +428,7 @@ class Layout():
 			if poly.overlaps_bbox(net_segment.nearby_al_bbox):
 				net_segment.nearby_al_polygons.append(poly)
 
-		elif self.lef.is_gdsii_layer_below(net_segment.polygon.gdsii_element, poly.gdsii_element, self.layer_map):
+		elif layer_offset == -1:
 			
 			# Element is either one layer below the net_segment.
 			# Element is only considered "nearby" if it insects with the
@@ -193,33 +436,110 @@ class Layout():
 			if poly.overlaps_bbox(net_segment.nearby_bl_bbox):
 				net_segment.nearby_bl_polygons.append(poly)
 
+	# Returns the list of nearby polygons of the net_segment, and the 
+	# corresponding "nearby" bounding box, that polygons on the provided
+	# GDSII layer (number, data type) are nearby candidates for. Returns
+	# (None, None) if polygons on the layer can never be nearby. The 
+	# layer classification is identical to the one in is_polygon_nearby().
+	def get_nearby_polygons_of_layer(self, net_segment, layer_key):
+		if net_segment.polygon.gdsii_element.layer == layer_key[0]:
+			return net_segment.nearby_sl_polygons, net_segment.nearby_sl_bbox
+		layer_offset = self.layer_nums.get_layer_offset(net_segment.layer_num, layer_key[0], layer_key[1])
+		if layer_offset == 1:
+			return net_segment.nearby_al_polygons, net_segment.nearby_al_bbox
+		elif layer_offset == -1:
+			return net_segment.nearby_bl_polygons, net_segment.nearby_bl_bbox
+		return None, None
+
 	# Extracts a list of GDSII elements (converted to polygon objects) that are in close
 	# proimity to a given security-critical net segement. This is doen by finding all 
 	# polygons that overlap the nearby-bounding-box of the critical net_segment object.
 	# By only examining nearby elements, the runtime of this tool significantly descreases.
-	def extract_nearby_polygons(self):
+	# Nearby polygons are found with range queries on per-layer spatial indices.
+	# Polygons on the layers above/below net segments are only extracted if
+	# adjacent_layers is True (see net_blockage.is_stamping_cells()).
+	def extract_nearby_polygons(self, adjacent_layers=True):
 		start_time = time.time()
 		print "Extracting polygons near critical nets ..."
 
-		for element in self.top_gdsii_structure:
-			polys = self.generate_polys_from_element(element)
-			for net in self.critical_nets:
-				for net_segment in net.segments:
-					for poly in polys:
-						self.is_polygon_nearby(net_segment, poly)
+		for net in self.critical_nets:
+			for net_segment in net.segments:
+				self.add_nearby_polygons(net_segment, self.find_nearby_polygon_indices(net_segment, adjacent_layers))
+
+		print "Done - Time Elapsed:", (time.time() - start_time), "seconds."
+		print "----------------------------------------------"
+
+	# Same as extract_nearby_polygons(), but the spatial join is
+	# partitioned by critical net across a pool of worker processes.
+	# Workers inherit the layout (geometry store and spatial indices)
+	# when forked, instead of receiving pickled copies, and only send
+	# back the (layer key, polygon index) lists of nearby polygons,
+	# which are then turned into polygon views and merged into the
+	# net segments' nearby polygon lists (in the serial order).
+	def extract_nearby_polygons_parallel(self, adjacent_layers=True):
+		num_nets = len(self.critical_nets)
+		if self.num_processes <= 1 or num_nets <= 1:
+			self.extract_nearby_polygons(adjacent_layers)
+			return
+		start_time = time.time()
+		print "Extracting polygons near critical nets (%d processes) ..." % (self.num_processes)
+
+		# Build spatial indices before forking, so they are shared
+		for layer_key in self.geometry.get_layer_keys():
+			self.geometry.get_spatial_index(layer_key)
+
+		# Split critical nets into (contiguous) chunks, several per process
+		chunk_size  = max(1, int(math.ceil(float(num_nets) / float(self.num_processes * FLATTEN_CHUNKS_PER_PROCESS))))
+		net_ranges  = [(start, min(start + chunk_size, num_nets)) for start in range(0, num_nets, chunk_size)]
+		worker_pool = mp.Pool(processes=self.num_processes, initializer=init_layout_worker, initargs=(self,))
+		results     = worker_pool.map(ft.partial(extract_nearby_polygons_in_worker, adjacent_layers=adjacent_layers), net_ranges)
+		worker_pool.close()
+		worker_pool.join()
+
+		# Merge nearby polygons into net segments
+		for net_range, range_indices in zip(net_ranges, results):
+			for net, net_indices in zip(self.critical_nets[net_range[0]:net_range[1]], range_indices):
+				for net_segment, nearby_indices in zip(net.segments, net_indices):
+					self.add_nearby_polygons(net_segment, nearby_indices)
 
 		print "Done - Time Elapsed:", (time.time() - start_time), "seconds."
 		print "----------------------------------------------"
 
+	# Returns a list of (layer key, list of polygon indices) tuples of the
+	# polygons, per layer, nearby a net segment, i.e. overlapping the
+	# segment's nearby bounding box of the layer's type (same/above/below
+	# layer, see get_nearby_polygons_of_layer()). Layers above/below the
+	# segment are skipped unless adjacent_layers is True.
+	def find_nearby_polygon_indices(self, net_segment, adjacent_layers=True):
+		nearby_indices = []
+		for layer_key in self.geometry.get_layer_keys():
+			nearby_polys, nearby_bbox = self.get_nearby_polygons_of_layer(net_segment, layer_key)
+			if nearby_polys != None and (adjacent_layers or nearby_polys is net_segment.nearby_sl_polygons):
+				nearby_indices.append((layer_key, self.geometry.get_spatial_index(layer_key).query(nearby_bbox)))
+		return nearby_indices
+
+	# Adds the polygons found by find_nearby_polygon_indices() to the
+	# nearby polygon lists of a net segment.
+	def add_nearby_polygons(self, net_segment, nearby_indices):
+		for layer_key, poly_indices in nearby_indices:
+			nearby_polys, nearby_bbox = self.get_nearby_polygons_of_layer(net_segment, layer_key)
+			nearby_polys.extend([self.geometry.get_polygon(layer_key, poly_index) for poly_index in poly_indices])
+
 	# Loads GDSII structures elements into a dictionary
 	# keyed by structure name to allow for efficient
-	# structure object lookups.
+	# structure object lookups. If the structures were
+	# indexed by byte offset, the (lazy) structure index
+	# is returned instead.
 	def index_gdsii_structures_by_name(self):
 		# Check that GDSII library has been loaded
 		if self.gdsii_lib == None:
 			print "ERROR %s: must load GDSII library before indexing GDSII structures." % (inspect.stack()[0][3])
 			sys.exit(1)
 
+		# Structures are decoded on demand
+		if self.gdsii_struct_index != None:
+			return self.gdsii_struct_index
+
 		# Load GDSII structures in a dictionary
 		gdsii_structures_index = {}
 		for structure in self.gdsii_lib:
@@ -240,22 +560,11 @@ class Layout():
 		critical_nets  = []
 		critical_paths = {}
 
-		# Extract path structures from GDSII file
-		for structure in self.gdsii_lib:
-			if structure.name == self.top_level_name:
-				for element in structure:
-					if element.properties and isinstance(element, Path): # <-- for only analyzing PATHS not BOUNDARIES (vias)
-						net_name = element.properties[0][1] # property 1 of Path element is the net name
-						if net_name in critical_paths:
-							critical_polys = self.generate_polys_from_element(element)
-							critical_paths[net_name].extend(critical_polys)
-						else:
-							# Check if path is critical or not
-							path_basename = net_name.split('/')[-1].split('[')[0]
-							if path_basename in critical_net_names.values():
-								critical_polys = self.generate_polys_from_element(element)
-								critical_paths[net_name] = critical_polys
-				break
+		# Extract (top-level) path polygons from the geometry store,
+		# looking up critical nets by basename
+		# <-- for only analyzing PATHS not BOUNDARIES (vias)
+		for net_name in self.geometry.get_net_names_by_basename(set(critical_net_names.values())):
+			critical_paths[net_name] = self.geometry.get_net_polygons(net_name)
 
 		# Initialize Net Objects
 		for net_name in critical_paths.keys():
@@ -350,28 +659,94 @@ class Layout():
 		print "----------------------------------------------"
 		return nets
 
-	# Loads entire circuit layout from GDSII file. 
+	# Loads circuit layout from GDSII file. If filter_layers is set,
+	# elements on layers that are neither a critical net layer, nor
+	# directly above/below one, are skipped while reading. If the file 
+	# can be memory mapped, only the library header is read, and the 
+	# structures are indexed by byte offset (self.gdsii_struct_index),
+	# to be decoded when first referenced. The byte offsets are persisted
+	# next to the GDSII file, so later runs do not re-scan the file.
 	# Returns a GDSII library object.
-	def load_gdsii_library(self, gdsii_fname):
+	def load_gdsii_library(self, gdsii_fname, filter_layers=False):
 		print "Loading GDSII file ..."
 		start_time = time.time()
 
-		# Open GDSII File
-		with open(gdsii_fname, 'rb') as stream:
-		    lib = Library.load(stream)
+		# Open GDSII File (compressed files and stdin are decompressed/read
+		# by a background thread, see gdsii_stream.py)
+		stream = open_gdsii_stream(gdsii_fname)
+		if is_oasis_stream(stream):
+			# OASIS input (see oasis_reader.py) is decoded into the same
+			# GDSII library objects
+			if filter_layers:
+				# Layer filter needs to scan the top-level structure first
+				print "WARNING %s: layer filter not supported for OASIS input; loading all layers." % (inspect.stack()[0][3])
+			reader = OASISReader(read_oasis_data(stream))
+			lib    = reader.read_library()
+		else:
+			reader = GDSIIReader(stream)
+			if reader.is_memory_mapped():
+				lib     = reader.read_library_header()
+				offsets = load_structure_offsets(gdsii_fname)
+				if offsets == None:
+					offsets = reader.index_structures()
+					save_structure_offsets(gdsii_fname, offsets)
+				layer_filter = None
+				if filter_layers and self.top_level_name in offsets:
+					layer_filter = self.get_gdsii_layer_filter(reader, offsets[self.top_level_name])
+				self.gdsii_struct_index = GDSIIStructureIndex(reader, offsets, layer_filter)
+			else:
+				if filter_layers and is_gdsii_stream_seekable(stream):
+					lib = reader.read_library(self.get_gdsii_layer_filter(reader))
+				else:
+					if filter_layers:
+						# Layer filter needs a second pass over the GDSII stream
+						print "WARNING %s: layer filter not supported for compressed or piped GDSII input; loading all layers." % (inspect.stack()[0][3])
+					lib = reader.read_library()
+				reader.close()
 
 		# Close GDSII File
 		stream.close()
 
 		# Show GDSII Stats
 		print
-		dbg.debug_print_gdsii_stats(lib)
+		if self.gdsii_struct_index != None:
+			self.gdsii_struct_index.print_stats()
+		else:
+			dbg.debug_print_gdsii_stats(lib)
+			reader.print_stats()
 		print
 
 		print "Done - Time Elapsed:", (time.time() - start_time), "seconds."
 		print "----------------------------------------------"
 		return lib
 
+	# Scans the top-level GDSII structure for the layers of the critical
+	# net paths, and returns a function that determines if a GDSII layer
+	# (layer number and data type) is needed to compute the net blockage 
+	# metric, i.e. if it is on the same GDSII layer as a critical net, 
+	# or directly above/below the (logical) layer of a critical net.
+	def get_gdsii_layer_filter(self, reader, top_structure_offset=0):
+		critical_gds_layer_nums = set()
+		needed_layer_nums       = set()
+		critical_basenames      = set(self.critical_net_names.values())
+		path_properties         = reader.scan_path_properties(self.top_level_name, top_structure_offset)
+		for net_name, layer_keys in path_properties.iteritems():
+			if get_net_basename(net_name) in critical_basenames:
+				for gds_layer_num, gds_data_type in layer_keys:
+					critical_gds_layer_nums.add(gds_layer_num)
+					layer_num = self.layer_nums.get_layer_num(gds_layer_num, gds_data_type)
+					if layer_num != -1:
+						needed_layer_nums.add(layer_num - 1)
+						needed_layer_nums.add(layer_num + 1)
+
+		def is_layer_needed(gds_layer_num, gds_data_type):
+			if gds_layer_num in critical_gds_layer_nums:
+				return True
+			return self.layer_nums.get_layer_num(gds_layer_num, gds_data_type) in needed_layer_nums
+
+		print "Critical net GDSII layers: %s" % (sorted(critical_gds_layer_nums))
+		return is_layer_needed
+
 	# Loads entire layer map file for technology node. 
 	# Returns a dictionary of the following format:
 	# Key<gdsii layer number> --> Value< Key<data type> --> Value <layer name> >
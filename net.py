@@ -7,15 +7,16 @@ from polygon import *
 # Other Imports
 import inspect
 import sys
-import copy
 
-class Window():
+class Window(object):
+	__slots__ = ('initial_start_pt', 'width', 'height', 'direction', 'window')
+
 	def __init__(self, start_pt, width, height, direction):
-		self.initial_start_pt = start_pt
+		self.initial_start_pt = Point(start_pt.x, start_pt.y)
 		self.width            = width
 		self.height           = height
 		self.direction        = direction
-		self.window           = LineSegment(copy.deepcopy(start_pt), Point.from_point_and_offset(start_pt, width, height))
+		self.window           = LineSegment(Point(start_pt.x, start_pt.y), Point.from_point_and_offset(start_pt, width, height))
 
 	@classmethod
 	def from_bbox(cls, bbox, direction):
@@ -34,7 +35,7 @@ class Window():
 		self.reset_y_position()
 
 	def get_start_pt_copy(self):
-		return copy.deepcopy(self.window.p1)
+		return Point(self.window.p1.x, self.window.p1.y)
 
 	def get_start_pt(self):
 		return self.window.p1
@@ -103,7 +104,14 @@ class Net():
 			if layer_num != -1:
 				self.segments.append(Net_Segment(i + 1, self.basename, net_element_polygon, lef, layer_num, layer_name))
 
-class Net_Segment():
+class Net_Segment(object):
+	__slots__ = ('num', 'net_basename', 'layer_num', 'layer_name', 'layer_direction', 'polygon',
+	             'nearby_sl_bbox', 'nearby_al_bbox', 'nearby_bl_bbox',
+	             'nearby_sl_polygons', 'nearby_al_polygons', 'nearby_bl_polygons',
+	             'sides_unblocked', 'unblocked_windows',
+	             'same_layer_units_blocked', 'diff_layer_units_blocked',
+	             'same_layer_units_checked', 'diff_layer_units_checked', 'diff_layer_units_error', 'nb_compute_time')
+
 	def __init__(self, num, net_basename, poly, lef, layer_num, layer_name):
 		self.num                 = num
 		self.net_basename        = net_basename
@@ -129,11 +137,12 @@ class Net_Segment():
 		self.diff_layer_units_blocked = 0 # top/bottom area units blocked
 		self.same_layer_units_checked = 0 # locations valid rogue wires can be attached around wire perimeter
 		self.diff_layer_units_checked = 0 # locations valid rogue wires can be attached along wire top/bottom
+		self.diff_layer_units_error   = 0 # bound on top/bottom units blocked error at a coarse raster resolution
 		self.nb_compute_time          = 0
 	
 	def compute_center_line(self, routing_direction): 
-		p1 = copy.deepcopy(self.polygon.bbox.ll)
-		p2 = copy.deepcopy(self.polygon.bbox.ur)
+		p1 = Point(self.polygon.bbox.ll.x, self.polygon.bbox.ll.y)
+		p2 = Point(self.polygon.bbox.ur.x, self.polygon.bbox.ur.y)
 
 		if routing_direction == "H":
 			# Routing Direction is HORIZONTAL
@@ -150,7 +159,7 @@ class Net_Segment():
 		return LineSegment(p1, p2)
 
 	def get_center_line(self):
-		if self.polygon.num_coords == 5:
+		if self.polygon.is_rect:
 			if   self.polygon.bbox.get_width() > self.polygon.bbox.get_height():
 				# Routing Direction is HORIZONTAL
 				center_line = self.compute_center_line("H")
@@ -7,15 +7,16 @@ import debug_prints as dbg
 from polygon import *
 from net     import *
 from layout  import *
+from cell_stamps import *
+from run_length_bitmap import *
 
 # Other Imports
 import time
 import sys
+import math
 import inspect
-import copy
 import numpy
 import multiprocessing as mp
-import functools as ft
 
 # Import matplotlib
 # import matplotlib.pyplot as plt
@@ -26,53 +27,199 @@ import functools as ft
 # 3 = Unhandled feature
 # 4 = Usage Error
 
+# Min. number of pixels of an adjacent layer bitmap stored as a run-length
+# bitmap (see run_length_bitmap.py) instead of a dense numpy array
+SPARSE_BITMAP_MIN_PIXELS = 1 << 22
+
+# Max. number of (full resolution) pixels of a band of rows of a stamped
+# adjacent layer bitmap (see stamp_nearby_bitmap())
+STAMP_BAND_MAX_PIXELS = 1 << 20
+
+# Layout and cell stamper (see cell_stamps.py) of a net blockage worker
+# process (see init_net_blockage_worker()), inherited when forked
+blockage_worker_layout  = None
+blockage_worker_stamper = None
+
 # ------------------------------------------------------------------
 # Critical Net Blockage Metric
 # ------------------------------------------------------------------
-# Color adjacent layer bitmap by setting bits inside any polygon to 1
-def color_bitmap_al(bitmap, offset, poly):	
-	for row in range(bitmap.shape[0]):
-		for col in range(bitmap.shape[1]):
-			if poly.is_point_inside(Point(col + offset.x + 0.5, row + offset.y + 0.5)):
-				bitmap[row, col] = 1
-
-# Color same layer bitmap by setting bits inside any polygon to 1
+# Returns the raster resolution (database units per pixel) of the net
+# blockage bitmaps of the (adjacent) layer, set by the net blockage
+# resolution of the layout (see is_raster_resolution()):
+# <number>  = number of database units
+# grid      = manufacturing grid of the LEF
+# pitch/<n> = 1/n of the layer's pitch
+# rounded to the nearest database unit. A LEF without manufacturing
+# grid (0) gives full resolution (1 database unit).
+def get_raster_resolution(layout, layer_num):
+	spec = str(layout.net_blockage_resolution)
+	if spec == 'grid':
+		resolution = layout.lef.manufacturing_grid * layout.lef.database_units
+	elif spec.startswith('pitch/'):
+		resolution = (layout.lef.layers[layer_num].pitch * layout.lef.database_units) / float(spec[len('pitch/'):])
+	else:
+		resolution = int(spec)
+	return max(1, int(round(resolution)))
+
+# Returns True if the string is a valid net blockage resolution (see
+# get_raster_resolution()). Otherwise, returns False.
+def is_raster_resolution(spec):
+	if spec == 'grid':
+		return True
+	elif spec.startswith('pitch/'):
+		try:
+			return float(spec[len('pitch/'):]) > 0
+		except ValueError:
+			return False
+	else:
+		return spec.isdigit() and int(spec) > 0
+
+# Returns the pixels of a (num_rows x num_cols) bitmap, with the LL pixel
+# at offset, inside a polygon, as (row start, row end, col start, col end,
+# mask): the range of pixels whose centers are within the polygon's
+# bounding box, and the pixels of that range inside the polygon (see
+# Polygon.are_coords_inside()), or None for rectangles, whose bbox is
+# entirely inside. Returns None if the range is empty.
+def rasterize_polygon(num_rows, num_cols, offset, poly):
+	# Pixel centers within the polygon's bbox (closed)
+	col_start = max(0, int(math.floor(poly.bbox.ll.x - offset.x - 0.5)))
+	col_end   = min(num_cols, int(math.ceil(poly.bbox.ur.x - offset.x - 0.5)) + 1)
+	row_start = max(0, int(math.floor(poly.bbox.ll.y - offset.y - 0.5)))
+	row_end   = min(num_rows, int(math.ceil(poly.bbox.ur.y - offset.y - 0.5)) + 1)
+	if col_start >= col_end or row_start >= row_end:
+		return None
+	x_coords  = numpy.arange(col_start, col_end) + offset.x + 0.5
+	y_coords  = numpy.arange(row_start, row_end) + offset.y + 0.5
+	col_inds  = numpy.nonzero((x_coords >= poly.bbox.ll.x) & (x_coords <= poly.bbox.ur.x))[0]
+	row_inds  = numpy.nonzero((y_coords >= poly.bbox.ll.y) & (y_coords <= poly.bbox.ur.y))[0]
+	if len(col_inds) == 0 or len(row_inds) == 0:
+		return None
+	mask = None
+	if not poly.is_rect:
+		mask = poly.are_points_inside(x_coords[col_inds[0]:col_inds[-1] + 1][numpy.newaxis, :], y_coords[row_inds[0]:row_inds[-1] + 1][:, numpy.newaxis])
+	return (row_start + row_inds[0], row_start + row_inds[-1] + 1, col_start + col_inds[0], col_start + col_inds[-1] + 1, mask)
+
+# Color adjacent layer bitmap by setting bits inside any polygon to 1.
+# A bit is inside if its pixel center is (see Polygon.are_coords_inside()).
+# Only the pixels whose centers are within the polygon's bounding box are
+# checked: rectangles are filled with a single slice assignment, other
+# polygons are tested at all these pixel centers at once.
+def color_bitmap_al(bitmap, offset, poly):
+	raster = rasterize_polygon(bitmap.shape[0], bitmap.shape[1], offset, poly)
+	if raster != None:
+		row_start, row_end, col_start, col_end, mask = raster
+		if mask is None:
+			bitmap[row_start:row_end, col_start:col_end] = 1
+		else:
+			bitmap[row_start:row_end, col_start:col_end] |= mask
+
+# Same as color_bitmap_al(), but for a (dense or run-length) bitmap at a
+# coarser raster resolution (see get_raster_resolution()) of a (num_rows
+# x num_cols) database unit region: a bit is set if any of the
+# (resolution x resolution) database unit pixels it covers, within the
+# region, would be set at full resolution, so blockages are never missed.
+def color_coarse_bitmap_al(bitmap, offset, poly, resolution, num_rows, num_cols):
+	raster = rasterize_polygon(num_rows, num_cols, offset, poly)
+	if raster != None:
+		row_start, row_end, col_start, col_end, mask = raster
+		if mask is not None and resolution > 1:
+			mask = downsample_bitmap(mask, resolution, row_start % resolution, col_start % resolution)
+		coarse_rows = slice(row_start // resolution, ((row_end - 1) // resolution) + 1)
+		coarse_cols = slice(col_start // resolution, ((col_end - 1) // resolution) + 1)
+		if isinstance(bitmap, RunLengthBitmap):
+			if mask is None:
+				bitmap.fill(coarse_rows.start, coarse_rows.stop, coarse_cols.start, coarse_cols.stop)
+			else:
+				bitmap.fill_mask(coarse_rows.start, coarse_cols.start, mask)
+		elif mask is None:
+			bitmap[coarse_rows, coarse_cols] = 1
+		else:
+			bitmap[coarse_rows, coarse_cols] |= mask
+
+# Returns the bitmap at a coarser raster resolution: each bit is the OR
+# of (resolution x resolution) bits, starting row_phase rows and
+# col_phase cols before the LL bit of the bitmap (missing bits are 0).
+def downsample_bitmap(bitmap, resolution, row_phase=0, col_phase=0):
+	num_rows = -(-(bitmap.shape[0] + row_phase) // resolution)
+	num_cols = -(-(bitmap.shape[1] + col_phase) // resolution)
+	padded   = numpy.zeros(shape=(num_rows * resolution, num_cols * resolution), dtype=bool)
+	padded[row_phase:row_phase + bitmap.shape[0], col_phase:col_phase + bitmap.shape[1]] = bitmap
+	return padded.reshape((num_rows, resolution, num_cols, resolution)).any(axis=3).any(axis=1)
+
+# Color same layer bitmap by setting bits inside any polygon to 1. The
+# perimeter is scanned at sites every step size units, from the current
+# pitch/overlap points up to the end pitch point, and the (step size)
+# bits of a site are set if its pitch or overlap point is inside any
+# polygon. Instead of stepping through all sites, only the sites within
+# each polygon's extent along the scan direction are visited: filled
+# with a single slice assignment for rectangles, or tested at once for
+# other polygons (see Polygon.are_points_inside()).
 def color_bitmap_sl(bitmap, curr_pitch_pt, curr_overlap_pt, end_pitch_pt, nearby_polys, layout, direction):	
-	num_sites = max(bitmap.shape[0], bitmap.shape[1])
 	step_size = layout.net_blockage_step
-	sites_ind = 0
-	while curr_pitch_pt != end_pitch_pt:
-		for poly in nearby_polys:
-			if poly.is_point_inside(curr_pitch_pt) or poly.is_point_inside(curr_overlap_pt):
-				for i in range(sites_ind, min(sites_ind + layout.net_blockage_step, num_sites)):
-					if direction == 'N' or direction == 'S':
-						bitmap[0, i] = 1
-					elif direction == 'E' or direction == 'W':
-						bitmap[i, 0] = 1
-					else:
-						print "ERROR %s: unknown scan direction (%s)." % (inspect.stack()[0][3], direction)
-						sys.exit(4)
-				break
+	if direction == 'N' or direction == 'S':
+		bits         = bitmap[0, :]
+		start_coord  = curr_pitch_pt.x
+		end_coord    = end_pitch_pt.x
+		fixed_coords = [curr_pitch_pt.y, curr_overlap_pt.y]
+	elif direction == 'E' or direction == 'W':
+		bits         = bitmap[:, 0]
+		start_coord  = curr_pitch_pt.y
+		end_coord    = end_pitch_pt.y
+		fixed_coords = [curr_pitch_pt.x, curr_overlap_pt.x]
+	else:
+		print "ERROR %s: unknown scan direction (%s)." % (inspect.stack()[0][3], direction)
+		sys.exit(4)
+	num_sites     = max(0, int(math.ceil(float(end_coord - start_coord) / step_size)))
+	sites_blocked = numpy.zeros(num_sites, dtype=bool)
 
+	for poly in nearby_polys:
 		if direction == 'N' or direction == 'S':
-			curr_pitch_pt.shift(step_size, 0)
-			curr_overlap_pt.shift(step_size, 0)
-		elif direction == 'E' or direction == 'W':
-			curr_pitch_pt.shift(0, step_size)
-			curr_overlap_pt.shift(0, step_size)
+			scan_min, scan_max   = poly.bbox.ll.x, poly.bbox.ur.x
+			fixed_min, fixed_max = poly.bbox.ll.y, poly.bbox.ur.y
 		else:
-			print "ERROR %s: unknown scan direction (%s)." % (inspect.stack()[0][3], direction)
-			sys.exit(4)
-
-		sites_ind += step_size
+			scan_min, scan_max   = poly.bbox.ll.y, poly.bbox.ur.y
+			fixed_min, fixed_max = poly.bbox.ll.x, poly.bbox.ur.x
+
+		# Pitch/overlap lines crossing the polygon's extent
+		poly_fixed_coords = [fixed_coord for fixed_coord in fixed_coords if fixed_coord >= fixed_min and fixed_coord <= fixed_max]
+		if not poly_fixed_coords:
+			continue
+
+		# Sites within the polygon's extent along the scan direction
+		site_start = max(0, int(math.floor(float(scan_min - start_coord) / step_size)))
+		site_end   = min(num_sites, int(math.ceil(float(scan_max - start_coord) / step_size)) + 1)
+		if site_start >= site_end:
+			continue
+		scan_coords = start_coord + (numpy.arange(site_start, site_end) * step_size)
+		if poly.is_rect:
+			site_inds = numpy.nonzero((scan_coords >= scan_min) & (scan_coords <= scan_max))[0]
+			if len(site_inds) > 0:
+				sites_blocked[site_start + site_inds[0]:site_start + site_inds[-1] + 1] = 1
+		else:
+			for fixed_coord in poly_fixed_coords:
+				if direction == 'N' or direction == 'S':
+					sites_blocked[site_start:site_end] |= poly.are_points_inside(scan_coords, fixed_coord)
+				else:
+					sites_blocked[site_start:site_end] |= poly.are_points_inside(fixed_coord, scan_coords)
 
+	# Every site covers step size bits
+	num_bits        = min(len(bits), num_sites * step_size)
+	bits[:num_bits] = numpy.repeat(sites_blocked, step_size)[:num_bits]
 	return bitmap
 
 # Computes number of bits colored 
 def bits_colored(bitmap):
 	return numpy.count_nonzero(bitmap)
 	
-def compute_windows_blocked(bitmap, layout, net_segment, offset, side, num_nearby_polys):
+# Counts the scan window positions (windows scanned) and the positions
+# with any bit set (windows blocked) of a bitmap, and records runs of
+# open windows as unblocked windows of the net segment's side. Adjacent
+# layer (T/B) bitmaps can be at a coarser raster resolution (see
+# get_raster_resolution()): the window sizes are then rounded up to
+# whole pixels, the counts and unblocked windows are scaled back to
+# database units, and a bound on the error of the windows blocked (vs.
+# full resolution) is added to the net segment's diff_layer_units_error.
+def compute_windows_blocked(bitmap, layout, net_segment, offset, side, num_nearby_polys, resolution=1):
 	windows_scanned        = 0
 	windows_blocked        = 0
 	num_rows               = bitmap.shape[0]
@@ -88,6 +235,10 @@ def compute_windows_blocked(bitmap, layout, net_segment, offset, side, num_nearb
 		# Get minimum wire width/spacing constraints for the adjacent layer
 		min_wire_width      = layout.lef.layers[net_segment.layer_num - 1].min_width_db
 		required_open_width = layout.lef.layers[net_segment.layer_num - 1].rogue_wire_width
+	if side == 'T' or side == 'B':
+		# Required open width in (coarse) bitmap pixels
+		required_open_width_db = required_open_width
+		required_open_width    = -(-required_open_width // resolution)
 
 	# Configure Scan Window
 	if side == 'N' or side == 'S':
@@ -132,6 +283,10 @@ def compute_windows_blocked(bitmap, layout, net_segment, offset, side, num_nearb
 			else:
 				print "UNSUPPORTED %s: routing direction is not H or V." % (inspect.stack()[0][3])
 				sys.exit(3)	
+
+	# Every window position of a coarse bitmap stands for (resolution)
+	# positions along each axis the window slides along
+	windows_scale = (resolution if scan_window.width < num_cols else 1) * (resolution if scan_window.height < num_rows else 1)
 	
 	# ---------------------------------------
 	# Eearly Termination Optimizations
@@ -144,79 +299,166 @@ def compute_windows_blocked(bitmap, layout, net_segment, offset, side, num_nearb
 		elif side == 'B':
 			net_segment.unblocked_windows[side].append(Window.from_bbox(net_segment.nearby_bl_bbox, scan_window.direction))
 		elif side == 'N' or side == 'S':
-			net_segment.unblocked_windows[side].append(Window(copy.deepcopy(offset), num_cols, 1, 'H'))
+			net_segment.unblocked_windows[side].append(Window(offset, num_cols, 1, 'H'))
 		elif side == 'E' or side == 'W':
-			net_segment.unblocked_windows[side].append(Window(copy.deepcopy(offset), 1, num_rows, 'V'))
+			net_segment.unblocked_windows[side].append(Window(offset, 1, num_rows, 'V'))
 		else:
 			print "UNSUPPORTED %s: side to scan is invalid." % (inspect.stack()[0][3])
 			sys.exit(3)	
-		return windows_scanned_precompute, 0
+		return windows_scanned_precompute * windows_scale, 0
 	# ---------------------------------------
 
-	# Keep track of patching points
-	prev_window_blocked = True
-	unblocked_window    = None
-
-	# print "			Window Start:"
-	# scan_window.print_window()	
-	# print "			Num. Cols/Rows:", num_cols, "/", num_rows
-
-	# Scan bitmap rows
-	while scan_window.get_end_pt().y <= num_rows:
-		# Reset scan window X position
-		scan_window.reset_x_position()
-		
-		# Scan bitmap cols
-		while scan_window.get_end_pt().x <= num_cols:
-			if scan_window.get_bitmap_splice(bitmap).any():
-				# Current Window is BLOCKED
-				windows_blocked += 1
-				prev_window_blocked = True
-
-				# If end of OPEN window, save
-				if unblocked_window:
-					# Adjust window location to real location on chip
-					unblocked_window.offset(offset) 
-
-					# Append window to list of unblocked windows
-					net_segment.unblocked_windows[side].append(unblocked_window) 
-					unblocked_window = None
-			
-			elif prev_window_blocked:
-				# Previous Window is BLOCKED and Current Window is OPEN
-				prev_window_blocked = False		
-				unblocked_window    = Window(scan_window.get_start_pt_copy(), scan_window.width, scan_window.height, scan_window.direction)
-			
-			else: 
-				# Previous Window is OPEN and Current Window is OPEN
-				if scan_window.direction == 'H':
-					unblocked_window.increase_width(1)
-				elif scan_window.direction == 'V':
-					unblocked_window.increase_height(1)
-				else:
-					print "UNSUPPORTED %s: wire patching direction." % (inspect.stack()[0][3], token)
-					sys.exit(3)
-
-			windows_scanned += 1
-			scan_window.shift_horizontal(1)
-		scan_window.shift_vertical(1)
+	# Run-length bitmaps are scanned by their occupancy intervals if the
+	# window spans all of their rows (or cols)
+	if isinstance(bitmap, RunLengthBitmap):
+		if scan_window.height == num_rows or scan_window.width == num_cols:
+			windows_scanned, windows_blocked = scan_run_length_bitmap(bitmap, scan_window, net_segment, offset, side, resolution, required_open_width_db)
+			return windows_scanned * windows_scale, windows_blocked * windows_scale
+		bitmap = bitmap.to_bitmap()
+
+	# Number of bits set in every scan window position, from the
+	# summed-area table of the bitmap: window (row, col) covers bitmap
+	# rows [row, row + height) and cols [col, col + width).
+	win_width       = scan_window.width
+	win_height      = scan_window.height
+	num_win_rows    = max(0, num_rows - win_height + 1)
+	num_win_cols    = max(0, num_cols - win_width + 1)
+	windows_scanned = num_win_rows * num_win_cols
+	if windows_scanned == 0:
+		return 0, 0
+	sum_dtype   = numpy.int32 if bitmap.size < (1 << 31) else numpy.int64
+	bits_summed = numpy.zeros(shape=(num_rows + 1, num_cols + 1), dtype=sum_dtype)
+	numpy.cumsum(numpy.cumsum(bitmap, axis=0, dtype=sum_dtype), axis=1, out=bits_summed[1:, 1:])
+	window_bits = bits_summed[win_height:, win_width:] - bits_summed[:num_win_rows, win_width:] - bits_summed[win_height:, :num_win_cols] + bits_summed[:num_win_rows, :num_win_cols]
+	windows_open    = (window_bits == 0)
+	windows_blocked = windows_scanned - int(numpy.count_nonzero(windows_open))
+	del bits_summed, window_bits
+
+	# Runs of consecutive OPEN windows (scanned row by row) are patched
+	# into one unblocked window, widened (H) or heightened (V) by one
+	# unit per additional window position in the run.
+	open_edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([False], windows_open.ravel(), [False])).astype(numpy.int8)))
+	run_starts = open_edges[0::2]
+	run_ends   = open_edges[1::2]
+	for run_start, run_length in zip(run_starts.tolist(), (run_ends - run_starts).tolist()):
+		row, col = divmod(run_start, num_win_cols)
+		if scan_window.direction == 'H':
+			window_width  = win_width + run_length - 1
+			window_height = win_height
+		elif scan_window.direction == 'V':
+			window_width  = win_width
+			window_height = win_height + run_length - 1
+		else:
+			print "UNSUPPORTED %s: wire patching direction." % (inspect.stack()[0][3])
+			sys.exit(3)
+		unblocked_window = Window(Point(col * resolution, row * resolution), window_width * resolution, window_height * resolution, scan_window.direction)
 
-	if unblocked_window:
 		# Adjust window location to real location on chip
 		unblocked_window.offset(offset) 
 
 		# Append window to list of unblocked windows
 		net_segment.unblocked_windows[side].append(unblocked_window) 
-		unblocked_window = None
 
-	# print "			Window End:"
-	# scan_window.print_window()
+	# Bound the error of the coarse windows blocked
+	if resolution > 1:
+		net_segment.diff_layer_units_error += get_raster_error_bound(bitmap, windows_open, scan_window.direction, required_open_width_db, resolution)
+
 	# print "			Windows Blocked: %d / %d" % (windows_blocked, windows_scanned)
 	# print "			Windows Precomputed:  %d" % (windows_scanned_precompute)
 
-	return windows_scanned, windows_blocked
+	return windows_scanned * windows_scale, windows_blocked * windows_scale
+
+# Returns an upper bound on the difference between the windows blocked
+# counted by compute_windows_blocked() on a coarse (adjacent layer)
+# bitmap, scaled to database units, and on the full resolution bitmap,
+# for windows (window_width_db database units wide) sliding along one
+# axis of the bitmap. The (resolution) positions a coarse position
+# stands for can only be misclassified if the coarse window is blocked
+# by pixels at its ends only (no bits set in the pixels fully covered by
+# the windows of all these positions), or if it is open and the next
+# position is blocked; in addition, the last coarse positions can stand
+# for up to 2 * (resolution - 1) positions past the full resolution scan.
+def get_raster_error_bound(bitmap, windows_open, direction, window_width_db, resolution):
+	if windows_open.size == 1:
+		# Window covers the entire bitmap
+		return 0 if windows_open[0, 0] else (resolution - 1)
+	if direction == 'H':
+		occupancy       = bitmap.any(axis=0)
+		windows_blocked = ~windows_open[0, :]
+	else:
+		occupancy       = bitmap.any(axis=1)
+		windows_blocked = ~windows_open[:, 0]
+	bits_summed     = numpy.concatenate(([0], numpy.cumsum(occupancy)))
+	positions       = numpy.arange(len(windows_blocked))
+	num_covered     = window_width_db // resolution
+	bits_covered    = bits_summed[numpy.minimum(positions + num_covered, len(occupancy))] - bits_summed[numpy.minimum(positions + 1, len(occupancy))]
+	num_ambiguous   = numpy.count_nonzero(windows_blocked & (bits_covered <= 0))
+	num_run_starts  = numpy.count_nonzero(~windows_blocked[:-1] & windows_blocked[1:])
+	return (resolution - 1) * (int(num_ambiguous) + int(num_run_starts) + 2)
+
+# Same as the scan of compute_windows_blocked(), for a run-length bitmap
+# (see run_length_bitmap.py) and a scan window spanning all of its rows
+# (or cols): the positions blocked are the union, over the intervals of
+# cols (or rows) with any bit set, of the positions whose window overlaps
+# the interval, and the runs of open windows are the gaps between them.
+# Time and memory are proportional to the number of intervals, rather
+# than the bitmap area.
+def scan_run_length_bitmap(bitmap, scan_window, net_segment, offset, side, resolution, window_width_db):
+	if scan_window.height == bitmap.shape[0]:
+		# Window slides along the cols
+		occupancy    = bitmap.get_col_occupancy()
+		window_width = scan_window.width
+		num_cells    = bitmap.shape[1]
+	else:
+		# Window slides along the rows
+		occupancy    = bitmap.get_row_occupancy()
+		window_width = scan_window.height
+		num_cells    = bitmap.shape[0]
+	num_positions = max(0, num_cells - window_width + 1)
+	if num_positions == 0:
+		return 0, 0
+	if window_width > 0:
+		positions_blocked = clip_intervals(merge_intervals(numpy.column_stack((occupancy[:, 0] - window_width + 1, occupancy[:, 1]))), 0, num_positions)
+	else:
+		positions_blocked = merge_intervals([])
+	windows_blocked = intervals_length(positions_blocked)
+
+	# Runs of OPEN windows are patched into one unblocked window (see
+	# compute_windows_blocked())
+	for run_start, run_end in complement_intervals(positions_blocked, 0, num_positions).tolist():
+		if scan_window.height == bitmap.shape[0]:
+			run_start_pt = Point(run_start * resolution, 0)
+		else:
+			run_start_pt = Point(0, run_start * resolution)
+		if scan_window.direction == 'H':
+			patched_width  = scan_window.width + run_end - run_start - 1
+			patched_height = scan_window.height
+		elif scan_window.direction == 'V':
+			patched_width  = scan_window.width
+			patched_height = scan_window.height + run_end - run_start - 1
+		else:
+			print "UNSUPPORTED %s: wire patching direction." % (inspect.stack()[0][3])
+			sys.exit(3)
+		unblocked_window = Window(run_start_pt, patched_width * resolution, patched_height * resolution, scan_window.direction)
+		unblocked_window.offset(offset) 
+		net_segment.unblocked_windows[side].append(unblocked_window) 
+
+	# Bound the error of the coarse windows blocked (see get_raster_error_bound())
+	if resolution > 1:
+		if num_positions == 1:
+			net_segment.diff_layer_units_error += 0 if windows_blocked == 0 else (resolution - 1)
+		else:
+			num_covered       = window_width_db // resolution
+			positions_covered = merge_intervals([])
+			if num_covered > 1:
+				positions_covered = clip_intervals(merge_intervals(numpy.column_stack((occupancy[:, 0] - num_covered + 1, occupancy[:, 1] - 1))), 0, num_positions)
+			num_ambiguous  = windows_blocked - intervals_overlap_length(positions_blocked, positions_covered)
+			num_run_starts = numpy.count_nonzero(positions_blocked[:, 0] > 0)
+			net_segment.diff_layer_units_error += (resolution - 1) * (num_ambiguous + int(num_run_starts) + 2)
 
-def check_blockage_constrained(layout, net_segment):
+	return num_positions, windows_blocked
+
+def check_blockage_constrained(layout, net_segment, stamper=None):
 	num_same_layer_units_checked = 0
 	same_layer_units_blocked     = 0
 	num_diff_layer_units_checked = 0
@@ -312,16 +554,49 @@ def check_blockage_constrained(layout, net_segment):
 			else:
 				continue
 			
-			# Create bitmap
-			al_bitmap = numpy.zeros(shape=(nearby_bbox.get_height(), nearby_bbox.get_width()), dtype=bool)
-			# print "		Checking (%d) nearby polygons along %s side (GDSII Layer:) ..." % (len(nearby_polys), direction)
+			# Raster resolution of the adjacent layer bitmap
+			if direction == 'T':
+				resolution = get_raster_resolution(layout, net_segment.layer_num + 1)
+			else:
+				resolution = get_raster_resolution(layout, net_segment.layer_num - 1)
+
+			# Adjacent layer polygons are not extracted when stamping cells
+			# (see is_stamping_cells()): the bitmap is stamped from cell
+			# occupancy tiles, which are stamped at integer offsets only,
+			# or the nearby polygons are queried from the GDSII hierarchy
+			al_bitmap        = None
+			num_nearby_polys = len(nearby_polys)
+			if stamper != None:
+				side_layer_keys = get_adjacent_layer_keys(layout, net_segment, direction)
+				if nearby_bbox.ll.x == int(nearby_bbox.ll.x) and nearby_bbox.ll.y == int(nearby_bbox.ll.y):
+					al_bitmap = stamp_nearby_bitmap(stamper, nearby_bbox, layout.top_level_name, side_layer_keys, resolution)
+					# Only checked for 0 (see compute_windows_blocked())
+					num_nearby_polys = 1 if al_bitmap.any() or layout.region_query.has_polygons(layout.top_level_name, nearby_bbox, side_layer_keys) else 0
+				else:
+					nearby_polys     = layout.region_query.query(layout.top_level_name, nearby_bbox, side_layer_keys).to_polygons()
+					num_nearby_polys = len(nearby_polys)
+
+			if al_bitmap is None:
+				# Create bitmap (of resolution x resolution dbu pixels),
+				# run-length encoded if large
+				num_rows     = nearby_bbox.get_height()
+				num_cols     = nearby_bbox.get_width()
+				bitmap_shape = (-(-num_rows // resolution), -(-num_cols // resolution))
+				if bitmap_shape[0] * bitmap_shape[1] >= SPARSE_BITMAP_MIN_PIXELS:
+					al_bitmap = RunLengthBitmap(bitmap_shape[0], bitmap_shape[1])
+				else:
+					al_bitmap = numpy.zeros(shape=bitmap_shape, dtype=bool)
+				# print "		Checking (%d) nearby polygons along %s side (GDSII Layer:) ..." % (len(nearby_polys), direction)
 
-			# Color the bitmap
-			for poly in nearby_polys:
-				color_bitmap_al(al_bitmap, nearby_bbox.ll, poly)
+				# Color the bitmap
+				for poly in nearby_polys:
+					if resolution > 1 or isinstance(al_bitmap, RunLengthBitmap):
+						color_coarse_bitmap_al(al_bitmap, nearby_bbox.ll, poly, resolution, num_rows, num_cols)
+					else:
+						color_bitmap_al(al_bitmap, nearby_bbox.ll, poly)
 			
 			# Calculate windows blocked
-			windows_scanned, windows_blocked = compute_windows_blocked(al_bitmap, layout, net_segment, nearby_bbox.ll, direction, len(nearby_polys))
+			windows_scanned, windows_blocked = compute_windows_blocked(al_bitmap, layout, net_segment, nearby_bbox.ll, direction, num_nearby_polys, resolution)
 			# windows_scanned, windows_blocked = compute_windows_blocked(al_bitmap, layout, net_segment, nearby_bbox.ll, direction, 0)
 			
 			# Updated sides unblocked
@@ -379,14 +654,14 @@ def check_blockage(layout, net_segment):
 			# print "		Checking %.2f units along %s edge (%d/%f units/microns away)..." % (num_points_to_scan, direction, check_distance, float(check_distance / layout.lef.database_units))
 			# print "		Start Scan Coord = %d; End Scan Coord = %d; Num Points to Scan = %d" % (curr_scan_coord, end_scan_coord, num_points_to_scan)
 			while curr_scan_coord < end_scan_coord:
-				for poly in net_segment.polygon.nearby_sl_polygons:
+				for poly in net_segment.nearby_sl_polygons:
 					if direction == 'N' or direction == 'S':
-						if poly.is_point_inside(Point(curr_scan_coord, curr_fixed_coord_pitch)) or poly.is_point_inside(Point(curr_scan_coord, curr_fixed_coord_overlap)):
+						if poly.are_coords_inside(curr_scan_coord, curr_fixed_coord_pitch) or poly.are_coords_inside(curr_scan_coord, curr_fixed_coord_overlap):
 							same_layer_units_blocked += 1
 							same_side_units_blocked  += 1
 							break
 					else:
-						if poly.is_point_inside(Point(curr_fixed_coord_pitch, curr_scan_coord)) or poly.is_point_inside(Point(curr_fixed_coord_overlap, curr_scan_coord)):
+						if poly.are_coords_inside(curr_fixed_coord_pitch, curr_scan_coord) or poly.are_coords_inside(curr_fixed_coord_overlap, curr_scan_coord):
 							same_layer_units_blocked += 1
 							same_side_units_blocked  += 1
 							break
@@ -425,7 +700,74 @@ def check_blockage(layout, net_segment):
 
 	return num_same_layer_units_checked, same_layer_units_blocked, sides_unblocked, num_diff_layer_units_checked, diff_layer_units_blocked
 	
-def launch_net_blockage(layout, net):
+# Returns True if the adjacent layer bitmaps of the net blockage analysis
+# are stamped from cell occupancy tiles (see cell_stamps.py), so polygons
+# of (standard) cells are rasterized once per cell and orientation (per
+# worker process), instead of once per nearby net segment. The polygons
+# on the layers above/below critical net segments are then not extracted.
+# Stamping walks the GDSII hierarchy, which is not loaded with cached
+# geometry.
+def is_stamping_cells(layout):
+	return layout.stamp_cells and layout.net_blockage_type == 1 and layout.region_query != None
+
+# Returns the bitmap (of resolution x resolution dbu pixels, run-length
+# encoded if large) of a nearby bounding box (with an integer offset),
+# with the pixels inside any polygon, on one of the layer keys, of the
+# (flattened) structure stamped from cell occupancy tiles. The full
+# resolution bitmap is stamped in bands of rows (a multiple of the
+# resolution high), each downsampled and/or encoded as it is stamped,
+# so it is never allocated at once.
+def stamp_nearby_bitmap(stamper, nearby_bbox, struct_name, layer_keys, resolution):
+	num_rows     = nearby_bbox.get_height()
+	num_cols     = nearby_bbox.get_width()
+	bitmap_shape = (-(-num_rows // resolution), -(-num_cols // resolution))
+	if bitmap_shape[0] * bitmap_shape[1] >= SPARSE_BITMAP_MIN_PIXELS:
+		bitmap = RunLengthBitmap(bitmap_shape[0], bitmap_shape[1])
+	else:
+		bitmap = numpy.zeros(shape=bitmap_shape, dtype=bool)
+		if resolution == 1:
+			stamper.stamp_structure(bitmap, Point(int(nearby_bbox.ll.x), int(nearby_bbox.ll.y)), struct_name, layer_keys)
+			return bitmap
+
+	band_height = max(1, STAMP_BAND_MAX_PIXELS // (num_cols * resolution)) * resolution
+	for band_start in range(0, num_rows, band_height):
+		band_bitmap = numpy.zeros(shape=(min(band_height, num_rows - band_start), num_cols), dtype=bool)
+		stamper.stamp_structure(band_bitmap, Point(int(nearby_bbox.ll.x), int(nearby_bbox.ll.y) + band_start), struct_name, layer_keys)
+		if resolution > 1:
+			band_bitmap = downsample_bitmap(band_bitmap, resolution)
+		if isinstance(bitmap, RunLengthBitmap):
+			bitmap.fill_mask(band_start // resolution, 0, band_bitmap)
+		else:
+			bitmap[band_start // resolution:(band_start // resolution) + band_bitmap.shape[0]] |= band_bitmap
+	return bitmap
+
+# Returns the set of (gds layer num, gds data type) layer keys of the
+# polygons that are nearby candidates on the layer above ('T') or below
+# ('B') a net segment (see Layout.get_nearby_polygons_of_layer()).
+def get_adjacent_layer_keys(layout, net_segment, direction):
+	if direction == 'T':
+		nearby_polys = net_segment.nearby_al_polygons
+	else:
+		nearby_polys = net_segment.nearby_bl_polygons
+	return frozenset([layer_key for layer_key in layout.geometry.get_layer_keys() if layout.get_nearby_polygons_of_layer(net_segment, layer_key)[0] is nearby_polys])
+
+def init_net_blockage_worker(layout):
+	global blockage_worker_layout
+	global blockage_worker_stamper
+	blockage_worker_layout  = layout
+	blockage_worker_stamper = None
+	if is_stamping_cells(layout):
+		blockage_worker_stamper = CellStamper(layout.region_query, color_bitmap_al)
+
+# Computes the net blockage of a critical net in a worker process. Returns
+# the net, and the worker's cell stamper (only its stats for the net are
+# sent back, not the occupancy tiles), or None if not stamping cells.
+def launch_net_blockage_in_worker(net):
+	if blockage_worker_stamper != None:
+		blockage_worker_stamper.reset_stats()
+	return launch_net_blockage(blockage_worker_layout, net, blockage_worker_stamper), blockage_worker_stamper
+
+def launch_net_blockage(layout, net, stamper=None):
 	for net_segment in net.segments:
 		# Start Computation Timer
 		net_segment.nb_compute_time = time.time()
@@ -436,7 +778,7 @@ def launch_net_blockage(layout, net):
 			same_layer_units_blocked, \
 			sides_unblocked, \
 			num_diff_layer_units_checked, \
-			diff_layer_units_blocked = check_blockage_constrained(layout, net_segment)
+			diff_layer_units_blocked = check_blockage_constrained(layout, net_segment, stamper)
 		else:
 			num_same_layer_units_checked, \
 			same_layer_units_blocked, \
@@ -476,8 +818,10 @@ def print_net_segment_blockage_info(net_segment, segment_num, verbose, layout):
 		print "		Min SL Width (uM):        ", layout.lef.layers[net_segment.layer_num].min_width
 		if net_segment.layer_num < layout.lef.top_routing_layer_num:
 			print "		Min TL Width (uM):        ", layout.lef.layers[net_segment.layer_num + 1].min_width 
+			print "		TL Resolution (dbu):      ", get_raster_resolution(layout, net_segment.layer_num + 1)
 		if net_segment.layer_num > layout.lef.bottom_routing_layer_num:
 			print "		Min BL Width (uM):        ", layout.lef.layers[net_segment.layer_num - 1].min_width 
+			print "		BL Resolution (dbu):      ", get_raster_resolution(layout, net_segment.layer_num - 1)
 		print "		Top and Bottom Area (dbu):", (net_segment.polygon.get_area() * 2)
 		print "		BBox (M-Units):           ", net_segment.polygon.bbox.get_bbox_as_list()
 		print "		Nearby SL BBox (M-Units): ", net_segment.nearby_sl_bbox.get_bbox_as_list()
@@ -485,7 +829,11 @@ def print_net_segment_blockage_info(net_segment, segment_num, verbose, layout):
 			print "		Nearby TL BBox (M-Units): ", net_segment.nearby_al_bbox.get_bbox_as_list()
 		if net_segment.layer_num > layout.lef.bottom_routing_layer_num:
 			print "		Nearby BL BBox (M-Units): ", net_segment.nearby_bl_bbox.get_bbox_as_list()
-		print "		Num. Nearby Polygons:     ", len(net_segment.nearby_al_polygons) + len(net_segment.nearby_bl_polygons) + len(net_segment.nearby_sl_polygons)
+		if is_stamping_cells(layout):
+			# Adjacent layer polygons are stamped, not extracted
+			print "		Num. Nearby SL Polygons:  ", len(net_segment.nearby_sl_polygons)
+		else:
+			print "		Num. Nearby Polygons:     ", len(net_segment.nearby_al_polygons) + len(net_segment.nearby_bl_polygons) + len(net_segment.nearby_sl_polygons)
 		if gdsii_element_type == "Path":
 			print "		Klayout Query:       " 
 			print "			paths on layer %d/%d of cell %s where" % (net_segment.polygon.gdsii_element.layer, net_segment.polygon.gdsii_element.data_type, layout.top_level_name)
@@ -505,6 +853,8 @@ def print_net_segment_blockage_info(net_segment, segment_num, verbose, layout):
 			print "		Sides Unblocked:", net_segment.sides_unblocked
 		print "		Perimeter Units Blocked:  %d / %d" % (net_segment.same_layer_units_blocked, net_segment.same_layer_units_checked)
 		print "		Top/Bottom Units Blocked: %d / %d" % (net_segment.diff_layer_units_blocked, net_segment.diff_layer_units_checked)
+		if net_segment.diff_layer_units_error:
+			print "		Top/Bottom Error Bound:   +/-%d" % (net_segment.diff_layer_units_error)
 		print "		Done - Time Elapsed:", net_segment.nb_compute_time, "seconds."
 		print "		----------------------------------------------"
 
@@ -513,15 +863,34 @@ def analyze_critical_net_blockage(layout, verbose):
 	total_top_bottom_area     = 0
 	total_same_layer_blockage = 0 
 	total_diff_layer_blockage = 0
+	total_diff_layer_error    = 0
 
-	# Extract all GDSII elements near security-critical nets
-	layout.extract_nearby_polygons()
-	# layout.extract_nearby_polygons_parallel()
+	# Coarse raster resolution on the manufacturing grid
+	if layout.net_blockage_resolution == 'grid' and not layout.lef.manufacturing_grid:
+		print "WARNING %s: LEF has no MANUFACTURINGGRID; analyzing net blockage at full resolution." % (inspect.stack()[0][3])
 
-	# Distribute Workload Among Multiple Processes
-	worker_pool                   = mp.Pool(processes=layout.num_processes)
-	analyze_critical_nets_partial = ft.partial(launch_net_blockage, layout)
-	layout.critical_nets          = worker_pool.map(analyze_critical_nets_partial, layout.critical_nets)
+	# Extract all GDSII elements near security-critical nets
+	# (adjacent layers are stamped instead, if stamping cells)
+	if layout.stamp_cells and layout.net_blockage_type == 1 and not is_stamping_cells(layout):
+		print "WARNING %s: cell stamping needs the GDSII hierarchy, which is not loaded with cached geometry; coloring polygons instead." % (inspect.stack()[0][3])
+	layout.extract_nearby_polygons_parallel(not is_stamping_cells(layout))
+
+	# Distribute Workload Among Multiple Processes. Workers inherit the
+	# layout (and GDSII hierarchy, for stamping cells) when forked.
+	worker_pool          = mp.Pool(processes=layout.num_processes, initializer=init_net_blockage_worker, initargs=(layout,))
+	results              = worker_pool.map(launch_net_blockage_in_worker, layout.critical_nets)
+	worker_pool.close()
+	worker_pool.join()
+	layout.critical_nets = [net for net, stamper in results]
+
+	# Show cell stamping stats
+	if is_stamping_cells(layout):
+		stamper = CellStamper(None, None)
+		for net, net_stamper in results:
+			stamper.merge_stats(net_stamper)
+		print
+		stamper.print_stats()
+		print
 
 	# Print/Aggregate Detailed Results
 	for net in layout.critical_nets:
@@ -537,6 +906,7 @@ def analyze_critical_net_blockage(layout, verbose):
 			total_diff_layer_blockage += net_segment.diff_layer_units_blocked
 			total_perimeter_units     += net_segment.same_layer_units_checked
 			total_top_bottom_area     += net_segment.diff_layer_units_checked
+			total_diff_layer_error    += net_segment.diff_layer_units_error
 
 			segment_num += 1
 
@@ -554,6 +924,9 @@ def analyze_critical_net_blockage(layout, verbose):
 	# Print calculations
 	print "Perimeter Blockage Percentage:  %4.2f%%" % (perimeter_blockage_percentage) 
 	print "Top/Bottom Blockage Percentage: %4.2f%%" % (top_bottom_blockage_percentage) 
+	if total_diff_layer_error:
+		# Bound on the error of the coarse raster resolution vs. full resolution
+		print "Top/Bottom Error Bound:         +/-%4.2f%% (%d units, resolution %s)" % ((float(total_diff_layer_error) / float(total_top_bottom_area)) * 100.0, total_diff_layer_error, layout.net_blockage_resolution)
 	print "Raw Blockage Percentage:        %4.2f%%" % (raw_blockage_percentage) 
 	print "Weighted Blockage Percentage:   %4.2f%%" % (weighted_blockage_percentage)
 
@@ -0,0 +1,828 @@
+# Import GDSII Library
+from gdsii.library   import Library
+from gdsii.structure import Structure
+from gdsii.elements  import *
+
+# Import Custom Modules
+from gdsii_stream import *
+from transform    import *
+
+# Other Imports
+import sys
+import inspect
+import struct
+import mmap
+import math
+import zlib
+
+# Possible ERROR Codes:
+# 1 = Error loading input load_files
+# 2 = Unknown OASIS object attributes/attribute types
+# 3 = Unhandled feature
+
+# Magic number at the start of every OASIS file
+OASIS_MAGIC = '%SEMI-OASIS\r\n'
+
+# OASIS Record Types
+PAD             = 0
+START           = 1
+END             = 2
+CELLNAME_IMPL   = 3
+CELLNAME        = 4
+TEXTSTRING_IMPL = 5
+TEXTSTRING      = 6
+PROPNAME_IMPL   = 7
+PROPNAME        = 8
+PROPSTRING_IMPL = 9
+PROPSTRING      = 10
+LAYERNAME       = 11
+LAYERNAME_TEXT  = 12
+CELL_REF        = 13
+CELL            = 14
+XYABSOLUTE      = 15
+XYRELATIVE      = 16
+PLACEMENT       = 17
+PLACEMENT_TRANS = 18
+TEXT            = 19
+RECTANGLE       = 20
+POLYGON         = 21
+PATH            = 22
+TRAPEZOID_AB    = 23
+TRAPEZOID_A     = 24
+TRAPEZOID_B     = 25
+CTRAPEZOID      = 26
+CIRCLE          = 27
+PROPERTY        = 28
+PROPERTY_REPEAT = 29
+XNAME_IMPL      = 30
+XNAME           = 31
+XELEMENT        = 32
+XGEOMETRY       = 33
+CBLOCK          = 34
+
+# Name tables (indexed by reference number) of name records:
+# Key<record type> --> Value<(name table, True if implicitly numbered)>
+NAME_RECORDS = {
+	CELLNAME_IMPL:   ('cell',       True),
+	CELLNAME:        ('cell',       False),
+	TEXTSTRING_IMPL: ('textstring', True),
+	TEXTSTRING:      ('textstring', False),
+	PROPNAME_IMPL:   ('propname',   True),
+	PROPNAME:        ('propname',   False),
+	PROPSTRING_IMPL: ('propstring', True),
+	PROPSTRING:      ('propstring', False),
+	XNAME_IMPL:      ('xname',      True),
+	XNAME:           ('xname',      False),
+}
+
+# Standard property carrying GDSII element properties (attribute, value)
+GDS_PROPERTY_NAME = 'S_GDS_PROPERTY'
+
+# Number of vertices of the polygons approximating OASIS circles
+CIRCLE_NUM_VERTICES = 64
+
+# Vertices of the 26 OASIS compact trapezoid types, as (a, b, c, d)
+# coefficients of each vertex (x, y) = (a*w + b*h, c*w + d*h).
+CTRAPEZOID_VERTICES = [
+	[(0, 0, 0, 0), (0, 0, 0, 1), (1, -1, 0, 1), (1, 0, 0, 0)],
+	[(0, 0, 0, 0), (0, 0, 0, 1), (1, 0, 0, 1), (1, -1, 0, 0)],
+	[(0, 0, 0, 0), (0, 1, 0, 1), (1, 0, 0, 1), (1, 0, 0, 0)],
+	[(0, 1, 0, 0), (0, 0, 0, 1), (1, 0, 0, 1), (1, 0, 0, 0)],
+	[(0, 0, 0, 0), (0, 1, 0, 1), (1, -1, 0, 1), (1, 0, 0, 0)],
+	[(0, 1, 0, 0), (0, 0, 0, 1), (1, 0, 0, 1), (1, -1, 0, 0)],
+	[(0, 0, 0, 0), (0, 1, 0, 1), (1, 0, 0, 1), (1, -1, 0, 0)],
+	[(0, 1, 0, 0), (0, 0, 0, 1), (1, -1, 0, 1), (1, 0, 0, 0)],
+	[(0, 0, 0, 0), (0, 0, 1, -1), (1, 0, 1, 0), (1, 0, 0, 0)],
+	[(0, 0, 0, 0), (0, 0, 1, 0), (1, 0, 1, -1), (1, 0, 0, 0)],
+	[(0, 0, 0, 0), (0, 0, 1, 0), (1, 0, 1, 0), (1, 0, 0, 1)],
+	[(0, 0, 0, 1), (0, 0, 1, 0), (1, 0, 1, 0), (1, 0, 0, 0)],
+	[(0, 0, 0, 0), (0, 0, 1, -1), (1, 0, 1, 0), (1, 0, 0, 1)],
+	[(0, 0, 0, 1), (0, 0, 1, 0), (1, 0, 1, -1), (1, 0, 0, 0)],
+	[(0, 0, 0, 0), (0, 0, 1, 0), (1, 0, 1, -1), (1, 0, 0, 1)],
+	[(0, 0, 0, 1), (0, 0, 1, -1), (1, 0, 1, 0), (1, 0, 0, 0)],
+	[(0, 0, 0, 0), (0, 0, 1, 0), (1, 0, 0, 0)],
+	[(0, 0, 0, 0), (0, 0, 1, 0), (1, 0, 1, 0)],
+	[(0, 0, 0, 0), (1, 0, 1, 0), (1, 0, 0, 0)],
+	[(0, 0, 1, 0), (1, 0, 1, 0), (1, 0, 0, 0)],
+	[(0, 0, 0, 0), (0, 1, 0, 1), (0, 2, 0, 0)],
+	[(0, 0, 0, 1), (0, 2, 0, 1), (0, 1, 0, 0)],
+	[(0, 0, 0, 0), (0, 0, 2, 0), (1, 0, 1, 0)],
+	[(1, 0, 0, 0), (0, 0, 1, 0), (1, 0, 2, 0)],
+	[(0, 0, 0, 0), (0, 0, 0, 1), (1, 0, 0, 1), (1, 0, 0, 0)],
+	[(0, 0, 0, 0), (0, 0, 1, 0), (1, 0, 1, 0), (1, 0, 0, 0)],
+]
+
+# Unit vectors of the octangular directions of 2-/3-/g-deltas
+# (E, N, W, S, NE, NW, SW, SE)
+OCTANGULAR_DIRECTIONS = [(1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (-1, 1), (-1, -1), (1, -1)]
+
+# Returns True if the (possibly compressed) layout input stream is an
+# OASIS file (see gdsii_stream.peek_stream()).
+def is_oasis_stream(stream):
+	return peek_stream(stream, len(OASIS_MAGIC)) == OASIS_MAGIC
+
+# Returns the data of an OASIS input stream, memory-mapped from plain
+# files, or read (decompressed) into memory otherwise.
+def read_oasis_data(stream):
+	if is_gdsii_stream_seekable(stream):
+		try:
+			return mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+		except (AttributeError, ValueError, EnvironmentError):
+			pass
+	chunks = []
+	chunk  = stream.read(DECOMPRESS_CHUNK_SIZE)
+	while chunk:
+		chunks.append(chunk)
+		chunk = stream.read(DECOMPRESS_CHUNK_SIZE)
+	return ''.join(chunks)
+
+# Repetition of an OASIS element, either a regular lattice of
+# cols x rows positions with displacements col_vector and row_vector
+# (1D lattices have a single row), or an arbitrary list of offsets.
+class Repetition():
+	def __init__(self, cols=1, rows=1, col_vector=(0, 0), row_vector=(0, 0), offsets=None):
+		self.cols       = cols
+		self.rows       = rows
+		self.col_vector = col_vector
+		self.row_vector = row_vector
+		self.offsets    = offsets # list of (x, y) offsets, or None for lattices
+
+	def is_lattice(self):
+		return self.offsets == None
+
+	# Returns the list of (x, y) offsets of all positions
+	# (lattices in row-major order).
+	def get_offsets(self):
+		if self.offsets != None:
+			return self.offsets
+		offsets = []
+		for row in range(self.rows):
+			for col in range(self.cols):
+				offsets.append(((col * self.col_vector[0]) + (row * self.row_vector[0]), (col * self.col_vector[1]) + (row * self.row_vector[1])))
+		return offsets
+
+# OASIS (SEMI P39) reader. Decodes an OASIS file into the same python-gdsii
+# library/structure/element objects the GDSII reader builds, so the rest of
+# GDS2-Score is unaware of the input format. Regular placement repetitions
+# are kept as (GDSII) ARefs (see ARefLattice), so arrays are not expanded on
+# read; other repetitions are expanded into one element per position.
+# Circles are approximated by polygons, and text and custom (X-) records
+# are skipped.
+class OASISReader():
+	def __init__(self, data):
+		self.data     = data
+		self.position = 0
+		self.size     = len(data)
+		self.blocks   = [] # stack of (data, position, size) of the enclosing streams of CBLOCKs
+		self.names    = {'cell': {}, 'textstring': {}, 'propname': {}, 'propstring': {}, 'xname': {}} # Key<table> --> Value<Key<reference number> --> Value<name>>
+		self.name_nums          = dict((table, 0) for table in self.names) # next implicit reference number per name table
+		self.unresolved_cells   = [] # (structure/reference element, cell reference number) pairs
+		self.element_properties = [] # (elements, property name or reference number, property values) triples
+		self.num_elements_skipped = 0
+		self.num_arefs            = 0
+		self.num_expanded_refs    = 0
+		self.reset_modal_variables()
+
+	# Resets the OASIS modal variables (at the start of each cell).
+	def reset_modal_variables(self):
+		self.xy_relative     = False
+		self.placement_xy    = [0, 0]
+		self.geometry_xy     = [0, 0]
+		self.text_xy         = [0, 0]
+		self.placement_cell  = None
+		self.layer           = None
+		self.data_type       = None
+		self.geometry_w      = None
+		self.geometry_h      = None
+		self.polygon_points  = None
+		self.path_halfwidth  = None
+		self.path_points     = None
+		self.path_start_extn = None
+		self.path_end_extn   = None
+		self.ctrapezoid_type = None
+		self.circle_radius   = None
+		self.repetition      = None
+		self.text_string     = None
+		self.text_layer      = None
+		self.text_type       = None
+		self.property_name   = None
+		self.property_values = None
+
+	# ------------------------------------------------------------------
+	# Basic OASIS data types
+	# ------------------------------------------------------------------
+	def read_byte(self):
+		if self.position >= self.size:
+			print "ERROR %s: unexpected end of OASIS stream." % (inspect.stack()[0][3])
+			sys.exit(1)
+		byte = ord(self.data[self.position])
+		self.position += 1
+		return byte
+
+	def read_bytes(self, length):
+		if self.position + length > self.size:
+			print "ERROR %s: unexpected end of OASIS stream." % (inspect.stack()[0][3])
+			sys.exit(1)
+		data = self.data[self.position : self.position + length]
+		self.position += length
+		return data
+
+	# Unsigned integers are stored in groups of 7 bits (least significant
+	# group first), with the MSB of each byte marking a following byte.
+	def read_uint(self):
+		byte  = self.read_byte()
+		value = byte & 0x7f
+		shift = 7
+		while byte & 0x80:
+			byte   = self.read_byte()
+			value |= (byte & 0x7f) << shift
+			shift += 7
+		return value
+
+	# Signed integers are unsigned integers with the sign in the LSB.
+	def read_sint(self):
+		value = self.read_uint()
+		if value & 1:
+			return -(value >> 1)
+		return value >> 1
+
+	def read_real(self):
+		real_type = self.read_uint()
+		if real_type == 0:
+			return float(self.read_uint())
+		elif real_type == 1:
+			return -float(self.read_uint())
+		elif real_type == 2:
+			return 1.0 / self.read_uint()
+		elif real_type == 3:
+			return -1.0 / self.read_uint()
+		elif real_type == 4:
+			numerator = self.read_uint()
+			return float(numerator) / self.read_uint()
+		elif real_type == 5:
+			numerator = self.read_uint()
+			return -float(numerator) / self.read_uint()
+		elif real_type == 6:
+			return struct.unpack('<f', self.read_bytes(4))[0]
+		elif real_type == 7:
+			return struct.unpack('<d', self.read_bytes(8))[0]
+		print "ERROR %s: invalid OASIS real type (%d)." % (inspect.stack()[0][3], real_type)
+		sys.exit(2)
+
+	def read_string(self):
+		return self.read_bytes(self.read_uint())
+
+	# Reads a g-delta, i.e. either an octangular delta (direction and
+	# magnitude), or an arbitrary (x, y) delta. Returns an (x, y) tuple.
+	def read_gdelta(self):
+		value = self.read_uint()
+		if value & 1:
+			x = value >> 2
+			if value & 2:
+				x = -x
+			return (x, self.read_sint())
+		direction = OCTANGULAR_DIRECTIONS[(value >> 1) & 7]
+		magnitude = value >> 4
+		return (direction[0] * magnitude, direction[1] * magnitude)
+
+	# Reads a point list. Returns the list of (x, y) vertices relative to
+	# the element position, starting with the (implicit) vertex (0, 0).
+	# Manhattan point lists of polygons end with an implicit vertex.
+	def read_point_list(self, is_polygon):
+		list_type  = self.read_uint()
+		num_deltas = self.read_uint()
+		points     = [(0, 0)]
+		x, y       = 0, 0
+		if list_type == 0 or list_type == 1:
+			# 1-deltas, alternating horizontal/vertical
+			is_horizontal = (list_type == 0)
+			for i in range(num_deltas):
+				if is_horizontal:
+					x += self.read_sint()
+				else:
+					y += self.read_sint()
+				points.append((x, y))
+				is_horizontal = not is_horizontal
+			if is_polygon:
+				points.append((0, y) if is_horizontal else (x, 0))
+		elif list_type == 2 or list_type == 3:
+			# 2-deltas (manhattan), or 3-deltas (octangular)
+			num_bits = list_type
+			for i in range(num_deltas):
+				value     = self.read_uint()
+				direction = OCTANGULAR_DIRECTIONS[value & ((1 << num_bits) - 1)]
+				magnitude = value >> num_bits
+				x += direction[0] * magnitude
+				y += direction[1] * magnitude
+				points.append((x, y))
+		elif list_type == 4 or list_type == 5:
+			# g-deltas, or g-deltas of the deltas
+			dx, dy = 0, 0
+			for i in range(num_deltas):
+				gx, gy = self.read_gdelta()
+				if list_type == 4:
+					dx, dy = gx, gy
+				else:
+					dx, dy = dx + gx, dy + gy
+				x += dx
+				y += dy
+				points.append((x, y))
+		else:
+			print "ERROR %s: invalid OASIS point list type (%d)." % (inspect.stack()[0][3], list_type)
+			sys.exit(2)
+		return points
+
+	# Reads a repetition. Returns a Repetition object (type 0 reuses
+	# the previous repetition).
+	def read_repetition(self):
+		rep_type = self.read_uint()
+		if rep_type == 0:
+			if self.repetition == None:
+				print "ERROR %s: OASIS repetition reused before it is defined." % (inspect.stack()[0][3])
+				sys.exit(2)
+			return self.repetition
+		elif rep_type == 1:
+			cols    = self.read_uint() + 2
+			rows    = self.read_uint() + 2
+			x_space = self.read_uint()
+			y_space = self.read_uint()
+			return Repetition(cols, rows, (x_space, 0), (0, y_space))
+		elif rep_type == 2:
+			cols = self.read_uint() + 2
+			return Repetition(cols, 1, (self.read_uint(), 0))
+		elif rep_type == 3:
+			rows = self.read_uint() + 2
+			return Repetition(1, rows, (0, 0), (0, self.read_uint()))
+		elif rep_type in (4, 5, 6, 7):
+			# Irregular spacings along the x (4, 5) or y (6, 7) axis
+			num_spaces = self.read_uint() + 1
+			grid       = self.read_uint() if rep_type in (5, 7) else 1
+			offsets    = [(0, 0)]
+			offset     = 0
+			for i in range(num_spaces):
+				offset += self.read_uint() * grid
+				offsets.append((offset, 0) if rep_type in (4, 5) else (0, offset))
+			return Repetition(offsets=offsets)
+		elif rep_type == 8:
+			cols       = self.read_uint() + 2
+			rows       = self.read_uint() + 2
+			col_vector = self.read_gdelta()
+			return Repetition(cols, rows, col_vector, self.read_gdelta())
+		elif rep_type == 9:
+			cols = self.read_uint() + 2
+			return Repetition(cols, 1, self.read_gdelta())
+		elif rep_type == 10 or rep_type == 11:
+			# Arbitrary displacements
+			num_displacements = self.read_uint() + 1
+			grid              = self.read_uint() if rep_type == 11 else 1
+			offsets           = [(0, 0)]
+			x, y              = 0, 0
+			for i in range(num_displacements):
+				dx, dy = self.read_gdelta()
+				x += dx * grid
+				y += dy * grid
+				offsets.append((x, y))
+			return Repetition(offsets=offsets)
+		print "ERROR %s: invalid OASIS repetition type (%d)." % (inspect.stack()[0][3], rep_type)
+		sys.exit(2)
+
+	# Reads a property value. References to property strings are
+	# returned as (table, reference number) tuples (resolved later).
+	def read_property_value(self):
+		value_type = self.read_uint()
+		if value_type <= 7:
+			self.position -= 1
+			return self.read_real()
+		elif value_type == 8:
+			return self.read_uint()
+		elif value_type == 9:
+			return self.read_sint()
+		elif value_type <= 12:
+			return self.read_string()
+		elif value_type <= 15:
+			return ('propstring', self.read_uint())
+		print "ERROR %s: invalid OASIS property value type (%d)." % (inspect.stack()[0][3], value_type)
+		sys.exit(2)
+
+	# Reads an interval (of layer numbers or data types).
+	def skip_interval(self):
+		interval_type = self.read_uint()
+		if interval_type == 4:
+			self.read_uint()
+			self.read_uint()
+		elif interval_type != 0:
+			self.read_uint()
+
+	# Reads an x or y coordinate of a modal position (absolute, or
+	# relative to the previous position in XYRELATIVE mode).
+	def read_modal_coord(self, modal_xy, axis):
+		value = self.read_sint()
+		if self.xy_relative:
+			modal_xy[axis] += value
+		else:
+			modal_xy[axis] = value
+
+	# Returns the value of a modal variable, exiting if it is undefined.
+	def get_modal(self, value, name):
+		if value == None:
+			print "ERROR %s: OASIS modal variable %s used before it is defined." % (inspect.stack()[0][3], name)
+			sys.exit(2)
+		return value
+
+	# ------------------------------------------------------------------
+	# Records
+	# ------------------------------------------------------------------
+
+	# Reads the entire OASIS file. The layer filter is an (optional)
+	# function, taking a GDSII layer number and data type, that returns
+	# False for layers whose elements should be skipped. Returns a
+	# python-gdsii library object.
+	def read_library(self, layer_filter=None):
+		layer_decisions = {} # Key<(gds layer num, gds data type)> --> Value<True/False>
+		lib             = None
+		structure       = None
+		elements        = [] # elements of the last element record (properties attach to them)
+
+		if self.read_bytes(len(OASIS_MAGIC)) != OASIS_MAGIC:
+			print "ERROR %s: not an OASIS file." % (inspect.stack()[0][3])
+			sys.exit(1)
+		while True:
+			# End of a CBLOCK
+			if self.position >= self.size and self.blocks:
+				self.data, self.position, self.size = self.blocks.pop()
+			record_type = self.read_uint()
+			if record_type == PAD:
+				continue
+			elif record_type == START:
+				self.read_string() # version
+				unit = self.read_real() # grid steps per micron
+				if self.read_uint() == 0:
+					for i in range(12):
+						self.read_uint() # table offsets
+				lib = Library(5, 'OASIS', 1e-6 / unit, 1.0 / unit)
+			elif record_type == END:
+				break
+			elif record_type in NAME_RECORDS:
+				table, is_implicit = NAME_RECORDS[record_type]
+				if table == 'xname':
+					self.read_uint() # attribute
+				name = self.read_string()
+				if is_implicit:
+					ref_num = self.name_nums[table]
+					self.name_nums[table] += 1
+				else:
+					ref_num = self.read_uint()
+				self.names[table][ref_num] = name
+			elif record_type == LAYERNAME or record_type == LAYERNAME_TEXT:
+				self.read_string()
+				self.skip_interval()
+				self.skip_interval()
+			elif record_type == CELL_REF or record_type == CELL:
+				if lib == None:
+					print "ERROR %s: OASIS START record not found." % (inspect.stack()[0][3])
+					sys.exit(1)
+				structure = Structure('')
+				if record_type == CELL_REF:
+					self.unresolved_cells.append((structure, self.read_uint()))
+				else:
+					structure.name = self.read_string()
+				lib.append(structure)
+				self.reset_modal_variables()
+				elements = []
+			elif record_type == XYABSOLUTE:
+				self.xy_relative = False
+			elif record_type == XYRELATIVE:
+				self.xy_relative = True
+			elif record_type == PROPERTY:
+				self.read_property(elements)
+			elif record_type == PROPERTY_REPEAT:
+				if elements:
+					self.element_properties.append((elements, self.get_modal(self.property_name, 'last-property-name'), self.get_modal(self.property_values, 'last-value-list')))
+			elif record_type == CBLOCK:
+				comp_type = self.read_uint()
+				self.read_uint() # uncompressed byte count
+				comp_data = self.read_bytes(self.read_uint())
+				if comp_type != 0:
+					print "UNSUPPORTED %s: OASIS CBLOCK compression type (%d) not supported." % (inspect.stack()[0][3], comp_type)
+					sys.exit(3)
+				self.blocks.append((self.data, self.position, self.size))
+				self.data     = zlib.decompress(comp_data, -zlib.MAX_WBITS)
+				self.position = 0
+				self.size     = len(self.data)
+			elif record_type == XELEMENT:
+				self.read_uint()
+				self.read_string()
+			elif record_type in (TEXT, XGEOMETRY, PLACEMENT, PLACEMENT_TRANS, RECTANGLE, POLYGON, PATH, TRAPEZOID_AB, TRAPEZOID_A, TRAPEZOID_B, CTRAPEZOID, CIRCLE):
+				if structure == None:
+					print "ERROR %s: OASIS element record (%d) outside of a CELL." % (inspect.stack()[0][3], record_type)
+					sys.exit(1)
+				elements = self.read_element(record_type, layer_filter, layer_decisions)
+				structure.extend(elements)
+			else:
+				print "UNSUPPORTED %s: OASIS record type (%d) not supported." % (inspect.stack()[0][3], record_type)
+				sys.exit(2)
+
+		self.resolve_names()
+		return lib
+
+	# Reads a PROPERTY record, and records it for the elements of
+	# the preceding element record (properties of cells and of the
+	# file are ignored).
+	def read_property(self, elements):
+		info = self.read_byte()
+		if info & 0x04:
+			if info & 0x02:
+				self.property_name = self.read_uint()
+			else:
+				self.property_name = self.read_string()
+		if not (info & 0x08):
+			num_values = info >> 4
+			if num_values == 15:
+				num_values = self.read_uint()
+			self.property_values = [self.read_property_value() for i in range(num_values)]
+		if elements:
+			self.element_properties.append((elements, self.get_modal(self.property_name, 'last-property-name'), self.get_modal(self.property_values, 'last-value-list')))
+
+	# Reads an element (placement, geometry, or text) record, after the
+	# record type. Returns the list of (python-gdsii) elements of all of
+	# its positions (empty for skipped elements).
+	def read_element(self, record_type, layer_filter, layer_decisions):
+		info = self.read_byte()
+		if record_type == PLACEMENT or record_type == PLACEMENT_TRANS:
+			return self.read_placement(record_type, info)
+		elif record_type == TEXT:
+			self.read_text(info)
+			return []
+
+		# Geometry records: layer and data type come first
+		if record_type == XGEOMETRY:
+			self.read_uint() # attribute
+		if info & 0x01:
+			self.layer = self.read_uint()
+		if info & 0x02:
+			self.data_type = self.read_uint()
+		layer_key = (self.get_modal(self.layer, 'layer'), self.get_modal(self.data_type, 'datatype'))
+
+		path_type = None
+		if record_type == RECTANGLE:
+			if info & 0x40:
+				self.geometry_w = self.read_uint()
+			if info & 0x20:
+				self.geometry_h = self.read_uint()
+			width  = self.get_modal(self.geometry_w, 'geometry-w')
+			height = width if info & 0x80 else self.get_modal(self.geometry_h, 'geometry-h')
+			points = [(0, 0), (width, 0), (width, height), (0, height)]
+		elif record_type == POLYGON:
+			if info & 0x20:
+				self.polygon_points = self.read_point_list(True)
+			points = self.get_modal(self.polygon_points, 'polygon-point-list')
+		elif record_type == PATH:
+			if info & 0x40:
+				self.path_halfwidth = self.read_uint()
+			if info & 0x80:
+				scheme = self.read_uint()
+				self.path_start_extn = self.read_path_extension(scheme >> 2, self.path_start_extn)
+				self.path_end_extn   = self.read_path_extension(scheme, self.path_end_extn)
+			if info & 0x20:
+				self.path_points = self.read_point_list(False)
+			points = self.get_modal(self.path_points, 'path-point-list')
+			path_type = self.get_path_type(self.get_modal(self.path_halfwidth, 'path-halfwidth'), self.get_modal(self.path_start_extn, 'path-start-extension'), self.get_modal(self.path_end_extn, 'path-end-extension'))
+		elif record_type in (TRAPEZOID_AB, TRAPEZOID_A, TRAPEZOID_B):
+			if info & 0x40:
+				self.geometry_w = self.read_uint()
+			if info & 0x20:
+				self.geometry_h = self.read_uint()
+			delta_a = self.read_sint() if record_type != TRAPEZOID_B else 0
+			delta_b = self.read_sint() if record_type != TRAPEZOID_A else 0
+			points  = self.get_trapezoid_points(self.get_modal(self.geometry_w, 'geometry-w'), self.get_modal(self.geometry_h, 'geometry-h'), delta_a, delta_b, info & 0x80)
+		elif record_type == CTRAPEZOID:
+			if info & 0x80:
+				self.ctrapezoid_type = self.read_uint()
+			if info & 0x40:
+				self.geometry_w = self.read_uint()
+			if info & 0x20:
+				self.geometry_h = self.read_uint()
+			points = self.get_ctrapezoid_points(self.get_modal(self.ctrapezoid_type, 'ctrapezoid-type'))
+		elif record_type == CIRCLE:
+			if info & 0x20:
+				self.circle_radius = self.read_uint()
+			radius = self.get_modal(self.circle_radius, 'circle-radius')
+			points = []
+			for i in range(CIRCLE_NUM_VERTICES):
+				angle = 2.0 * math.pi * i / CIRCLE_NUM_VERTICES
+				points.append((int(round(radius * math.cos(angle))), int(round(radius * math.sin(angle)))))
+		else:
+			# XGEOMETRY (custom geometry, skipped)
+			self.read_string()
+			points = None
+
+		if info & 0x10:
+			self.read_modal_coord(self.geometry_xy, 0)
+		if info & 0x08:
+			self.read_modal_coord(self.geometry_xy, 1)
+		repetition = self.read_element_repetition(info)
+		if points == None:
+			return []
+
+		# Check if element's layer is needed
+		if layer_filter != None:
+			if layer_key not in layer_decisions:
+				layer_decisions[layer_key] = layer_filter(layer_key[0], layer_key[1])
+			if not layer_decisions[layer_key]:
+				self.num_elements_skipped += 1
+				return []
+
+		# Create (closed) Boundary, or Path, elements at all positions
+		elements = []
+		x, y     = self.geometry_xy
+		offsets  = repetition.get_offsets() if repetition != None else [(0, 0)]
+		for dx, dy in offsets:
+			xy = [(x + dx + px, y + dy + py) for px, py in points]
+			if record_type == PATH:
+				element           = Path(layer_key[0], layer_key[1], xy)
+				element.width     = 2 * self.path_halfwidth
+				element.path_type = path_type
+				if path_type == 4:
+					element.bgn_extn = self.path_start_extn
+					element.end_extn = self.path_end_extn
+			else:
+				element = Boundary(layer_key[0], layer_key[1], xy + [xy[0]])
+			elements.append(element)
+		return elements
+
+	# Reads a path extension (of the start or end of a path) given
+	# its 2-bit scheme. Returns the extension length.
+	def read_path_extension(self, scheme, previous_extn):
+		scheme &= 3
+		if scheme == 0:
+			return previous_extn
+		elif scheme == 1:
+			return 0
+		elif scheme == 2:
+			return self.get_modal(self.path_halfwidth, 'path-halfwidth')
+		return self.read_sint()
+
+	# Returns the GDSII path type of an OASIS path.
+	def get_path_type(self, halfwidth, start_extn, end_extn):
+		if start_extn == 0 and end_extn == 0:
+			return 0
+		elif start_extn == halfwidth and end_extn == halfwidth:
+			return 2
+		return 4
+
+	# Returns the vertices of a (horizontal or vertical) trapezoid.
+	def get_trapezoid_points(self, width, height, delta_a, delta_b, is_vertical):
+		if is_vertical:
+			return [(0, max(delta_a, 0)), (0, height + min(delta_b, 0)), (width, height - max(delta_b, 0)), (width, -min(delta_a, 0))]
+		return [(max(delta_a, 0), height), (width + min(delta_b, 0), height), (width - max(delta_b, 0), 0), (-min(delta_a, 0), 0)]
+
+	# Returns the vertices of a compact trapezoid. The width or height of
+	# the triangle/square types is implied by the other dimension.
+	def get_ctrapezoid_points(self, ctrapezoid_type):
+		if ctrapezoid_type < 0 or ctrapezoid_type >= len(CTRAPEZOID_VERTICES):
+			print "ERROR %s: invalid OASIS ctrapezoid type (%d)." % (inspect.stack()[0][3], ctrapezoid_type)
+			sys.exit(2)
+		if ctrapezoid_type in (20, 21):
+			height = self.get_modal(self.geometry_h, 'geometry-h')
+			width  = 2 * height
+		else:
+			width  = self.get_modal(self.geometry_w, 'geometry-w')
+			if ctrapezoid_type in (16, 17, 18, 19, 25):
+				height = width
+			elif ctrapezoid_type in (22, 23):
+				height = 2 * width
+			else:
+				height = self.get_modal(self.geometry_h, 'geometry-h')
+		return [((a * width) + (b * height), (c * width) + (d * height)) for a, b, c, d in CTRAPEZOID_VERTICES[ctrapezoid_type]]
+
+	# Reads the (optional) repetition of an element record.
+	def read_element_repetition(self, info):
+		if not (info & 0x04):
+			return None
+		self.repetition = self.read_repetition()
+		return self.repetition
+
+	# Reads a TEXT record (after the info byte). Text is not needed
+	# by any metric, so only the modal variables are updated.
+	def read_text(self, info):
+		if info & 0x40:
+			if info & 0x20:
+				self.text_string = self.read_uint()
+			else:
+				self.text_string = self.read_string()
+		if info & 0x01:
+			self.text_layer = self.read_uint()
+		if info & 0x02:
+			self.text_type = self.read_uint()
+		if info & 0x10:
+			self.read_modal_coord(self.text_xy, 0)
+		if info & 0x08:
+			self.read_modal_coord(self.text_xy, 1)
+		self.read_element_repetition(info)
+
+	# Reads a PLACEMENT record (after the info byte). Returns the list
+	# of SRef/ARef elements of all placement positions.
+	def read_placement(self, record_type, info):
+		if info & 0x80:
+			if info & 0x40:
+				self.placement_cell = ('cell', self.read_uint())
+			else:
+				self.placement_cell = self.read_string()
+		cell = self.get_modal(self.placement_cell, 'placement-cell')
+
+		magnification = None
+		angle         = None
+		if record_type == PLACEMENT_TRANS:
+			if info & 0x04:
+				magnification = self.read_real()
+			if info & 0x02:
+				angle = self.read_real()
+		else:
+			angle = 90.0 * ((info >> 1) & 3)
+		if magnification == 1.0:
+			magnification = None
+		if angle == 0.0:
+			angle = None
+		strans = STRANS_REFLECTION if info & 0x01 else None
+
+		if info & 0x20:
+			self.read_modal_coord(self.placement_xy, 0)
+		if info & 0x10:
+			self.read_modal_coord(self.placement_xy, 1)
+		repetition = None
+		if info & 0x08:
+			self.repetition = self.read_repetition()
+			repetition      = self.repetition
+
+		# Regular repetition --> ARef
+		x, y = self.placement_xy
+		if repetition != None and repetition.is_lattice() and (repetition.cols * repetition.rows) > 1:
+			self.num_arefs += 1
+			elements = [self.create_aref(repetition, x, y, strans, angle, magnification)]
+		else:
+			offsets  = repetition.get_offsets() if repetition != None else [(0, 0)]
+			elements = []
+			for dx, dy in offsets:
+				sref        = SRef('', [(x + dx, y + dy)])
+				sref.strans = strans
+				sref.angle  = angle
+				sref.mag    = magnification
+				elements.append(sref)
+			if repetition != None:
+				self.num_expanded_refs += len(offsets)
+		for element in elements:
+			self.set_reference_cell(element, cell)
+		return elements
+
+	# Creates an ARef element for a placement with a regular repetition.
+	# Like the repetition, the ARef lattice vectors are displacements in
+	# the frame of the placing cell (see ARefLattice), so any lattice can
+	# be kept as an ARef, whatever the placement's transformation.
+	def create_aref(self, repetition, x, y, strans, angle, magnification):
+		cols, col_vector = repetition.cols, repetition.col_vector
+		rows, row_vector = repetition.rows, repetition.row_vector
+		aref        = ARef('', cols, rows, [(x, y), (x + (cols * col_vector[0]), y + (cols * col_vector[1])), (x + (rows * row_vector[0]), y + (rows * row_vector[1]))])
+		aref.strans = strans
+		aref.angle  = angle
+		aref.mag    = magnification
+		return aref
+
+	# Sets the referenced structure name of an SRef/ARef element, or
+	# records it for resolving once all CELLNAME records are read.
+	def set_reference_cell(self, element, cell):
+		if isinstance(cell, tuple):
+			self.unresolved_cells.append((element, cell[1]))
+		else:
+			element.struct_name = cell
+
+	# Resolves cell and property name references (CELLNAME/PROPNAME/
+	# PROPSTRING records may follow the records referencing them), and
+	# attaches GDSII properties (e.g. net names) to their elements.
+	def resolve_names(self):
+		for item, ref_num in self.unresolved_cells:
+			if ref_num not in self.names['cell']:
+				print "ERROR %s: undefined OASIS cell name reference (%d)." % (inspect.stack()[0][3], ref_num)
+				sys.exit(1)
+			if isinstance(item, Structure):
+				item.name = self.names['cell'][ref_num]
+			else:
+				item.struct_name = self.names['cell'][ref_num]
+
+		for elements, name, values in self.element_properties:
+			if not isinstance(name, str):
+				name = self.names['propname'].get(name)
+			if name != GDS_PROPERTY_NAME or len(values) < 2:
+				continue
+			value = values[1]
+			if isinstance(value, tuple):
+				value = self.names['propstring'].get(value[1])
+			for element in elements:
+				if element.properties == None:
+					element.properties = []
+				element.properties.append((int(values[0]), value))
+
+	def print_stats(self):
+		print "OASIS Reader Stats:"
+		print "	Repetitions Kept as ARefs: %d" % (self.num_arefs)
+		print "	Expanded Placements:       %d" % (self.num_expanded_refs)
+		print "	Elements Skipped:          %d" % (self.num_elements_skipped)
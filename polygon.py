@@ -3,14 +3,15 @@ from gdsii.elements import *
 
 # Import Custom Modules
 import debug_prints as dbg
-from error import *
+from error     import *
+from transform import *
 
 # Import matplotlib
 # import matplotlib.pyplot as plt
 
 # Other Imports
 import math
-import copy
+import numpy
 import inspect
 import sys
 import pprint
@@ -19,7 +20,9 @@ import pprint
 DEBUG_INTERSECTION_CALCS   = False
 DEBUG_WA_ALGORITHM_VERBOSE = False
 
-class Point():
+class Point(object):
+	__slots__ = ('x', 'y')
+
 	def __init__(self, x, y):
 		self.x = x
 		self.y = y
@@ -35,7 +38,7 @@ class Point():
 		return cls(x, y)
 
 	def __eq__(self, other_point):
-		if other_point != None:
+		if other_point is not None:
 			return ((self.x == other_point.x) and (self.y == other_point.y))
 		else:
 			return False
@@ -62,7 +65,9 @@ class Point():
 			print "(x: %d; y: %d)" % (self.x, self.y),
 
 # Line Segment
-class LineSegment():
+class LineSegment(object):
+	__slots__ = ('p1', 'p2', 'slope', 'y_intercept', 'a', 'b', 'c')
+
 	def __init__(self, p1, p2):
 		# End Points
 		self.p1 = p1
@@ -223,7 +228,9 @@ class LineSegment():
 		else:
 			print "P1(x: %d; y: %d) --- P2(x: %d; y: %d)" % (self.p1.x, self.p1.y, self.p2.x, self.p2.y)
 
-class BBox():
+class BBox(object):
+	__slots__ = ('ll', 'ur', 'height', 'width')
+
 	def __init__(self, ll, ur):
 		self.ll     = ll
 		self.ur     = ur
@@ -231,7 +238,7 @@ class BBox():
 		self.width  = self.ur.x - self.ll.x
 
 	def __eq__(self, other_bbox):
-		if other_bbox != None:
+		if other_bbox is not None:
 			return ((self.ll == other_bbox.ll) and (self.ur == other_bbox.ur))
 		else:
 			return False
@@ -256,8 +263,8 @@ class BBox():
 		all_x_coords = []
 		all_y_coords = []
 		for poly in polys:
-			all_x_coords.extend(copy.copy(poly.get_x_coords()))
-			all_y_coords.extend(copy.copy(poly.get_y_coords()))
+			all_x_coords.extend(poly.get_x_coords())
+			all_y_coords.extend(poly.get_y_coords())
 		
 		# Extract min/max values
 		ll = Point(min(all_x_coords), min(all_y_coords))
@@ -322,15 +329,18 @@ class BBox():
 		plt.plot(x_coords, y_coords)
 
 # Coords = list of Point objects, starting and ending with first point
-class Polygon():
+class Polygon(object):
+	__slots__ = ('num_coords', 'coords', 'gdsii_element', 'bbox', 'is_rect')
+
 	def __init__(self, coords, gdsii_element=None):
 		self.num_coords    = len(coords)
 		self.coords        = coords
 		self.gdsii_element = gdsii_element
 		self.bbox          = BBox.from_polygon(self)
+		self.is_rect       = self.is_axis_aligned_rectangle()
 
 	def __eq__(self, other_poly):
-		if other_poly != None:
+		if other_poly is not None:
 			return ((self.num_coords == other_poly.num_coords) and (set(self.coords) == set(other_poly.coords)) and (self.bbox == other_poly.bbox))
 		else:
 			return False
@@ -393,7 +403,7 @@ class Polygon():
 			ul_corner = Point.from_point_and_offset(ur_corner, (ll_corner.x - ur_corner.x), 0)
 			
 			# List of Coords -- 5 coords total -- first and last are the same
-			coords = [ll_corner, lr_corner, ur_corner, ul_corner, copy.deepcopy(ll_corner)]
+			coords = [ll_corner, lr_corner, ur_corner, ul_corner, Point(ll_corner.x, ll_corner.y)]
 
 			return cls(coords, path)
 
@@ -404,10 +414,16 @@ class Polygon():
 			coords.append(Point(coord[0], coord[1]))
 		return cls(coords, boundary)
 
+	@classmethod
+	def from_bbox(cls, bbox, gdsii_element=None):
+		coords = [Point(bbox.ll.x, bbox.ll.y), Point(bbox.ur.x, bbox.ll.y), Point(bbox.ur.x, bbox.ur.y), Point(bbox.ll.x, bbox.ur.y), Point(bbox.ll.x, bbox.ll.y)]
+		return cls(coords, gdsii_element)
+
 	@classmethod
 	def from_rect_poly_and_extension(cls, rect_poly, height_extension, width_extension):
 		# Verify rect_poly is a rectangle, i.e. has exactly 5 coords (1st and last coord are the same)
-		if rect_poly.num_coords != 5:
+		# with horizontal and vertical edges
+		if not rect_poly.is_rect:
 			print "Num coords:", rect_poly.num_coords
 			print "ERROR %s: polygon is not a rectangle." % (inspect.stack()[0][3])
 			sys.exit(4)
@@ -416,7 +432,7 @@ class Polygon():
 		lr_corner = Point(rect_poly.bbox.ur.x + width_extension, rect_poly.bbox.ll.y - height_extension)
 		ur_corner = Point(rect_poly.bbox.ur.x + width_extension, rect_poly.bbox.ur.y + height_extension)
 		ul_corner = Point(rect_poly.bbox.ll.x - width_extension, rect_poly.bbox.ur.y + height_extension)
-		coords    = [ll_corner, lr_corner, ur_corner, ul_corner, copy.deepcopy(ll_corner)] 
+		coords    = [ll_corner, lr_corner, ur_corner, ul_corner, Point(ll_corner.x, ll_corner.y)] 
 		
 		return cls(coords)
 
@@ -835,6 +851,18 @@ class Polygon():
 		y_coords     = self.get_y_coords()
 		self.bbox.ll = Point(min(x_coords), min(y_coords))
 		self.bbox.ur = Point(max(x_coords), max(y_coords))
+		self.is_rect = self.is_axis_aligned_rectangle()
+
+	# Returns True if the polygon is a rectangle with horizontal and
+	# vertical edges (i.e. it has exactly 5 coords -- 1st and last are
+	# the same -- that are all corners of its bounding box).
+	def is_axis_aligned_rectangle(self):
+		if self.num_coords != 5:
+			return False
+		for coord in self.coords:
+			if (coord.x != self.bbox.ll.x and coord.x != self.bbox.ur.x) or (coord.y != self.bbox.ll.y and coord.y != self.bbox.ur.y):
+				return False
+		return True
 
 	def plot(self):
 		plt.plot(self.get_x_coords(), self.get_y_coords())
@@ -848,26 +876,7 @@ class Polygon():
 		print
 
 	def rotate(self, degrees):
-		if degrees == 90:
-			# 1. Switch X and Y values
-			# 2. Multiply the new X values by -1
-			for i in range(self.num_coords):
-				self.coords[i].x, self.coords[i].y = self.coords[i].y, self.coords[i].x
-				self.coords[i].x *= -1
-		elif degrees == 180:
-			# 1. Multiply X and Y values by -1
-			for i in range(self.num_coords):
-				self.coords[i].x *= -1
-				self.coords[i].y *= -1
-		elif degrees == 270:
-			# 1. Switch X and Y values
-			# 2. Multiply the new Y values by -1
-			for i in range(self.num_coords):
-				self.coords[i].x, self.coords[i].y = self.coords[i].y, self.coords[i].x
-				self.coords[i].y *= -1
-		else:
-			print "UNSUPPORTED %s: rotation of %d degrees not supported." % (inspect.stack()[1][3], degrees)
-			sys.exit(3)
+		self.apply_transform(compute_transform(0, 0, None, degrees))
 
 	def reflect_across_x_axis(self):
 		# 1. Multiply Y values by -1
@@ -884,27 +893,39 @@ class Polygon():
 			self.coords[i].y += offset_y
 
 	def compute_translations(self, offset_x, offset_y, x_reflection, degrees_rotation, verbose=False):
-		translation_computed = False
-		# Reflections are computed FIRST
-		if x_reflection == REFLECTION_ABOUT_X_AXIS:
-			self.reflect_across_x_axis()
-			translation_computed = True
-		# Rotations are computed SECOND
-		if degrees_rotation != 0 and degrees_rotation != None:
-			self.rotate(degrees_rotation)
-			translation_computed = True
-		# Offsets are computed LAST
-		if offset_x != 0 or offset_y != 0:
-			self.shift_x_y(offset_x, offset_y)
-			translation_computed = True
-
+		transform = compute_transform(offset_x, offset_y, x_reflection, degrees_rotation)
 		# Update the bounding box if a translation is computed
-		if translation_computed:
+		if not is_identity_transform(transform):
+			self.apply_transform(transform)
 			self.update_bbox()
 
+	# Applies a transform (see transform.py) to all vertices of the
+	# polygon at once. Integer coordinates stay integers under integral
+	# transforms. Vertices are reversed by mirroring transforms, so they
+	# are still listed in CCW order. The bounding box is NOT updated.
+	def apply_transform(self, transform):
+		x_is_float = numpy.array([isinstance(coord.x, float) for coord in self.coords])
+		y_is_float = numpy.array([isinstance(coord.y, float) for coord in self.coords])
+		x_is_float, y_is_float = transform_float_flags(transform, x_is_float, y_is_float)
+		x_is_float = numpy.broadcast_to(x_is_float, (self.num_coords,)).tolist()
+		y_is_float = numpy.broadcast_to(y_is_float, (self.num_coords,)).tolist()
+		coords     = transform_coords(transform, numpy.array([(coord.x, coord.y) for coord in self.coords], dtype=numpy.float64))
+		for i, (x, y) in enumerate(coords.tolist()):
+			self.coords[i].x = x if x_is_float[i] else int(x)
+			self.coords[i].y = y if y_is_float[i] else int(y)
+		if reverses_orientation(transform):
+			self.coords.reverse()
+
+	# Returns a translated copy of the polygon. The copy has its own
+	# vertices, so the original polygon is left untouched.
+	def copy_with_translations(self, offset_x, offset_y, x_reflection, degrees_rotation):
+		poly = Polygon([Point(coord.x, coord.y) for coord in self.coords], self.gdsii_element)
+		poly.compute_translations(offset_x, offset_y, x_reflection, degrees_rotation)
+		return poly
+
 	def is_point_inside(self, P):
 		# First check if polygon is a rectangle
-		if self.num_coords == 5:
+		if self.is_rect:
 			return self.bbox.is_point_inside_bbox(P)
 		else:
 			# Check if point is inside bbox first
@@ -924,6 +945,37 @@ class Polygon():
 			else:
 				return False
 
+	# Same as is_point_inside(), but takes the coordinates of the point,
+	# so scan loops need not create a Point for rectangles.
+	def are_coords_inside(self, x, y):
+		if self.is_rect:
+			return self.bbox.are_coords_inside_bbox(x, y)
+		else:
+			return self.is_point_inside(Point(x, y))
+
+	# Same as are_coords_inside(), but for NumPy arrays of X and Y
+	# coordinates (broadcast against each other), returning a boolean
+	# array. The ray casting of is_point_inside() is run one edge at a
+	# time over all points.
+	def are_points_inside(self, x_coords, y_coords):
+		inside = (x_coords >= self.bbox.ll.x) & (x_coords <= self.bbox.ur.x) & (y_coords >= self.bbox.ll.y) & (y_coords <= self.bbox.ur.y)
+		if self.is_rect or not inside.any():
+			return inside
+		crossings  = numpy.zeros(shape=inside.shape, dtype=bool)
+		on_segment = numpy.zeros(shape=inside.shape, dtype=bool)
+		for edge in self.edges():
+			min_x, max_x = min(edge.p1.x, edge.p2.x), max(edge.p1.x, edge.p2.x)
+			min_y, max_y = min(edge.p1.y, edge.p2.y), max(edge.p1.y, edge.p2.y)
+			on_segment  |= (((edge.p2.y - edge.p1.y) * (x_coords - edge.p2.x)) - ((edge.p2.x - edge.p1.x) * (y_coords - edge.p2.y)) == 0) & (x_coords >= min_x) & (x_coords <= max_x) & (y_coords >= min_y) & (y_coords <= max_y)
+			if edge.p1.y == edge.p2.y:
+				# Horizontal edges never cross a ray
+				continue
+			crossing = (y_coords > min_y) & (y_coords <= max_y) & (x_coords <= max_x)
+			if edge.p1.x != edge.p2.x:
+				crossing &= x_coords <= ((y_coords - edge.p1.y) * ((edge.p2.x - edge.p1.x) / (edge.p2.y - edge.p1.y))) + edge.p1.x
+			crossings ^= crossing
+		return inside & (crossings | on_segment)
+
 	# Returns True if the provided bounding box overlaps the bounding
 	# box of the polygon. Otherwise, returns False.
 	def overlaps_bbox(self, bbox):
@@ -0,0 +1,168 @@
+# Import GDSII Library
+from gdsii.elements import *
+
+# Import Custom Modules
+from polygon   import *
+from transform import *
+
+# Other Imports
+import numpy
+
+# Coordinate type flags (per vertex) of polygon arrays
+X_COORD_IS_FLOAT = 1
+Y_COORD_IS_FLOAT = 2
+
+# Converts a stored (float) coordinate to a
+# Python int if it has an integral value.
+def to_coord(value):
+	if value == int(value):
+		return int(value)
+	return float(value)
+
+# Creates a list of Point objects from lists of (x, y) coordinates
+# and coordinate type flags (float coordinates stay floats).
+def to_points(coords, coord_flags):
+	points = []
+	for (x, y), flags in zip(coords, coord_flags):
+		if not (flags & X_COORD_IS_FLOAT):
+			x = int(x)
+		if not (flags & Y_COORD_IS_FLOAT):
+			y = int(y)
+		points.append(Point(x, y))
+	return points
+
+# A batch of polygons packed into flat numpy arrays, so they can be
+# transformed all at once (see transform.py):
+# coords      = (num vertices x 2) vertex coordinates of all polygons
+# coord_flags = (num vertices) flags marking float (vs. int) coordinates
+# offsets     = (num polygons + 1) offsets of each polygon in the vertex arrays
+# elements    = (num polygons) GDSII element (Boundary/Path) of each polygon
+# Polygon arrays are never modified once created, so they can be
+# shared (e.g. by the flatten cache).
+class PolygonArrays():
+	def __init__(self, coords=None, coord_flags=None, offsets=None, elements=None):
+		self.coords      = coords      if coords      is not None else numpy.zeros((0, 2))
+		self.coord_flags = coord_flags if coord_flags is not None else numpy.zeros(0, dtype=numpy.int8)
+		self.offsets     = offsets     if offsets     is not None else numpy.zeros(1, dtype=numpy.int64)
+		self.elements    = elements    if elements    is not None else []
+
+	@classmethod
+	def from_polygons(cls, polys):
+		coords      = []
+		coord_flags = []
+		offsets     = [0]
+		for poly in polys:
+			for coord in poly.coords:
+				coords.append((coord.x, coord.y))
+				coord_flags.append((X_COORD_IS_FLOAT if isinstance(coord.x, float) else 0) | (Y_COORD_IS_FLOAT if isinstance(coord.y, float) else 0))
+			offsets.append(len(coords))
+		return cls(numpy.array(coords, dtype=numpy.float64).reshape((-1, 2)), numpy.array(coord_flags, dtype=numpy.int8), numpy.array(offsets, dtype=numpy.int64), [poly.gdsii_element for poly in polys])
+
+	# Packs several polygon arrays (in order) into one.
+	@classmethod
+	def concatenate(cls, polys_arrays):
+		polys_arrays = [polys for polys in polys_arrays if polys.elements]
+		if not polys_arrays:
+			return cls()
+		elif len(polys_arrays) == 1:
+			return polys_arrays[0]
+		offsets     = [numpy.zeros(1, dtype=numpy.int64)]
+		num_coords  = 0
+		elements    = []
+		for polys in polys_arrays:
+			offsets.append(polys.offsets[1:] + num_coords)
+			num_coords += polys.get_num_vertices()
+			elements.extend(polys.elements)
+		coords      = numpy.concatenate([polys.coords for polys in polys_arrays])
+		coord_flags = numpy.concatenate([polys.coord_flags for polys in polys_arrays])
+		return cls(coords, coord_flags, numpy.concatenate(offsets), elements)
+
+	def get_num_polygons(self):
+		return len(self.elements)
+
+	def get_num_vertices(self):
+		return len(self.coord_flags)
+
+	# Returns new polygon arrays with the transform applied to all
+	# vertices at once. The vertices of each polygon are reversed
+	# by mirroring transforms, so they stay in CCW order.
+	def transformed(self, transform):
+		if is_identity_transform(transform) or not self.elements:
+			return self
+		coords      = transform_coords(transform, self.coords)
+		x_is_float, y_is_float = transform_float_flags(transform, (self.coord_flags & X_COORD_IS_FLOAT) != 0, (self.coord_flags & Y_COORD_IS_FLOAT) != 0)
+		coord_flags = numpy.zeros(self.get_num_vertices(), dtype=numpy.int8)
+		coord_flags[numpy.broadcast_to(x_is_float, coord_flags.shape)] |= X_COORD_IS_FLOAT
+		coord_flags[numpy.broadcast_to(y_is_float, coord_flags.shape)] |= Y_COORD_IS_FLOAT
+		if reverses_orientation(transform):
+			starts      = self.offsets[:-1]
+			ends        = self.offsets[1:]
+			order       = numpy.repeat(starts + ends - 1, ends - starts) - numpy.arange(self.get_num_vertices())
+			coords      = coords[order]
+			coord_flags = coord_flags[order]
+		return PolygonArrays(coords, coord_flags, self.offsets, self.elements)
+
+	# Returns new polygon arrays holding only the polygons
+	# with the provided (sorted) polygon indices.
+	def select(self, poly_indices):
+		poly_indices = numpy.asarray(poly_indices, dtype=numpy.int64)
+		starts       = self.offsets[poly_indices]
+		lengths      = self.offsets[poly_indices + 1] - starts
+		offsets      = numpy.concatenate((numpy.zeros(1, dtype=numpy.int64), numpy.cumsum(lengths)))
+		vertices     = numpy.repeat(starts - offsets[:-1], lengths) + numpy.arange(offsets[-1])
+		return PolygonArrays(self.coords[vertices], self.coord_flags[vertices], offsets, [self.elements[poly_index] for poly_index in poly_indices.tolist()])
+
+	# Returns new polygon arrays holding a copy of the polygons per array
+	# position, i.e. the polygons transformed, and then translated by each
+	# of the (num positions x 2) position shifts. The polygons are
+	# transformed only once, and the shifts are broadcast over the vertex
+	# arrays.
+	def tiled(self, transform, shifts):
+		num_positions = len(shifts)
+		if num_positions == 0 or not self.elements:
+			return PolygonArrays()
+		polys  = self.transformed(transform)
+		coords = (polys.coords[numpy.newaxis, :, :] + shifts[:, numpy.newaxis, :]).reshape((-1, 2))
+
+		# Non-integral shifts turn coordinates into floats
+		shift_flags = (numpy.where(shifts[:, 0] != numpy.floor(shifts[:, 0]), X_COORD_IS_FLOAT, 0) | numpy.where(shifts[:, 1] != numpy.floor(shifts[:, 1]), Y_COORD_IS_FLOAT, 0)).astype(numpy.int8)
+		coord_flags = (polys.coord_flags[numpy.newaxis, :] | shift_flags[:, numpy.newaxis]).ravel()
+
+		# Offsets of the polygons of each array position
+		position_starts = numpy.arange(num_positions, dtype=numpy.int64) * self.get_num_vertices()
+		offsets         = numpy.concatenate((numpy.zeros(1, dtype=numpy.int64), (polys.offsets[numpy.newaxis, 1:] + position_starts[:, numpy.newaxis]).ravel()))
+		return PolygonArrays(coords, coord_flags, offsets, polys.elements * num_positions)
+
+	# Returns the (LL x, LL y, UR x, UR y) bounding box
+	# of all polygons, or None if there are no polygons.
+	def compute_bbox(self):
+		if not self.elements:
+			return None
+		ll = self.coords.min(axis=0)
+		ur = self.coords.max(axis=0)
+		return (ll[0], ll[1], ur[0], ur[1])
+
+	# Returns a (num polygons x 4) array of the
+	# LL x, LL y, UR x, UR y of each polygon.
+	def compute_bboxes(self):
+		if not self.elements:
+			return numpy.zeros((0, 4))
+		starts = self.offsets[:-1]
+		bboxes = numpy.empty((self.get_num_polygons(), 4))
+		bboxes[:, 0] = numpy.minimum.reduceat(self.coords[:, 0], starts)
+		bboxes[:, 1] = numpy.minimum.reduceat(self.coords[:, 1], starts)
+		bboxes[:, 2] = numpy.maximum.reduceat(self.coords[:, 0], starts)
+		bboxes[:, 3] = numpy.maximum.reduceat(self.coords[:, 1], starts)
+		return bboxes
+
+	# Creates (new) polygon objects of all polygons.
+	def to_polygons(self):
+		polys       = []
+		coords      = self.coords.tolist()
+		coord_flags = self.coord_flags.tolist()
+		offsets     = self.offsets.tolist()
+		for poly_index, element in enumerate(self.elements):
+			start = offsets[poly_index]
+			end   = offsets[poly_index + 1]
+			polys.append(Polygon(to_points(coords[start:end], coord_flags[start:end]), element))
+		return polys
@@ -0,0 +1,180 @@
+# Import GDSII Library
+from gdsii.elements import *
+
+# Import Custom Modules
+from polygon        import *
+from polygon_arrays import *
+from transform      import *
+from aref_lattice   import *
+
+# Other Imports
+import sys
+import inspect
+import numpy
+
+# Summary of a GDSII structure (in its own coordinate frame) used to
+# prune hierarchical region queries:
+# leaf_polys  = polygon arrays of the structure's own Boundary/Path elements
+# leaf_bboxes = (num leaf polygons x 4) bounding boxes of the leaf polygons
+# refs        = list of the structure's SRef/ARef elements
+# ref_bboxes  = (num refs x 4) bounding boxes of all referenced instances
+# layer_keys  = set of (gds layer num, gds data type) of all polygons in (or below) the structure
+# bbox        = (LL x, LL y, UR x, UR y) of all polygons in (or below) the structure, or None if empty
+class StructureSummary():
+	def __init__(self, leaf_polys, refs, ref_bboxes, layer_keys):
+		self.leaf_polys  = leaf_polys
+		self.leaf_bboxes = leaf_polys.compute_bboxes()
+		self.refs        = refs
+		self.ref_bboxes  = ref_bboxes
+		self.layer_keys  = layer_keys
+		self.bbox        = None
+		bboxes = numpy.concatenate((self.leaf_bboxes, self.ref_bboxes))
+		if len(bboxes) > 0:
+			self.bbox = (bboxes[:, 0].min(), bboxes[:, 1].min(), bboxes[:, 2].max(), bboxes[:, 3].max())
+
+# Region queries on the (unflattened) GDSII hierarchy. The bounding box
+# of every structure is computed once, bottom-up, and cached (along with
+# the structure's leaf polygons) per structure name. A query then only
+# descends into the SRef/ARef instances whose (transformed) bounding box
+# overlaps the query region, and only decodes the leaf polygons that
+# overlap it, instead of flattening the whole structure. Instances of
+# the structures to ignore (e.g. fill cells) are skipped, like when
+# flattening the layout.
+class RegionQuery():
+	def __init__(self, gdsii_structures, structures_to_ignore=()):
+		self.gdsii_structures     = gdsii_structures
+		self.structures_to_ignore = structures_to_ignore
+		self.summaries            = {} # Key<structure name> --> Value<StructureSummary object>
+
+	# Returns the (cached) summary of a GDSII structure.
+	def get_structure_summary(self, struct_name):
+		if struct_name not in self.summaries:
+			if struct_name not in self.gdsii_structures:
+				print "ERROR %s: reference to unkown structure %s." % (inspect.stack()[0][3], struct_name)
+				sys.exit(1)
+			leaf_polys = []
+			refs       = []
+			ref_bboxes = []
+			layer_keys = set()
+			for element in self.gdsii_structures[struct_name]:
+				if isinstance(element, Path):
+					leaf_polys.append(Polygon.from_gdsii_path(element))
+					layer_keys.add((element.layer, element.data_type))
+				elif isinstance(element, Boundary):
+					leaf_polys.append(Polygon.from_gdsii_boundary(element))
+					layer_keys.add((element.layer, element.data_type))
+				elif (isinstance(element, SRef) or isinstance(element, ARef)) and element.struct_name not in self.structures_to_ignore:
+					ref_bbox = self.compute_reference_bbox(element)
+					if ref_bbox != None:
+						refs.append(element)
+						ref_bboxes.append(ref_bbox)
+						layer_keys.update(self.get_structure_summary(element.struct_name).layer_keys)
+			self.summaries[struct_name] = StructureSummary(PolygonArrays.from_polygons(leaf_polys), refs, numpy.array(ref_bboxes, dtype=numpy.float64).reshape((-1, 4)), layer_keys)
+		return self.summaries[struct_name]
+
+	# Computes the exact (LL x, LL y, UR x, UR y) bounding box of a
+	# structure with all of its elements flattened and the provided
+	# transform (None for the identity) applied, or None if the structure
+	# is empty. Axis-aligned transforms are answered from the cached
+	# structure bounding boxes; other rotations descend the hierarchy.
+	def compute_bbox(self, struct_name, transform=None):
+		summary = self.get_structure_summary(struct_name)
+		if summary.bbox == None:
+			return None
+		if transform is None or is_axis_aligned_transform(transform):
+			return tuple(transform_bboxes(transform, numpy.array([summary.bbox]))[0].tolist())
+		bboxes = [summary.leaf_polys.transformed(transform).compute_bboxes()]
+		for element in summary.refs:
+			bboxes.append(numpy.array([self.compute_reference_bbox(element, transform)]))
+		bboxes = numpy.concatenate(bboxes)
+		return (bboxes[:, 0].min(), bboxes[:, 1].min(), bboxes[:, 2].max(), bboxes[:, 3].max())
+
+	# Computes the exact bounding box of a referenced (SRef/ARef) instance,
+	# in the frame of the structure containing the reference, with the
+	# provided transform applied. Returns None if the referenced structure
+	# is empty.
+	def compute_reference_bbox(self, element, transform=None):
+		struct_bbox = self.get_structure_summary(element.struct_name).bbox
+		if struct_bbox == None:
+			return None
+		if isinstance(element, ARef):
+			lattice = ARefLattice(element, struct_bbox, transform)
+			if is_axis_aligned_transform(lattice.transform):
+				return lattice.compute_bbox()
+
+			# Array positions only differ by a translation, so the
+			# bbox of the first position is shifted to the extremes
+			# of the lattice
+			ll_x, ll_y, ur_x, ur_y = self.compute_bbox(element.struct_name, lattice.transform)
+			shifts = lattice.get_position_shifts()
+			return (ll_x + shifts[:, 0].min(), ll_y + shifts[:, 1].min(), ur_x + shifts[:, 0].max(), ur_y + shifts[:, 1].max())
+		return self.compute_bbox(element.struct_name, compose_transforms(transform, compute_element_transform(element)))
+
+	# Returns the polygon arrays (see polygon_arrays.py) of all polygons
+	# of a structure (flattened, with the provided transform applied)
+	# whose bounding box overlaps the query bounding box. Only polygons
+	# on the provided (gds layer num, gds data type) layer keys are
+	# returned, unless layer_keys is None.
+	def query(self, struct_name, bbox, layer_keys=None, transform=None):
+		summary = self.get_structure_summary(struct_name)
+		if summary.bbox == None or (layer_keys != None and summary.layer_keys.isdisjoint(layer_keys)):
+			return PolygonArrays()
+
+		# Leaf polygons whose (transformed) bbox overlaps the query
+		# region. Bounding boxes transformed by rotations other than
+		# multiples of 90 degrees are too large, so the transformed
+		# polygons are checked again.
+		region       = (bbox.ll.x, bbox.ll.y, bbox.ur.x, bbox.ur.y)
+		results      = []
+		poly_indices = numpy.nonzero(bboxes_overlap(transform_bboxes(transform, summary.leaf_bboxes), region))[0]
+		if layer_keys != None:
+			poly_indices = [poly_index for poly_index in poly_indices.tolist() if (summary.leaf_polys.elements[poly_index].layer, summary.leaf_polys.elements[poly_index].data_type) in layer_keys]
+		if len(poly_indices) > 0:
+			polys = summary.leaf_polys.select(poly_indices).transformed(transform)
+			if transform is not None and not is_axis_aligned_transform(transform):
+				polys = polys.select(numpy.nonzero(bboxes_overlap(polys.compute_bboxes(), region))[0])
+			results.append(polys)
+
+		# Descend into instances whose (transformed) bbox overlaps the query region
+		for ref_index in numpy.nonzero(bboxes_overlap(transform_bboxes(transform, summary.ref_bboxes), region))[0].tolist():
+			element = summary.refs[ref_index]
+			if isinstance(element, ARef):
+				lattice = ARefLattice(element, self.get_structure_summary(element.struct_name).bbox, transform)
+				for row, col in lattice.query(bbox):
+					results.append(self.query(element.struct_name, bbox, layer_keys, lattice.get_position_transform(row, col)))
+			else:
+				results.append(self.query(element.struct_name, bbox, layer_keys, compose_transforms(transform, compute_element_transform(element))))
+		return PolygonArrays.concatenate(results)
+
+	# Returns True if query() would return any polygons, i.e. if any
+	# polygon of the structure (flattened, with the provided transform
+	# applied) on the layer keys (any layer if None) overlaps the query
+	# bounding box. Stops at the first overlapping polygon, without
+	# collecting any polygons.
+	def has_polygons(self, struct_name, bbox, layer_keys=None, transform=None):
+		summary = self.get_structure_summary(struct_name)
+		if summary.bbox == None or (layer_keys != None and summary.layer_keys.isdisjoint(layer_keys)):
+			return False
+
+		# Leaf polygons (see query())
+		region       = (bbox.ll.x, bbox.ll.y, bbox.ur.x, bbox.ur.y)
+		poly_indices = numpy.nonzero(bboxes_overlap(transform_bboxes(transform, summary.leaf_bboxes), region))[0]
+		if layer_keys != None:
+			poly_indices = [poly_index for poly_index in poly_indices.tolist() if (summary.leaf_polys.elements[poly_index].layer, summary.leaf_polys.elements[poly_index].data_type) in layer_keys]
+		if len(poly_indices) > 0:
+			if transform is None or is_axis_aligned_transform(transform):
+				return True
+			if bboxes_overlap(summary.leaf_polys.select(poly_indices).transformed(transform).compute_bboxes(), region).any():
+				return True
+
+		# Instances (see query())
+		for ref_index in numpy.nonzero(bboxes_overlap(transform_bboxes(transform, summary.ref_bboxes), region))[0].tolist():
+			element = summary.refs[ref_index]
+			if isinstance(element, ARef):
+				lattice = ARefLattice(element, self.get_structure_summary(element.struct_name).bbox, transform)
+				for row, col in lattice.query(bbox):
+					if self.has_polygons(element.struct_name, bbox, layer_keys, lattice.get_position_transform(row, col)):
+						return True
+			elif self.has_polygons(element.struct_name, bbox, layer_keys, compose_transforms(transform, compute_element_transform(element))):
+				return True
+		return False
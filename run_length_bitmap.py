@@ -0,0 +1,133 @@
+# Other Imports
+import bisect
+import numpy
+
+# ------------------------------------------------------------------
+# Interval Lists
+# ------------------------------------------------------------------
+# Interval lists are (num intervals x 2) numpy arrays of [start, end)
+# intervals, sorted, disjoint and non-adjacent (see merge_intervals()).
+
+# Returns the union of [start, end) intervals (any iterable of pairs) as
+# an interval list. Empty intervals are dropped.
+def merge_intervals(intervals):
+	intervals = numpy.asarray(intervals, dtype=numpy.int64).reshape((-1, 2))
+	intervals = intervals[intervals[:, 0] < intervals[:, 1]]
+	if len(intervals) == 0:
+		return intervals
+	intervals = intervals[numpy.argsort(intervals[:, 0], kind='mergesort')]
+	ends      = numpy.maximum.accumulate(intervals[:, 1])
+	# A merged interval starts wherever an interval starts after all previous ones end
+	new_start = numpy.concatenate(([True], intervals[1:, 0] > ends[:-1]))
+	last_inds = numpy.concatenate((numpy.nonzero(new_start)[0][1:] - 1, [len(intervals) - 1]))
+	return numpy.column_stack((intervals[new_start, 0], ends[last_inds]))
+
+# Returns the interval list clipped to [start, end).
+def clip_intervals(intervals, start, end):
+	clipped = numpy.column_stack((numpy.maximum(intervals[:, 0], start), numpy.minimum(intervals[:, 1], end)))
+	return clipped[clipped[:, 0] < clipped[:, 1]]
+
+# Returns the complement of the interval list within [start, end).
+def complement_intervals(intervals, start, end):
+	bounds = numpy.concatenate(([start], clip_intervals(intervals, start, end).ravel(), [end])).reshape((-1, 2))
+	return bounds[bounds[:, 0] < bounds[:, 1]]
+
+# Returns the total length of the interval list.
+def intervals_length(intervals):
+	return int((intervals[:, 1] - intervals[:, 0]).sum())
+
+# Returns the total length of the intersection of two interval lists.
+def intervals_overlap_length(intervals_1, intervals_2):
+	return intervals_length(intervals_1) + intervals_length(intervals_2) - intervals_length(merge_intervals(numpy.concatenate((intervals_1, intervals_2))))
+
+# Returns a sorted list of disjoint (start, end) intervals with the
+# interval [start, end) added (merged with overlapping/adjacent ones).
+def add_interval(intervals, start, end):
+	merged = []
+	for interval_start, interval_end in intervals:
+		if interval_end < start or interval_start > end:
+			merged.append((interval_start, interval_end))
+		else:
+			start = min(start, interval_start)
+			end   = max(end, interval_end)
+	merged.append((start, end))
+	merged.sort()
+	return merged
+
+# ------------------------------------------------------------------
+# Run-Length Bitmap
+# ------------------------------------------------------------------
+# Boolean (num_rows x num_cols) bitmap stored as bands of consecutive
+# rows with the same set bits, each holding the (start, end) col
+# intervals of its set bits. A bitmap holding a few rectangles takes
+# memory proportional to the number of rectangles instead of its area.
+# Bits are only ever set (see fill() and fill_mask()), never cleared.
+class RunLengthBitmap():
+	def __init__(self, num_rows, num_cols):
+		self.shape     = (num_rows, num_cols)
+		self.band_rows = [0]  # first row of every band (sorted); a band ends where the next band starts
+		self.band_cols = [[]] # sorted, disjoint (start, end) col intervals of the set bits of every band
+
+	# Returns the index of the band starting at the row, splitting the
+	# band holding the row if needed.
+	def split_band(self, row):
+		band = bisect.bisect_right(self.band_rows, row) - 1
+		if self.band_rows[band] != row:
+			band += 1
+			self.band_rows.insert(band, row)
+			self.band_cols.insert(band, list(self.band_cols[band - 1]))
+		return band
+
+	# Sets the bits of rows [row_start, row_end) and cols [col_start,
+	# col_end), clipped to the bitmap.
+	def fill(self, row_start, row_end, col_start, col_end):
+		row_start = max(0, row_start)
+		row_end   = min(self.shape[0], row_end)
+		col_start = max(0, col_start)
+		col_end   = min(self.shape[1], col_end)
+		if row_start >= row_end or col_start >= col_end:
+			return
+		first_band = self.split_band(row_start)
+		end_band   = self.split_band(row_end) if row_end < self.shape[0] else len(self.band_rows)
+		for band in range(first_band, end_band):
+			self.band_cols[band] = add_interval(self.band_cols[band], col_start, col_end)
+
+	# Sets the bits set in a (dense) numpy mask, with the LL bit of the
+	# mask at (row_start, col_start). Consecutive mask rows with the same
+	# runs of set bits are filled as one band.
+	def fill_mask(self, row_start, col_start, mask):
+		padded          = numpy.zeros(shape=(mask.shape[0], mask.shape[1] + 2), dtype=numpy.int8)
+		padded[:, 1:-1] = mask
+		run_edges       = numpy.diff(padded, axis=1)
+		run_rows, run_starts = numpy.nonzero(run_edges == 1)
+		run_ends        = numpy.nonzero(run_edges == -1)[1]
+		row_runs        = [[] for row in range(mask.shape[0])]
+		for row, run_start, run_end in zip(run_rows.tolist(), run_starts.tolist(), run_ends.tolist()):
+			row_runs[row].append((run_start, run_end))
+		band_start = 0
+		for row in range(1, mask.shape[0] + 1):
+			if row == mask.shape[0] or row_runs[row] != row_runs[band_start]:
+				for run_start, run_end in row_runs[band_start]:
+					self.fill(row_start + band_start, row_start + row, col_start + run_start, col_start + run_end)
+				band_start = row
+
+	def any(self):
+		return any(self.band_cols)
+
+	# Returns the interval list of the cols with any bit set.
+	def get_col_occupancy(self):
+		return merge_intervals([interval for intervals in self.band_cols for interval in intervals])
+
+	# Returns the interval list of the rows with any bit set.
+	def get_row_occupancy(self):
+		band_ends = self.band_rows[1:] + [self.shape[0]]
+		return merge_intervals([(band_row, band_end) for band_row, band_end, intervals in zip(self.band_rows, band_ends, self.band_cols) if intervals])
+
+	# Returns the (dense) numpy bitmap.
+	def to_bitmap(self):
+		bitmap    = numpy.zeros(shape=self.shape, dtype=bool)
+		band_ends = self.band_rows[1:] + [self.shape[0]]
+		for band_row, band_end, intervals in zip(self.band_rows, band_ends, self.band_cols):
+			for col_start, col_end in intervals:
+				bitmap[band_row:band_end, col_start:col_end] = 1
+		return bitmap
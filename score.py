@@ -1,5 +1,6 @@
 # Import Custom Modules
 import debug_prints as dbg
+from geometry_export import *
 
 # Import Example Metric Modules
 from net_blockage     import *
@@ -50,9 +51,17 @@ def usage():
 	print "	--wire_rpt=<wire report>"
 	print "	[--nb_type=<0 or 1>]"
 	print "	[--nb_step=<nb step size>]"
+	print "	[--nb_resolution=<dbu|grid|pitch/n>]"
 	print "	[--num_processes=<number of processes>]"
 	print "	[--place_grid=<placement grid.npy>]"
 	print "	[--mod=<custom module name>]"
+	print "	[--flatten_cache=<max cached vertices>]"
+	print "	[--layer_filter]"
+	print "	[--geometry_cache=<cache directory>]"
+	print "	[--skip_fill_cells]"
+	print "	[--skip_cells=<cell name patterns>]"
+	print "	[--export_geometry=<export directory>]"
+	print "	[--stamp_cells]"
 	print 
 	print "Options:"
 	print "	-b, --blockage		Calculate critical net blockage metric."
@@ -63,7 +72,7 @@ def usage():
 	print "	-h, --help		Show this message."
 	print "	-m, --top_level_module	Top level module name."
 	print "	--nemo_dot		Nemo .dot file."
-	print "	--gds			GDSII input file."
+	print "	--gds			GDSII or OASIS input file (gzip/xz compressed files are decompressed on the fly; - for stdin)."
 	print "	--ms_lef		Metal Stack LEF input file."
 	print "	--sc_lef		STD Cell LEF input file."
 	print "	--def			DEF input file."
@@ -71,9 +80,17 @@ def usage():
 	print "	--wire_rpt		Wire statistics report input file."
 	print "	--nb_type		Type of net blockage calculation (0 for unconstrained; 1 for LEF constrained)."
 	print "	--nb_step		Step size for same layer net blockage calculation."
-	print "	--num_processes		Number of (parallel) processes to spawn."
+	print "	--nb_resolution		Raster resolution of the adjacent layer net blockage bitmaps: database units, LEF manufacturing grid, or 1/n of the layer pitch."
+	print "	--num_processes		Number of (parallel) processes to spawn (for GDSII flattening and net blockage analysis)."
 	print "	--place_grid		Placement output file (include .npy extension)."
 	print "	--mod			Running a custom ICAD module (module name without .py extension)."
+	print "	--flatten_cache		Max. number of polygon vertices held in the structure flattening cache (0 to disable)."
+	print "	--layer_filter		Only load GDSII layers needed for the net blockage metric (critical net layers and layers above/below); net blockage (-b) only."
+	print "	--geometry_cache		Directory to cache flattened geometry in (reused when inputs are unchanged)."
+	print "	--skip_fill_cells	Do not flatten instances of fill (SPACER) cells of the STD Cell LEF."
+	print "	--skip_cells		Do not flatten instances of cells matching the (comma separated) name patterns, e.g. *DECAP*,TAP*."
+	print "	--export_geometry	Directory to export the flattened geometry to (per-layer chunks of numpy .npz arrays)."
+	print "	--stamp_cells		Rasterize cells once (per orientation) and stamp them into the adjacent layer net blockage bitmaps."
 
 # Analyze blockage of security critical nets in GDSII
 def blockage_metric(layout):
@@ -124,7 +141,15 @@ def main(argv):
 	OUTPUT_PGRID  =  None
 	NB_STEP       = 1
 	NB_TYPE       = 1
+	NB_RESOLUTION = DEFAULT_NB_RESOLUTION
 	NUM_PROCESSES = 1
+	FLATTEN_CACHE = DEFAULT_FLATTEN_CACHE_SIZE
+	LAYER_FILTER  = False
+	GEOM_CACHE    = None
+	SKIP_FILL     = False
+	SKIP_CELLS    = None
+	EXPORT_DIR    = None
+	STAMP_CELLS   = False
 
 	# Load command line arguments
 	try:
@@ -145,9 +170,17 @@ def main(argv):
 			"wire_rpt=", \
 			"nb_step=", \
 			"nb_type=", \
+			"nb_resolution=", \
 			"num_processes=", \
 			"place_grid=", \
-			"mod="])
+			"mod=", \
+			"flatten_cache=", \
+			"layer_filter", \
+			"geometry_cache=", \
+			"skip_fill_cells", \
+			"skip_cells=", \
+			"export_geometry=", \
+			"stamp_cells"])
 	except getopt.GetoptError:
 		usage()
 		sys.exit(4)
@@ -208,14 +241,38 @@ def main(argv):
 			NB_STEP = copy.copy(int(arg))
 		elif opt == "--nb_type":
 			NB_TYPE = copy.copy(int(arg))
+		elif opt == "--nb_resolution":
+			if not is_raster_resolution(arg):
+				usage()
+				sys.exit(4)
+			NB_RESOLUTION = copy.copy(arg)
 		elif opt in "--num_processes":
 			NUM_PROCESSES = copy.copy(int(arg))
 		elif opt == "--mod":
 			MOD              = True
 			module_full_path = copy.copy(arg)
+		elif opt == "--flatten_cache":
+			FLATTEN_CACHE = copy.copy(int(arg))
+		elif opt == "--layer_filter":
+			LAYER_FILTER = True
+		elif opt == "--geometry_cache":
+			GEOM_CACHE = copy.copy(arg)
+		elif opt == "--skip_fill_cells":
+			SKIP_FILL = True
+		elif opt == "--skip_cells":
+			SKIP_CELLS = [pattern for pattern in arg.split(',') if pattern]
+		elif opt == "--export_geometry":
+			EXPORT_DIR = copy.copy(arg)
+		elif opt == "--stamp_cells":
+			STAMP_CELLS = True
 		else:
 			usage()
 			sys.exit(4) 
+
+	# The layer filter only keeps the layers needed for the net blockage metric
+	if LAYER_FILTER and (TRIGGER_SPACE or ROUTING_DISTANCE or MOD):
+		print "ERROR: --layer_filter can only be used with the net blockage metric (-b)."
+		sys.exit(4)
 	
 	# Start program timer
 	overall_start_time = time.time()
@@ -233,9 +290,16 @@ def main(argv):
 		OUTPUT_PGRID, \
 		NB_STEP, \
 		NB_TYPE, \
-		NUM_PROCESSES)
+		NUM_PROCESSES, \
+		FLATTEN_CACHE, \
+		LAYER_FILTER, \
+		GEOM_CACHE, \
+		SKIP_FILL, \
+		SKIP_CELLS, \
+		STAMP_CELLS, \
+		NB_RESOLUTION)
 
-	if DEBUG_PRINTS:
+	if DEBUG_PRINTS and layout.gdsii_lib != None:
 		dbg.debug_print_lib_obj(layout.gdsii_lib)
 		print "----------------------------------------------"
 		dbg.debug_print_gdsii_stats(layout.gdsii_lib)
@@ -243,6 +307,10 @@ def main(argv):
 		dbg.debug_print_gdsii_hierarchy(layout.gdsii_lib)
 		print "----------------------------------------------"
 
+	# Export flattened geometry
+	if EXPORT_DIR != None:
+		export_geometry(layout, EXPORT_DIR)
+
 	# Check if any critical signals found in GDSII
 	if not (layout.critical_nets):
 		print "WARNING: Could not locate any critical nets in GDSII."
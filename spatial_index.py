@@ -0,0 +1,85 @@
+# Import Custom Modules
+from polygon import *
+
+# Other Imports
+import math
+import numpy
+
+# Average number of polygons per bin targeted when
+# the bin size is not explicitly specified.
+DEFAULT_POLYS_PER_BIN = 16
+
+# Uniform grid (bin) spatial index over an array of polygon bounding
+# boxes (typically all polygons on a single GDSII layer, one row of
+# LL x, LL y, UR x, UR y per polygon). Each polygon is registered in
+# every bin its bounding box overlaps, so a range query only has to
+# test the polygons registered in the bins the query bounding box
+# overlaps, rather than every polygon on the layer.
+class SpatialIndex():
+	def __init__(self, bboxes, bin_size=None):
+		self.bboxes   = bboxes
+		self.bins     = {} # Key<(bin col, bin row)> --> Value<list of polygon indices>
+		self.origin   = None
+		self.bin_size = bin_size
+		self.max_col  = -1
+		self.max_row  = -1
+		if len(bboxes) > 0:
+			self.build()
+
+	def build(self):
+		# Compute extents of all polygons
+		ll_x = self.bboxes[:, 0].min()
+		ll_y = self.bboxes[:, 1].min()
+		ur_x = self.bboxes[:, 2].max()
+		ur_y = self.bboxes[:, 3].max()
+		self.origin = Point(ll_x, ll_y)
+
+		# Size bins so each holds a few polygons on average
+		if self.bin_size == None:
+			area_per_poly = (float(ur_x - ll_x + 1) * float(ur_y - ll_y + 1)) / float(len(self.bboxes))
+			self.bin_size = max(1.0, math.sqrt(area_per_poly * DEFAULT_POLYS_PER_BIN))
+		self.max_col, self.max_row = self.get_bin_range(ll_x, ll_y, ur_x, ur_y)[2:]
+
+		# Compute bin ranges of all polygons at once
+		bin_ranges = numpy.floor((self.bboxes - [ll_x, ll_y, ll_x, ll_y]) / self.bin_size).astype(numpy.int64)
+
+		# Register polygons in all bins their bounding box overlaps
+		for poly_index, (ll_col, ll_row, ur_col, ur_row) in enumerate(bin_ranges.tolist()):
+			for row in range(ll_row, ur_row + 1):
+				for col in range(ll_col, ur_col + 1):
+					if (col, row) in self.bins:
+						self.bins[(col, row)].append(poly_index)
+					else:
+						self.bins[(col, row)] = [poly_index]
+
+	# Returns the (LL col, LL row, UR col, UR row) indices
+	# of the bins overlapped by the bounding box coordinates.
+	def get_bin_range(self, ll_x, ll_y, ur_x, ur_y):
+		ll_col = int(math.floor(float(ll_x - self.origin.x) / self.bin_size))
+		ll_row = int(math.floor(float(ll_y - self.origin.y) / self.bin_size))
+		ur_col = int(math.floor(float(ur_x - self.origin.x) / self.bin_size))
+		ur_row = int(math.floor(float(ur_y - self.origin.y) / self.bin_size))
+		return ll_col, ll_row, ur_col, ur_row
+
+	# Returns a (sorted) list of the indices of all polygons whose
+	# bounding box overlaps the provided bounding box.
+	def query(self, bbox):
+		if not self.bins:
+			return []
+
+		# Collect candidate polygons from overlapped bins
+		# (clipped to the bins that hold any polygons)
+		candidates = set()
+		ll_col, ll_row, ur_col, ur_row = self.get_bin_range(bbox.ll.x, bbox.ll.y, bbox.ur.x, bbox.ur.y)
+		for row in range(max(ll_row, 0), min(ur_row, self.max_row) + 1):
+			for col in range(max(ll_col, 0), min(ur_col, self.max_col) + 1):
+				if (col, row) in self.bins:
+					candidates.update(self.bins[(col, row)])
+		if not candidates:
+			return []
+
+		# Check for actual bounding box overlap (all candidates at once)
+		poly_indices = numpy.array(sorted(candidates), dtype=numpy.int64)
+		bboxes       = self.bboxes[poly_indices]
+		overlaps     = (bboxes[:, 2] >= bbox.ll.x) & (bbox.ur.x >= bboxes[:, 0]) & (bboxes[:, 3] >= bbox.ll.y) & (bbox.ur.y >= bboxes[:, 1])
+		return poly_indices[overlaps].tolist()
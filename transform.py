@@ -0,0 +1,107 @@
+# Other Imports
+import math
+import numpy
+
+# GDSII STRANS Flag Bits
+STRANS_REFLECTION     = 0x8000 # reflection about the X axis (before rotation)
+STRANS_ABSOLUTE_MAG   = 0x0004 # magnification is absolute (not inherited)
+STRANS_ABSOLUTE_ANGLE = 0x0002 # rotation angle is absolute (not inherited)
+
+# Transforms are 2x3 affine matrices (numpy arrays):
+# [[a, b, tx],
+#  [c, d, ty]]
+# mapping point (x, y) to (a*x + b*y + tx, c*x + d*y + ty).
+IDENTITY_TRANSFORM = numpy.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+
+# Returns the (cosine, sine) of an angle (in degrees). Multiples
+# of 90 degrees are exact, so integer coordinates stay integers.
+def compute_cos_sin(degrees):
+	if degrees % 90 == 0:
+		return [(1, 0), (0, 1), (-1, 0), (0, -1)][int(degrees // 90) % 4]
+	radians = math.radians(degrees)
+	return math.cos(radians), math.sin(radians)
+
+# Computes the transform of a GDSII reference from its STRANS flags,
+# rotation angle (degrees, counterclockwise), magnification, and offset.
+# Like the GDSII spec., the reflection (about the X axis) is applied
+# FIRST, the magnification and rotation SECOND, and the offset LAST.
+def compute_transform(offset_x, offset_y, strans=None, degrees_rotation=None, magnification=None):
+	cos, sin = compute_cos_sin(degrees_rotation if degrees_rotation != None else 0)
+	if magnification != None:
+		cos *= magnification
+		sin *= magnification
+	if strans != None and (strans & STRANS_REFLECTION):
+		return numpy.array([[cos, sin, offset_x], [sin, -cos, offset_y]], dtype=numpy.float64)
+	return numpy.array([[cos, -sin, offset_x], [sin, cos, offset_y]], dtype=numpy.float64)
+
+# Computes the transform of a GDSII SRef or ARef element (for an
+# ARef, the transform of the array position at the first coordinate).
+def compute_element_transform(element):
+	return compute_transform(element.xy[0][0], element.xy[0][1], element.strans, element.angle, element.mag)
+
+def compute_translation_transform(offset_x, offset_y):
+	return numpy.array([[1.0, 0.0, offset_x], [0.0, 1.0, offset_y]])
+
+# Returns the transform that applies the inner transform FIRST,
+# and then the outer transform. An outer transform of None is the
+# identity, so transforms can be composed down a GDSII hierarchy.
+def compose_transforms(outer, inner):
+	if outer is None:
+		return inner
+	composed        = numpy.empty((2, 3))
+	composed[:, :2] = outer[:, :2].dot(inner[:, :2])
+	composed[:, 2]  = outer[:, :2].dot(inner[:, 2]) + outer[:, 2]
+	return composed
+
+def is_identity_transform(transform):
+	return transform is None or numpy.array_equal(transform, IDENTITY_TRANSFORM)
+
+# Returns True if all transform coefficients are integers, i.e.
+# integer coordinates are mapped to integer coordinates.
+def is_integral_transform(transform):
+	return bool(numpy.all(transform == numpy.floor(transform)))
+
+# Returns True if the transform mirrors the geometry. The vertices
+# of transformed polygons must then be reversed to keep them in CCW
+# order (necessary for the WA algorithm).
+def reverses_orientation(transform):
+	return ((transform[0, 0] * transform[1, 1]) - (transform[0, 1] * transform[1, 0])) < 0
+
+# Returns True if the transform maps axis-aligned bounding boxes
+# exactly onto axis-aligned bounding boxes, i.e. it only rotates by
+# multiples of 90 degrees.
+def is_axis_aligned_transform(transform):
+	return (transform[0, 1] == 0 and transform[1, 0] == 0) or (transform[0, 0] == 0 and transform[1, 1] == 0)
+
+# Applies a transform to a (num vertices x 2) array of coordinates.
+# Returns a new array.
+def transform_coords(transform, coords):
+	return coords.dot(transform[:, :2].T) + transform[:, 2]
+
+# Returns the (X, Y) "coordinate is a float" flags of transformed
+# coordinates, given the flags of the original coordinates (booleans
+# or boolean arrays). Integer coordinates stay integers only if the
+# transform is integral; a transformed coordinate is a float if any
+# original coordinate it depends on is a float.
+def transform_float_flags(transform, x_is_float, y_is_float):
+	if not is_integral_transform(transform):
+		return True, True
+	new_x_is_float = ((transform[0, 0] != 0) & x_is_float) | ((transform[0, 1] != 0) & y_is_float)
+	new_y_is_float = ((transform[1, 0] != 0) & x_is_float) | ((transform[1, 1] != 0) & y_is_float)
+	return new_x_is_float, new_y_is_float
+
+# Applies a transform (None for the identity) to a (num bboxes x 4)
+# array of LL x, LL y, UR x, UR y bounding boxes. Returns the bounding
+# boxes of the transformed bounding boxes, which are exact only for
+# axis-aligned transforms (and larger for other rotations).
+def transform_bboxes(transform, bboxes):
+	if transform is None:
+		return bboxes
+	corners = numpy.stack((bboxes[:, [0, 1]], bboxes[:, [2, 1]], bboxes[:, [2, 3]], bboxes[:, [0, 3]]), axis=1)
+	corners = transform_coords(transform, corners.reshape((-1, 2))).reshape((-1, 4, 2))
+	return numpy.column_stack((corners.min(axis=1), corners.max(axis=1)))
+
+# Returns a boolean array marking the (num bboxes x 4) bounding boxes
+# that overlap (or touch) a (LL x, LL y, UR x, UR y) bounding box.
+def bboxes_overlap(bboxes, bbox):
+	return (bboxes[:, 2] >= bbox[0]) & (bbox[2] >= bboxes[:, 0]) & (bboxes[:, 3] >= bbox[1]) & (bbox[3] >= bboxes[:, 1])
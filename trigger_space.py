@@ -11,7 +11,6 @@ from layout  import *
 import numpy
 import pprint
 import time
-import copy
 import sys
 import os
 import inspect
@@ -50,13 +49,13 @@ def find_4_connected_regions(device_layer_bitmap):
 		points_to_explore = set()
 		
 		# Add start point to unexplored set
-		points_to_explore.add(copy.copy(start_point))
+		points_to_explore.add(start_point)
 
 		while points_to_explore:
 			current_point = points_to_explore.pop()
 			
 			# add point to connected points
-			connected_points.add(copy.copy(current_point))
+			connected_points.add(current_point)
 			num_open_sites += 1
 
 			# mark point as colored
@@ -66,25 +65,25 @@ def find_4_connected_regions(device_layer_bitmap):
 			if bitmap_bbox.are_coords_inside_bbox(current_point.x, current_point.y + 1) and device_layer_bitmap[current_point.y + 1, current_point.x] == 0:
 				new_point = Point(current_point.x, current_point.y + 1)
 				if new_point not in connected_points:
-					points_to_explore.add(copy.copy(new_point))
+					points_to_explore.add(new_point)
 
 			# Check East
 			if bitmap_bbox.are_coords_inside_bbox(current_point.x + 1, current_point.y) and device_layer_bitmap[current_point.y, current_point.x + 1] == 0:
 				new_point = Point(current_point.x + 1, current_point.y)
 				if new_point not in connected_points:
-					points_to_explore.add(copy.copy(new_point))
+					points_to_explore.add(new_point)
 
 			# Check South
 			if bitmap_bbox.are_coords_inside_bbox(current_point.x, current_point.y - 1) and device_layer_bitmap[current_point.y - 1, current_point.x] == 0:
 				new_point = Point(current_point.x, current_point.y - 1)
 				if new_point not in connected_points:
-					points_to_explore.add(copy.copy(new_point))
+					points_to_explore.add(new_point)
 
 			# Check West
 			if bitmap_bbox.are_coords_inside_bbox(current_point.x - 1, current_point.y) and device_layer_bitmap[current_point.y, current_point.x - 1] == 0:
 				new_point = Point(current_point.x - 1, current_point.y)
 				if new_point not in connected_points:
-					points_to_explore.add(copy.copy(new_point))
+					points_to_explore.add(new_point)
 
 		# Update trigger space histogram
 		if len(connected_points) not in trigger_spaces:
@@ -102,7 +101,7 @@ def find_4_connected_regions(device_layer_bitmap):
 
 def analyze_open_space_for_triggers(layout, print_to_stdio=False, print_histogram=False):
 	# Find open placement sites in the placement grid
-	num_open_sites, trigger_spaces = find_4_connected_regions(copy.deepcopy(layout.def_info.placement_grid))
+	num_open_sites, trigger_spaces = find_4_connected_regions(numpy.copy(layout.def_info.placement_grid))
 
 	# Get width of terminal for printing of the histogram
 	if print_to_stdio: